@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import exists, func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.database import SessionLocal
+from backend.app.metrics import Counter
+from backend.app.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, RollupWatermark
+from backend.app.rollups import CARD_SALES_DAILY, SALES_DAILY
+from backend.app.snapshot import invalidate_catalog
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ORDER_ARCHIVE_ENABLED = os.getenv("ORDER_ARCHIVE_ENABLED", "1") == "1"
+# Orders placed longer ago than this move to the archive tables
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", "365"))
+# Orders moved per transaction, and the pause between two transactions, so the hot tables are never locked for long
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", "500"))
+ORDER_ARCHIVE_PAUSE_SECONDS = float(os.getenv("ORDER_ARCHIVE_PAUSE_SECONDS", "0.1"))
+ORDER_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ORDER_ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+archived_rows = Counter("archived_rows", "Rows moved from the hot order tables to the archive.", ("table",))
+
+
+def _months(first: datetime, last: datetime):
+    month = date(first.year, first.month, 1)
+    while month <= last.date():
+        following = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month, following
+        month = following
+
+
+def _create_partitions(db: Session, first: datetime, last: datetime):
+    """
+    Creates the monthly partitions of both archive tables covering first..last, on PostgreSQL.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for table in (ArchivedOrder.__tablename__, ArchivedOrderItem.__tablename__):
+        for month, following in _months(first, last):
+            db.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y_%m} PARTITION OF {table} "
+                            f"FOR VALUES FROM ('{month}') TO ('{following}')"))
+
+
+def _rollup_watermark(db: Session, name: str) -> int:
+    return db.query(RollupWatermark.last_id).filter(RollupWatermark.name == name).scalar() or 0
+
+
+def archive_batch(db: Session, horizon: datetime, batch_size: int = ORDER_ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Moves the oldest orders placed before the horizon, with their items, to the archive tables in one
+    transaction: copied with INSERT ... SELECT, then deleted from the hot tables.
+
+    Only orders the sales rollups have folded in, items included, are moved: the rollups read the hot tables
+    incrementally and would miss the others.
+
+    :param db: Database session; committed here.
+    :param horizon: Orders placed before this time are archived.
+    :param batch_size: Maximum number of orders moved.
+    :return: Number of orders moved.
+    """
+    order_watermark = _rollup_watermark(db, SALES_DAILY)
+    item_watermark = _rollup_watermark(db, CARD_SALES_DAILY)
+    unfolded_items = exists().where(OrderItem.order_id == Order.id, OrderItem.id > item_watermark)
+    query = (db.query(Order.id, Order.created_at)
+             .filter(Order.created_at < horizon, Order.id <= order_watermark, ~unfolded_items)
+             .order_by(Order.created_at, Order.id).limit(batch_size))
+    if db.get_bind().dialect.name == "postgresql":
+        # Workers archiving at the same time take different orders instead of waiting for each other
+        query = query.with_for_update(skip_locked=True, of=Order)
+    rows = query.all()
+    if not rows:
+        db.rollback()
+        return 0
+    order_ids = [order_id for order_id, _ in rows]
+
+    item_created_at = func.coalesce(OrderItem.created_at, Order.created_at)
+    items = (select(OrderItem.id, item_created_at, OrderItem.order_id, OrderItem.card_id, OrderItem.quantity,
+                    OrderItem.price)
+             .join(Order, Order.id == OrderItem.order_id).where(OrderItem.order_id.in_(order_ids)))
+    first, last = db.query(func.min(item_created_at), func.max(item_created_at)).select_from(OrderItem).join(
+        Order, Order.id == OrderItem.order_id).filter(OrderItem.order_id.in_(order_ids)).one()
+    card_ids = [row.card_id for row in db.query(OrderItem.card_id).filter(
+        OrderItem.order_id.in_(order_ids), OrderItem.card_id.isnot(None)).distinct()]
+    _create_partitions(db, min(rows[0][1], first or rows[0][1]), max(rows[-1][1], last or rows[-1][1]))
+
+    try:
+        db.execute(insert(ArchivedOrder).from_select(
+            ["id", "created_at", "user_id", "total_price"],
+            select(Order.id, Order.created_at, Order.user_id, Order.total_price).where(Order.id.in_(order_ids))))
+        moved_items = db.execute(insert(ArchivedOrderItem).from_select(
+            ["id", "created_at", "order_id", "card_id", "quantity", "price"], items)).rowcount
+        db.query(OrderItem).filter(OrderItem.order_id.in_(order_ids)).delete(synchronize_session=False)
+        db.query(Order).filter(Order.id.in_(order_ids)).delete(synchronize_session=False)
+        db.commit()
+    except IntegrityError:
+        # Another worker archived some of these orders first
+        db.rollback()
+        return 0
+    archived_rows.inc(len(order_ids), table="orders")
+    archived_rows.inc(moved_items, table="order_items")
+    # The cards' order_items only list the hot items
+    if card_ids:
+        invalidate_catalog(*card_ids)
+    return len(order_ids)
+
+
+def archive_orders(db: Session, horizon: Optional[datetime] = None, batch_size: int = ORDER_ARCHIVE_BATCH_SIZE,
+                   pause: float = ORDER_ARCHIVE_PAUSE_SECONDS) -> int:
+    """
+    Moves every order placed before the horizon to the archive tables, batch by batch.
+
+    :param db: Database session used for the moves.
+    :param horizon: Orders placed before this time are archived; ORDER_ARCHIVE_AFTER_DAYS ago by default.
+    :param batch_size: Maximum number of orders moved per transaction.
+    :param pause: Seconds slept between two transactions, leaving the tables to the requests.
+    :return: Number of orders moved.
+    """
+    horizon = horizon or datetime.utcnow() - timedelta(days=ORDER_ARCHIVE_AFTER_DAYS)
+    moved = 0
+    while True:
+        count = archive_batch(db, horizon, batch_size)
+        moved += count
+        if count < batch_size:
+            return moved
+        time.sleep(pause)
+
+
+def archive_orders_in_new_session() -> int:
+    """
+    :return: The result of archive_orders, run in a session of its own.
+    """
+    db = SessionLocal()
+    try:
+        return archive_orders(db)
+    finally:
+        db.close()
+
+
+async def archive_loop(interval: float = ORDER_ARCHIVE_INTERVAL_SECONDS):
+    """
+    Archives the orders past the horizon every ``interval`` seconds until cancelled.
+
+    :param interval: Seconds between two runs.
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            moved = await run_in_threadpool(archive_orders_in_new_session)
+            if moved:
+                logger.info("Archived %d orders", moved)
+        except Exception:
+            logger.exception("Order archival failed")
+
+
+if __name__ == "__main__":
+    # Archival job: python -m backend.app.archive [days]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ORDER_ARCHIVE_AFTER_DAYS
+    session = SessionLocal()
+    try:
+        logger.info("Archived %d orders", archive_orders(session, datetime.utcnow() - timedelta(days=days)))
+    finally:
+        session.close()
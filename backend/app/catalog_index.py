@@ -0,0 +1,487 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+
+from backend.app.metrics import Counter
+from backend.app.models import Card
+from backend.app.snapshot import catalog_version
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CATALOG_INDEX_ENABLED = os.getenv("CATALOG_INDEX_ENABLED", "1") == "1"
+# Writes made by other workers (or outside crud) reach the index when it is reloaded after this long
+CATALOG_INDEX_MAX_AGE = float(os.getenv("CATALOG_INDEX_MAX_AGE", "300"))
+# Without the catalog snapshot's shared version, the card count and highest id are compared with the database at
+# most this often, so cards created or deleted by other workers are noticed before the index gets that old
+CATALOG_INDEX_PROBE_SECONDS = float(os.getenv("CATALOG_INDEX_PROBE_SECONDS", "1"))
+_SCAN_CHUNK = 1024
+# Past this many entries of a sort order scanned, a selective filter is answered with one pass over the columns
+_SCAN_LIMIT = 32768
+
+# sort name -> (column, sign): every order is ascending on column * sign, ties broken by ascending id.
+# Missing values (NaN) sort last in every order.
+SORTS = {
+    "id": ("ids", 1),
+    "price": ("price", 1),
+    "-price": ("price", -1),
+    "quantity": ("quantity", 1),
+    "-quantity": ("quantity", -1),
+    "recent": ("created", -1),
+    "rating": ("rating", -1),
+}
+
+catalog_index_queries = Counter("catalog_index_queries", "Catalog listings, by whether the index answered.",
+                                ("result",))
+
+
+def _epoch(value: Optional[datetime]) -> float:
+    return value.timestamp() if value is not None else float("nan")
+
+
+class _Order:
+    """
+    Slots of the live cards in one sort order, with their sort keys alongside for binary searches.
+    """
+
+    def __init__(self, slots, keys):
+        self.slots = slots
+        self.keys = keys
+
+
+class CatalogIndex:
+    """
+    Columnar in-process copy of the card columns listings filter and sort on: NumPy arrays of id, price,
+    quantity, listing time and rating, plus interned lowercase names as integer codes. Each sort order is
+    kept as a presorted permutation, so a page is read by walking the permutation from the start and
+    masking it chunk by chunk, instead of filtering and sorting the whole table per request; a range filter
+    on the sort column is narrowed with a binary search first. Filters matching too few cards for the walk
+    to end early are answered with one vectorized mask over the columns and an argpartition of the matches.
+    The card CRUD functions keep it current, an update moving one entry in each order.
+
+    Writes of other workers are noticed through the shared catalog version when the catalog snapshot is
+    enabled, and otherwise by probing the card count and highest id every CATALOG_INDEX_PROBE_SECONDS; the
+    probe misses updates, which reach the index once it is older than CATALOG_INDEX_MAX_AGE. Until it is
+    loaded, once it is stale, or for a session bound to another database, listings are served from the
+    database while it (re)loads in the background.
+    """
+
+    def __init__(self, max_age: float = CATALOG_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loading = False
+        self._bind = None
+        self._loaded_at = 0.0
+        self._loaded_version = (0, 0)
+        self._probed_at = 0.0
+        self._max_id = 0
+        self._columns: Dict[str, object] = {}
+        self._size = 0
+        self._slot_of: Dict[int, int] = {}
+        self._name_codes: Dict[str, int] = {}
+        self._orders: Dict[str, _Order] = {}
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    # --------------------- Loading --------------------- #
+
+    def is_current(self, db: Session) -> bool:
+        if (self._bind is None or self._bind is not db.get_bind()
+                or time.monotonic() - self._loaded_at >= self.max_age):
+            return False
+        local, shared = catalog_version()
+        if shared:
+            # Every write of this worker bumps both counters and is applied here by the CRUD functions;
+            # the shared counter moving further means another worker wrote since the load
+            loaded_local, loaded_shared = self._loaded_version
+            return shared - loaded_shared <= local - loaded_local
+        return self._probe(db)
+
+    def _probe(self, db: Session) -> bool:
+        now = time.monotonic()
+        if now - self._probed_at < CATALOG_INDEX_PROBE_SECONDS:
+            return True
+        self._probed_at = now
+        count, max_id = db.query(func.count(Card.id), func.max(Card.id)).one()
+        return count == len(self) and (max_id or 0) <= self._max_id
+
+    def _schedule_load(self, db: Session):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        bind = db.get_bind()
+        threading.Thread(target=self._load_in_background, args=(bind,), name="catalog-index", daemon=True).start()
+
+    def _load_in_background(self, bind):
+        session = sessionmaker(bind=bind)()
+        try:
+            self.load(session)
+        except Exception:
+            logger.exception("Loading the catalog index failed")
+        finally:
+            session.close()
+            self._loading = False
+
+    def load(self, db: Session):
+        """
+        Replaces the content of the index with the cards of the database.
+
+        :param db: Database session.
+        :return: None
+        """
+        started = time.monotonic()
+        # Read first: a write committed while the cards are read makes the next check fail and reload again
+        version = catalog_version()
+        rows = (db.query(Card.id, Card.name, Card.price, Card.quantity, Card.created_at, Card.rating_avg)
+                .order_by(Card.id).yield_per(10000))
+        ids, names, prices, quantities, created, ratings = [], [], [], [], [], []
+        for card_id, name, price, quantity, created_at, rating_avg in rows:
+            ids.append(card_id)
+            names.append(name)
+            prices.append(price)
+            quantities.append(quantity)
+            created.append(_epoch(created_at))
+            ratings.append(rating_avg)
+        self.load_columns(ids, names, prices, quantities, created, ratings)
+        self._bind = db.get_bind()
+        self._loaded_version = version
+        self._loaded_at = self._probed_at = time.monotonic()
+        logger.info("Loaded %d cards into the catalog index in %.2fs", len(ids), self._loaded_at - started)
+
+    def load_columns(self, ids, names, prices, quantities, created, ratings):
+        """
+        Replaces the content of the index with the given columns; None values are stored as missing.
+
+        :return: None
+        """
+        import numpy as np
+
+        name_codes: Dict[str, int] = {}
+        codes = np.fromiter((name_codes.setdefault((name or "").lower(), len(name_codes)) for name in names),
+                            dtype=np.int32, count=len(names))
+        columns = {
+            "ids": np.asarray(ids, dtype=np.int64),
+            "price": np.asarray(prices, dtype=np.float64),
+            "quantity": np.asarray([np.nan if value is None else value for value in quantities], dtype=np.float64),
+            "created": np.asarray(created, dtype=np.float64),
+            "rating": np.asarray(ratings, dtype=np.float64),
+            "name": codes,
+            "live": np.ones(len(ids), dtype=bool),
+        }
+        orders = {}
+        for sort, (column, sign) in SORTS.items():
+            keys = self._keys(columns[column], sign)
+            slots = np.lexsort((columns["ids"], keys))
+            orders[sort] = _Order(slots, keys[slots])
+        with self._lock:
+            self._columns = columns
+            self._size = len(ids)
+            self._slot_of = {int(card_id): slot for slot, card_id in enumerate(ids)}
+            self._name_codes = name_codes
+            self._orders = orders
+            self._max_id = int(columns["ids"].max()) if len(ids) else 0
+
+    @staticmethod
+    def _keys(values, sign: int):
+        import numpy as np
+        keys = values * sign
+        # Missing values sort last in both directions
+        return np.where(np.isnan(keys), np.inf, keys) if keys.dtype.kind == "f" else keys
+
+    # --------------------- Updates --------------------- #
+
+    def _key(self, sort: str, slot: int):
+        column, sign = SORTS[sort]
+        return self._keys(self._columns[column][slot:slot + 1], sign)[0]
+
+    def _position(self, sort: str, slot: int, key) -> int:
+        import numpy as np
+        order = self._orders[sort]
+        low, high = np.searchsorted(order.keys, key, "left"), np.searchsorted(order.keys, key, "right")
+        return int(low + np.flatnonzero(order.slots[low:high] == slot)[0])
+
+    def _insertion_point(self, sort: str, slot: int, key) -> int:
+        import numpy as np
+        order = self._orders[sort]
+        low, high = np.searchsorted(order.keys, key, "left"), np.searchsorted(order.keys, key, "right")
+        # Among equal keys the ids ascend
+        ids = self._columns["ids"]
+        return int(low + np.searchsorted(ids[order.slots[low:high]], ids[slot]))
+
+    def _move(self, sort: str, slot: int, old_key):
+        """
+        Moves a slot whose key changed to its new place in a sort order, shifting only the entries in between.
+        """
+        order = self._orders[sort]
+        key = self._key(sort, slot)
+        if key == old_key:
+            return
+        old = self._position(sort, slot, old_key)
+        new = self._insertion_point(sort, slot, key)
+        if new > old:
+            new -= 1
+            order.slots[old:new] = order.slots[old + 1:new + 1]
+            order.keys[old:new] = order.keys[old + 1:new + 1]
+        else:
+            order.slots[new + 1:old + 1] = order.slots[new:old]
+            order.keys[new + 1:old + 1] = order.keys[new:old]
+        order.slots[new] = slot
+        order.keys[new] = key
+
+    def _insert(self, sort: str, slot: int):
+        import numpy as np
+        order = self._orders[sort]
+        key = self._key(sort, slot)
+        position = self._insertion_point(sort, slot, key)
+        order.slots = np.insert(order.slots, position, slot)
+        order.keys = np.insert(order.keys, position, key)
+
+    def _delete(self, sort: str, slot: int):
+        import numpy as np
+        order = self._orders[sort]
+        position = self._position(sort, slot, self._key(sort, slot))
+        order.slots = np.delete(order.slots, position)
+        order.keys = np.delete(order.keys, position)
+
+    def _grow(self):
+        import numpy as np
+        capacity = len(self._columns["ids"])
+        if self._size < capacity:
+            return
+        for name, column in self._columns.items():
+            grown = np.empty(max(2 * capacity, 1024), dtype=column.dtype)
+            grown[:capacity] = column
+            self._columns[name] = grown
+
+    def upsert(self, db: Session, card: Card):
+        """
+        Adds a card created, or moves a card updated, through a session of the database the index holds.
+
+        :param db: The session the card was committed with.
+        :param card: The card as committed.
+        :return: None
+        """
+        if not self._orders or self._bind is not db.get_bind():
+            return
+        values = {
+            "price": float("nan") if card.price is None else card.price,
+            "quantity": float("nan") if card.quantity is None else card.quantity,
+            "created": _epoch(card.created_at),
+            "rating": float("nan") if card.rating_avg is None else card.rating_avg,
+        }
+        with self._lock:
+            slot = self._slot_of.get(card.id)
+            created = slot is None
+            if created:
+                self._grow()
+                slot = self._size
+                self._size += 1
+                self._slot_of[card.id] = slot
+                self._max_id = max(self._max_id, card.id)
+                self._columns["ids"][slot] = card.id
+                self._columns["live"][slot] = True
+            else:
+                old_keys = {sort: self._key(sort, slot) for sort in SORTS}
+            for column, value in values.items():
+                self._columns[column][slot] = value
+            name = (card.name or "").lower()
+            self._columns["name"][slot] = self._name_codes.setdefault(name, len(self._name_codes))
+            for sort in SORTS:
+                if created:
+                    self._insert(sort, slot)
+                else:
+                    self._move(sort, slot, old_keys[sort])
+
+    def remove(self, db: Session, card_id: int):
+        """
+        :param db: The session the card was deleted with.
+        :param card_id: ID of the deleted card.
+        :return: None
+        """
+        if not self._orders or self._bind is not db.get_bind():
+            return
+        with self._lock:
+            slot = self._slot_of.pop(card_id, None)
+            if slot is not None:
+                self._columns["live"][slot] = False
+                for sort in SORTS:
+                    self._delete(sort, slot)
+
+    def refresh(self, db: Session, card_ids: Iterable[int]):
+        """
+        Re-reads cards whose indexed columns were changed by a bulk UPDATE, e.g. their rating aggregates.
+
+        :param db: The session the change was committed with.
+        :param card_ids: IDs of the changed cards.
+        :return: None
+        """
+        if not self._orders or self._bind is not db.get_bind():
+            return
+        card_ids = list(card_ids)
+        cards = {card.id: card for card in db.query(Card).filter(Card.id.in_(card_ids))}
+        for card_id in card_ids:
+            if card_id in cards:
+                self.upsert(db, cards[card_id])
+            else:
+                self.remove(db, card_id)
+
+    # --------------------- Queries --------------------- #
+
+    def query(self, skip: int = 0, limit: int = 10, sort: Optional[str] = None,
+              min_price: Optional[float] = None, max_price: Optional[float] = None,
+              min_quantity: Optional[int] = None, min_rating: Optional[float] = None,
+              name: Optional[str] = None) -> List[int]:
+        """
+        :return: The ids of the cards on the requested page, in order; the filters are inclusive bounds and a
+            case-insensitive exact name.
+        """
+        import numpy as np
+
+        if limit <= 0:
+            return []
+        with self._lock:
+            columns = self._columns
+            order = self._orders[sort or "id"]
+            filters = [(column, low, high) for column, low, high in (
+                ("price", min_price, max_price), ("quantity", min_quantity, None), ("rating", min_rating, None))
+                if low is not None or high is not None]
+            if name is not None:
+                code = self._name_codes.get(name.lower())
+                if code is None:
+                    return []
+                filters.append(("name", code, code))
+
+            # A range on the sort column bounds the part of the order worth scanning
+            start, stop = 0, len(order.slots)
+            sort_column, sign = SORTS[sort or "id"]
+            for column, low, high in filters:
+                if column == sort_column:
+                    key_low, key_high = (low, high) if sign > 0 else (
+                        None if high is None else -high, None if low is None else -low)
+                    if key_low is not None:
+                        start = max(start, int(np.searchsorted(order.keys, key_low, "left")))
+                    if key_high is not None:
+                        stop = min(stop, int(np.searchsorted(order.keys, key_high, "right")))
+
+            wanted = skip + limit
+            found = []
+            count = scanned = 0
+            chunk = _SCAN_CHUNK
+            while start < stop and count < wanted:
+                if scanned >= _SCAN_LIMIT:
+                    return self._select(filters, sort_column, sign, skip, wanted)
+                slots = order.slots[start:start + chunk]
+                start += chunk
+                scanned += chunk
+                chunk *= 2
+                mask = self._mask(filters, slots)
+                if mask is not None:
+                    slots = slots[mask]
+                found.append(slots)
+                count += len(slots)
+            if not found:
+                return []
+            page = np.concatenate(found)[skip:wanted]
+            return columns["ids"][page].tolist()
+
+    def _mask(self, filters, slots=None):
+        mask = None
+        for column, low, high in filters:
+            values = self._columns[column][:self._size] if slots is None else self._columns[column][slots]
+            if low is not None:
+                mask = values >= low if mask is None else mask & (values >= low)
+            if high is not None:
+                mask = values <= high if mask is None else mask & (values <= high)
+        return mask
+
+    def _select(self, filters, sort_column: str, sign: int, skip: int, wanted: int) -> List[int]:
+        """
+        Answers a query whose filters match few cards: masks every column at once, then orders only the first
+        `wanted` matches, found with argpartition.
+        """
+        import numpy as np
+
+        columns = self._columns
+        mask = self._mask(filters)
+        live = columns["live"][:self._size]
+        slots = np.flatnonzero(live if mask is None else mask & live)
+        keys = self._keys(columns[sort_column][slots], sign)
+        if len(slots) > wanted:
+            # Keep every match up to the wanted-th key, ties included, so the id tie break stays exact
+            threshold = keys[np.argpartition(keys, wanted - 1)[wanted - 1]]
+            kept = keys <= threshold
+            slots, keys = slots[kept], keys[kept]
+        ids = columns["ids"][slots]
+        return ids[np.lexsort((ids, keys))][skip:wanted].tolist()
+
+
+catalog_index = CatalogIndex()
+
+
+def query_cards(db: Session, **query) -> Optional[List[int]]:
+    """
+    :param db: The session of the request.
+    :param query: Arguments of CatalogIndex.query.
+    :return: The ids of the page, or None when the index is not current for the session's database (it is then
+        loaded in the background and the caller queries the database).
+    """
+    if not CATALOG_INDEX_ENABLED:
+        return None
+    if not catalog_index.is_current(db):
+        catalog_index_queries.inc(result="fallback")
+        catalog_index._schedule_load(db)
+        return None
+    catalog_index_queries.inc(result="index")
+    return catalog_index.query(**query)
+
+
+if __name__ == "__main__":
+    # Listing query benchmark: python -m backend.app.catalog_index [cards]
+    import sys
+
+    import numpy as np
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(0)
+    ratings = rng.uniform(1, 5, count)
+    ratings[rng.random(count) < 0.3] = np.nan
+    started = time.perf_counter()
+    catalog_index.load_columns(np.arange(1, count + 1), [f"Card {n % 5000}" for n in range(count)],
+                               rng.uniform(0.5, 500, count).round(2), rng.integers(0, 20, count),
+                               1.6e9 + rng.uniform(0, 1e8, count), ratings)
+    print(f"load: {time.perf_counter() - started:.2f}s for {count} cards")
+
+    queries = {
+        "default page": dict(),
+        "price ascending": dict(sort="price"),
+        "price band, cheapest first": dict(sort="price", min_price=20, max_price=40),
+        "in stock, newest first": dict(sort="recent", min_quantity=1),
+        "rated 4+, best first, page 50": dict(sort="rating", min_rating=4, skip=500),
+        "name, most expensive first": dict(sort="-price", name="card 42"),
+        "in stock under 5": dict(sort="-quantity", max_price=5, min_quantity=1),
+    }
+    for label, query in queries.items():
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            catalog_index.query(**query)
+            timings.append(time.perf_counter() - started)
+        print(f"{label:>30}: {sorted(timings)[len(timings) // 2] * 1e6:8.1f} us median")
+
+    catalog_index._bind = object()
+    session = type("Session", (), {"get_bind": lambda self: catalog_index._bind})()
+    started = time.perf_counter()
+    for price in range(20):
+        card = Card(id=count // 2, name="Card 7", price=float(price), quantity=3, created_at=None, rating_avg=4.5)
+        catalog_index.upsert(session, card)
+    print(f"{'update one card':>30}: {(time.perf_counter() - started) / 20 * 1e6:8.1f} us")
@@ -0,0 +1,67 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# The request a new worker must serve before it counts as up
+FIRST_REQUEST_PATH = "/store/cards/?limit=1"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_seconds() -> float:
+    """
+    :return: Time a fresh interpreter takes to import backend.app.main, in seconds.
+    """
+    code = "import time; started = time.perf_counter(); import backend.app.main; print(time.perf_counter() - started)"
+    return float(subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout)
+
+
+def first_request_seconds(timeout: float = 60.0) -> float:
+    """
+    Starts a uvicorn worker and polls it until it serves FIRST_REQUEST_PATH.
+
+    :param timeout: Seconds after which the worker is given up on.
+    :return: Time from spawning the worker to its first successful response, in seconds.
+    """
+    port = _free_port()
+    started = time.perf_counter()
+    worker = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.app.main:app", "--port", str(port),
+                               "--log-level", "warning"], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while time.perf_counter() - started < timeout:
+            if worker.poll() is not None:
+                raise RuntimeError(f"Worker exited during startup:\n{worker.stderr.read().decode()}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{FIRST_REQUEST_PATH}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise TimeoutError(f"Worker did not serve a request within {timeout}s")
+    finally:
+        worker.terminate()
+        worker.wait()
+
+
+if __name__ == "__main__":
+    # Cold start benchmark: python -m backend.app.coldstart [runs]
+    # The database must be migrated first (python -m backend.app.migrations), as in production.
+    from backend.app.migrations import check_schema
+
+    check_schema()
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    os.environ.setdefault("JOB_WORKER_ENABLED", "0")
+    imports = [import_seconds() for _ in range(runs)]
+    first_requests = [first_request_seconds() for _ in range(runs)]
+    print(f"      import backend.app.main: {statistics.median(imports) * 1000:7.1f} ms median of {runs}")
+    print(f"spawn to first served request: {statistics.median(first_requests) * 1000:7.1f} ms median of {runs}"
+          f" (best {min(first_requests) * 1000:.1f} ms)")
@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+from backend.app.metrics import Counter
+from backend.app.snapshot import catalog_version
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+load_dotenv()
+
+# Smaller responses are sent as is: compressing them saves a few bytes for a lot of CPU
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Compressed catalog pages kept in memory, across all pages, encodings and catalog versions
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "512"))
+# Only payloads up to this size are memoized
+COMPRESSION_CACHE_MAX_BYTES = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+# Writes this worker does not see (other hosts, or other workers without the catalog snapshot) show up after this long
+COMPRESSION_CACHE_TTL = float(os.getenv("COMPRESSION_CACHE_TTL", "5"))
+
+# Content types that are already compressed or must not be buffered
+_SKIPPED_TYPES = (b"image/", b"video/", b"audio/", b"application/zip", b"application/gzip", b"text/event-stream")
+
+compressed_responses = Counter("compressed_responses", "Responses sent compressed.", ("encoding",))
+compression_cache = Counter("compression_cache", "Lookups of memoized compressed catalog pages.", ("result",))
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    :param accept_encoding: The Accept-Encoding header of the request.
+    :return: "br" or "gzip", whichever is accepted and available (brotli first), None to send the response as is.
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+    for coding in ("br", "gzip"):
+        if coding == "br" and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+class _Compressor:
+    """
+    Incremental gzip or brotli stream; every chunk is flushed so streamed responses reach the client as they go.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._stream = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._stream.process(data) + self._stream.flush()
+        return self._stream.compress(data) + self._stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._stream.finish()
+        return self._stream.flush(zlib.Z_FINISH)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    :return: The whole body compressed in one go.
+    """
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return zlib.compress(data, GZIP_LEVEL, 16 + zlib.MAX_WBITS)
+
+
+class CompressedCache:
+    """
+    LRU of compressed catalog pages, with their response headers, keyed by (page, encoding, catalog version).
+    The middleware looks a page up before the route runs, so a hit skips rendering and compressing it; the
+    catalog version changes with every write to a card, its ratings or its order items (invalidate_catalog).
+    """
+
+    def __init__(self, size: int = COMPRESSION_CACHE_SIZE, ttl: float = COMPRESSION_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[list, bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, page: str, encoding: str, version) -> Optional[Tuple[list, bytes]]:
+        """
+        :param page: Accept and Origin headers, path and query string of the page.
+        :param encoding: "br" or "gzip".
+        :param version: The current catalog version.
+        :return: (headers, compressed body) of the page, None if it is not cached.
+        """
+        key = (page, encoding, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                compression_cache.inc(result="hit")
+                return entry[0], entry[1]
+        compression_cache.inc(result="miss")
+        return None
+
+    def put(self, page: str, encoding: str, version, headers: list, body: bytes):
+        """
+        :param version: The catalog version read before the page was rendered.
+        :param headers: Response headers of the compressed page.
+        :param body: The compressed body.
+        :return: None
+        """
+        with self._lock:
+            self._entries[(page, encoding, version)] = (headers, body, time.monotonic())
+            self._entries.move_to_end((page, encoding, version))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+compressed_cache = CompressedCache()
+
+
+def _is_catalog_page(path: str) -> bool:
+    """
+    :return: Whether the path is the catalog listing or a card's details, the pages memoized compressed.
+    """
+    return path == "/store/cards/" or (path.startswith("/store/card/") and path.count("/") == 3)
+
+
+def _with_vary(headers: list) -> list:
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            if b"accept-encoding" not in value.lower():
+                headers[index] = (name, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip, whichever the client accepts. Bodies under
+    COMPRESSION_MIN_SIZE are sent as is; streamed responses are compressed chunk by chunk instead of being
+    buffered; GET pages of the catalog are memoized per catalog version.
+
+    :param app: The wrapped ASGI application.
+    :param minimum_size: Smallest body that is compressed, in bytes.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope.get("headers") or [])
+        accept_encoding = request_headers.get(b"accept-encoding", b"").decode("latin-1")
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        cacheable = scope["method"] == "GET" and _is_catalog_page(scope["path"])
+        if cacheable:
+            # The same page is rendered as JSON or MessagePack per Accept, and CORS echoes the Origin
+            query = scope.get("query_string", b"").decode("latin-1")
+            page = (f"{request_headers.get(b'accept', b'').decode('latin-1')} "
+                    f"{request_headers.get(b'origin', b'').decode('latin-1')} {scope['path']}?{query}")
+            # The catalog version the page is rendered at: read before the route runs, so a change made while
+            # it runs files the page under the older version
+            version = catalog_version()
+            cached = compressed_cache.get(page, encoding, version)
+            if cached is not None:
+                headers, compressed = cached
+                compressed_responses.inc(encoding=encoding)
+                await send({"type": "http.response.start", "status": 200, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed})
+                return
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = {name.lower(): value for name, value in message.get("headers") or []}
+                content_type = headers.get(b"content-type", b"")
+                passthrough = (b"content-encoding" in headers or content_type.startswith(_SKIPPED_TYPES)
+                               or message["status"] < 200 or message["status"] in (204, 304))
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                response_start, start_message = start_message, None
+                headers = [(name, value) for name, value in response_start.get("headers") or []
+                           if name.lower() != b"content-length"]
+                if not more_body:
+                    # The whole body in one message: compress it at once, or not at all if it is small
+                    if len(body) < self.minimum_size:
+                        await send(response_start)
+                        await send(message)
+                        return
+                    compressed = compress(body, encoding)
+                    headers = _with_vary(headers)
+                    headers += [(b"content-encoding", encoding.encode()),
+                                (b"content-length", str(len(compressed)).encode())]
+                    if cacheable and response_start["status"] == 200 and len(body) <= COMPRESSION_CACHE_MAX_BYTES:
+                        compressed_cache.put(page, encoding, version, headers, compressed)
+                    compressed_responses.inc(encoding=encoding)
+                    await send({**response_start, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                # Streamed response: its length is unknown, so it is compressed as it goes
+                compressor = _Compressor(encoding)
+                headers = _with_vary(headers) + [(b"content-encoding", encoding.encode())]
+                compressed_responses.inc(encoding=encoding)
+                await send({**response_start, "headers": headers})
+
+            if compressor is None:
+                await send(message)
+                return
+            data = compressor.compress(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
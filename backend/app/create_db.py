@@ -1,4 +1,17 @@
 from backend.app.database import Base, engine
+from backend.app.migrations import run_migrations
 
-# This will create all tables in the database if they don't already exist
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+
+def create_database():
+    """
+    Creates all tables in the database if they don't already exist, then migrates existing ones.
+
+    :return: The schema version after migrating.
+    """
+    Base.metadata.create_all(bind=engine)
+    return run_migrations(engine)
+
+
+if __name__ == "__main__":
+    # python -m backend.app.create_db; importing this module no longer touches the database
+    create_database()
@@ -1,10 +1,21 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import List, Optional, Tuple
 
 from backend.app import models
-from backend.app.models import Card, User, Order, OrderItem, Review, UserReview
+from backend.app.models import Card, User, Order, OrderItem, Review, UserReview, ArchivedOrder, ArchivedOrderItem
 from backend.app.schemas import CardCreate, UserCreate, OrderCreate, OrderItemCreate, ReviewCreate, UserReviewCreate
 from backend.app.utils import hash_password, verify_password
+from backend.app.ratings import apply_card_rating, apply_user_rating
+from backend.app.recommendations import apply_order_item
+from backend.app.duplicates import hash_index, index_card
+from backend.app.events import card_changed, card_deleted
+from backend.app.snapshot import invalidate_catalog
+from backend.app.catalog_index import catalog_index, query_cards
+from backend.app.singleflight import home_reads
+from backend.app.pagination import after_descending
+from backend.app.tracing import traced
 
 
 # --------------------- CRUD Operations for Card --------------------- #
@@ -26,6 +37,9 @@ def create_card(db: Session, card: CardCreate, image_url: str):
     db.add(db_card)
     db.commit()
     db.refresh(db_card)
+    card_changed(db_card)
+    invalidate_catalog(db_card.id)
+    catalog_index.upsert(db, db_card)
     return db_card
 
 def get_card(db: Session, card_id: int):
@@ -36,18 +50,79 @@ def get_card(db: Session, card_id: int):
     """
     return db.query(models.Card).filter(models.Card.id == card_id).first()
 
-def get_cards(db: Session, skip: int = 0, limit: int = 10):
+# Orderings of the catalog listing; every one ends with the id, so pages are stable
+CARD_SORTS = {
+    None: (Card.id,),
+    "price": (Card.price.asc().nulls_last(), Card.id),
+    "-price": (Card.price.desc().nulls_last(), Card.id),
+    "quantity": (Card.quantity.asc().nulls_last(), Card.id),
+    "-quantity": (Card.quantity.desc().nulls_last(), Card.id),
+    "recent": (Card.created_at.desc().nulls_last(), Card.id),
+    "rating": (Card.rating_avg.desc().nulls_last(), Card.id),
+}
+
+def get_cards(db: Session, skip: int = 0, limit: int = 10, sort: Optional[str] = None,
+              min_rating: Optional[float] = None, min_price: Optional[float] = None,
+              max_price: Optional[float] = None, in_stock: bool = False, name: Optional[str] = None):
     """
+    Answered from the in-memory catalog index when it is current, from the database otherwise.
+
     :param db: Database session object used to perform database operations.
     :type db: Session
     :param skip: Number of records to skip before starting to return results.
     :type skip: int
     :param limit: Maximum number of records to return.
     :type limit: int
+    :param sort: One of CARD_SORTS: "price" or "-price" for the cheapest or most expensive first, "quantity" or
+        "-quantity" by stock, "recent" for the latest listed first, "rating" for the best rated first; id order
+        otherwise.
+    :type sort: Optional[str]
+    :param min_rating: Only return cards whose average rating is at least this value.
+    :type min_rating: Optional[float]
+    :param min_price: Only return cards priced at least this much.
+    :type min_price: Optional[float]
+    :param max_price: Only return cards priced at most this much.
+    :type max_price: Optional[float]
+    :param in_stock: Only return cards with a quantity of at least one.
+    :type in_stock: bool
+    :param name: Only return cards with this name, ignoring case.
+    :type name: Optional[str]
     :return: List of Card objects from the database based on the specified skip and limit.
     :rtype: list
     """
-    return db.query(Card).offset(skip).limit(limit).all()
+    card_ids = query_cards(db, skip=skip, limit=limit, sort=sort, min_price=min_price, max_price=max_price,
+                           min_quantity=1 if in_stock else None, min_rating=min_rating, name=name)
+    if card_ids is not None:
+        cards = {card.id: card for card in db.query(Card).filter(Card.id.in_(card_ids))} if card_ids else {}
+        return [cards[card_id] for card_id in card_ids if card_id in cards]
+
+    query = db.query(Card)
+    if min_rating is not None:
+        query = query.filter(Card.rating_avg >= min_rating)
+    if min_price is not None:
+        query = query.filter(Card.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Card.price <= max_price)
+    if in_stock:
+        query = query.filter(Card.quantity >= 1)
+    if name is not None:
+        query = query.filter(func.lower(Card.name) == name.lower())
+    return query.order_by(*CARD_SORTS[sort]).offset(skip).limit(limit).all()
+
+
+def get_cards_by_ids(db: Session, card_ids: List[int]) -> dict:
+    """
+    Looks up many cards with one IN query, loading only the columns a cart displays.
+
+    :param db: Database session used for the query.
+    :param card_ids: IDs of the cards to look up.
+    :return: Dictionary of the found cards' (id, name, price, quantity, image_url) rows by card id.
+    """
+    if not card_ids:
+        return {}
+    rows = (db.query(Card.id, Card.name, Card.price, Card.quantity, Card.image_url)
+            .filter(Card.id.in_(card_ids)).all())
+    return {row.id: row for row in rows}
 
 
 def update_card(db: Session, card_id: int, image_url: str, card_data: CardCreate) -> Optional[Card]:
@@ -66,11 +141,18 @@ def update_card(db: Session, card_id: int, image_url: str, card_data: CardCreate
             setattr(db_card, key, value)
 
         if image_url:
+            if image_url != db_card.image_url:
+                # The hashes of the new image are computed by the card.hash_image job
+                db_card.image_ahash = db_card.image_phash = None
             db_card.image_url = image_url
 
         db.commit()
 
         db.refresh(db_card)
+        index_card(db_card)
+        card_changed(db_card)
+        invalidate_catalog(card_id)
+        catalog_index.upsert(db, db_card)
 
     return db_card
 
@@ -90,6 +172,10 @@ def delete_card(db: Session, card_id: int) -> bool:
     if card:
         db.delete(card)
         db.commit()
+        hash_index.remove(card_id)
+        card_deleted(card_id)
+        invalidate_catalog(card_id)
+        catalog_index.remove(db, card_id)
         return True
     return False
 
@@ -171,6 +257,7 @@ def update_user(db: Session, user_id: int, user_data: UserCreate, avatar_url: Op
 
         db.commit()
         db.refresh(db_user)
+        home_reads.invalidate(f"user:{user_id}")
     return db_user
 
 
@@ -184,10 +271,12 @@ def delete_user(db: Session, user_id: int) -> bool:
     if db_user:
         db.delete(db_user)
         db.commit()
+        home_reads.invalidate(f"user:{user_id}")
         return True
     return False
 
 # --------------------- CRUD Operation for Authentication --------------------- #
+@traced("auth.authenticate_user")
 def authenticate_user(db: Session, email: str, password: str):
     """
     :param db: The database session to use for querying the user.
@@ -224,6 +313,7 @@ def create_order(db: Session, order: OrderCreate) -> Order:
     db.add(db_order)
     db.commit()
     db.refresh(db_order)
+    home_reads.invalidate(f"user:{db_order.user_id}")
     return db_order
 
 
@@ -233,10 +323,14 @@ def get_order(db: Session, order_id: int) -> Optional[Order]:
     :type db: Session
     :param order_id: The unique identifier of the order to retrieve.
     :type order_id: int
-    :return: The order that matches the provided `order_id` if found, otherwise None.
+    :return: The order that matches the provided `order_id` if found, otherwise None. Orders moved to the
+        archive are returned as read-only ArchivedOrder objects.
     :rtype: Optional[Order]
     """
-    return db.query(Order).filter(Order.id == order_id).first()
+    order = db.query(Order).filter(Order.id == order_id).first()
+    if order is None:
+        order = db.query(ArchivedOrder).filter(ArchivedOrder.id == order_id).first()
+    return order
 
 
 def get_orders(db: Session, skip: int = 0, limit: int = 10) -> List[Order]:
@@ -249,6 +343,32 @@ def get_orders(db: Session, skip: int = 0, limit: int = 10) -> List[Order]:
     return db.query(Order).offset(skip).limit(limit).all()
 
 
+def get_user_orders(db: Session, user_id: int, limit: int = 20,
+                    after: Optional[Tuple[datetime, int]] = None) -> List[Order]:
+    """
+    Returns a page of a user's order history in two queries: one range scan of the
+    (user_id, created_at DESC) index for the orders, one IN lookup for all of their items.
+
+    :param db: Database session used for the query.
+    :param user_id: ID of the user whose orders are listed.
+    :param limit: Maximum number of orders to return.
+    :param after: (created_at, id) of the last order of the previous page, None for the first page.
+    :return: Orders, newest first, with their order items loaded. The archive, which only holds orders older
+        than the hot ones, is read once the hot orders run out.
+    """
+    orders = []
+    for model in (Order, ArchivedOrder):
+        query = db.query(model).options(selectinload(model.order_items)).filter(model.user_id == user_id)
+        if after is not None:
+            query = query.filter(after_descending(model.created_at, model.id, *after))
+        orders += query.order_by(model.created_at.desc(), model.id.desc()).limit(limit - len(orders)).all()
+        if len(orders) == limit:
+            break
+        if orders:
+            after = (orders[-1].created_at, orders[-1].id)
+    return orders
+
+
 def update_order(db: Session, order_id: int, order_data: OrderCreate) -> Optional[Order]:
     """
     :param db: Database session object used to interact with the database.
@@ -262,10 +382,13 @@ def update_order(db: Session, order_id: int, order_data: OrderCreate) -> Optiona
     """
     db_order = db.query(Order).filter(Order.id == order_id).first()
     if db_order:
+        previous_user_id = db_order.user_id
         for key, value in order_data.dict(exclude_unset=True).items():
             setattr(db_order, key, value)
         db.commit()
         db.refresh(db_order)
+        home_reads.invalidate(f"user:{previous_user_id}")
+        home_reads.invalidate(f"user:{db_order.user_id}")
     return db_order
 
 
@@ -277,8 +400,17 @@ def delete_order(db: Session, order_id: int) -> bool:
     """
     db_order = db.query(Order).filter(Order.id == order_id).first()
     if db_order:
+        # The items are kept, detached from the order: they stop counting as bought together
+        for db_order_item in db_order.order_items:
+            apply_order_item(db, order_id, db_order_item.card_id, sign=-1, exclude_item_id=db_order_item.id)
+            db_order_item.order_id = None
+            db.flush()
+        user_id = db_order.user_id
         db.delete(db_order)
         db.commit()
+        # Its items disappear from the cards' order_items
+        invalidate_catalog()
+        home_reads.invalidate(f"user:{user_id}")
         return True
     return False
 
@@ -292,9 +424,11 @@ def create_order_item(db: Session, order_item: OrderItemCreate) -> OrderItem:
     :return: The newly created order item.
     """
     db_order_item = OrderItem(**order_item.dict())
+    apply_order_item(db, db_order_item.order_id, db_order_item.card_id)
     db.add(db_order_item)
     db.commit()
     db.refresh(db_order_item)
+    invalidate_catalog(db_order_item.card_id)
     return db_order_item
 
 
@@ -302,9 +436,13 @@ def get_order_items(db: Session, order_id: int) -> List[OrderItem]:
     """
     :param db: Database session used to perform the query.
     :param order_id: ID of the order whose items are being retrieved.
-    :return: List of OrderItem objects belonging to the specified order.
+    :return: List of OrderItem objects belonging to the specified order, ArchivedOrderItem objects if the
+        order was archived.
     """
-    return db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+    items = db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+    if not items:
+        items = db.query(ArchivedOrderItem).filter(ArchivedOrderItem.order_id == order_id).all()
+    return items
 
 
 def delete_order_item(db: Session, order_item_id: int) -> bool:
@@ -315,61 +453,157 @@ def delete_order_item(db: Session, order_item_id: int) -> bool:
     """
     db_order_item = db.query(OrderItem).filter(OrderItem.id == order_item_id).first()
     if db_order_item:
+        card_id = db_order_item.card_id
+        apply_order_item(db, db_order_item.order_id, card_id, sign=-1, exclude_item_id=db_order_item.id)
         db.delete(db_order_item)
         db.commit()
+        invalidate_catalog(card_id)
         return True
     return False
 
-# ---------------------   TO DO ---------------------------------------- #
 # --------------------- CRUD Operations for Review --------------------- #
 
-# def create_review(db: Session, review: ReviewCreate) -> Review:
-#     db_review = Review(**review.dict())
-#     db.add(db_review)
-#     db.commit()
-#     db.refresh(db_review)
-#     return db_review
-#
-#
-# def get_review(db: Session, review_id: int) -> Optional[Review]:
-#     return db.query(Review).filter(Review.id == review_id).first()
-#
-#
-# def get_reviews(db: Session, card_id: int) -> List[Review]:
-#     return db.query(Review).filter(Review.card_id == card_id).all()
-#
-#
-# def delete_review(db: Session, review_id: int) -> bool:
-#     db_review = db.query(Review).filter(Review.id == review_id).first()
-#     if db_review:
-#         db.delete(db_review)
-#         db.commit()
-#         return True
-#     return False
-#
-#
-# # --------------------- CRUD Operations for UserReview --------------------- #
-#
-# def create_user_review(db: Session, user_review: UserReviewCreate) -> UserReview:
-#     db_user_review = UserReview(**user_review.dict())
-#     db.add(db_user_review)
-#     db.commit()
-#     db.refresh(db_user_review)
-#     return db_user_review
-#
-#
-# def get_user_review(db: Session, user_review_id: int) -> Optional[UserReview]:
-#     return db.query(UserReview).filter(UserReview.id == user_review_id).first()
-#
-#
-# def get_user_reviews(db: Session, reviewed_user_id: int) -> List[UserReview]:
-#     return db.query(UserReview).filter(UserReview.reviewed_user_id == reviewed_user_id).all()
-#
-#
-# def delete_user_review(db: Session, user_review_id: int) -> bool:
-#     db_user_review = db.query(UserReview).filter(UserReview.id == user_review_id).first()
-#     if db_user_review:
-#         db.delete(db_user_review)
-#         db.commit()
-#         return True
-#     return False
\ No newline at end of file
+def create_review(db: Session, review: ReviewCreate) -> Review:
+    """
+    :param db: Database session used to store the review.
+    :param review: Data of the review to be created.
+    :return: The created Review object. The rating aggregates of the reviewed card are updated in the same transaction.
+    """
+    db_review = Review(**review.dict())
+    db.add(db_review)
+    apply_card_rating(db, card_id=review.card_id, rating=review.rating, sign=1)
+    db.commit()
+    db.refresh(db_review)
+    invalidate_catalog(review.card_id)
+    catalog_index.refresh(db, [review.card_id])
+    home_reads.invalidate(f"user:{review.user_id}")
+    return db_review
+
+
+def get_review(db: Session, review_id: int) -> Optional[Review]:
+    """
+    :param db: Database session used for the query.
+    :param review_id: ID of the review to retrieve.
+    :return: The Review object if found, otherwise None.
+    """
+    return db.query(Review).filter(Review.id == review_id).first()
+
+
+def get_reviews(db: Session, card_id: int) -> List[Review]:
+    """
+    :param db: Database session used for the query.
+    :param card_id: ID of the card whose reviews are retrieved.
+    :return: List of Review objects of the card.
+    """
+    return db.query(Review).filter(Review.card_id == card_id).all()
+
+
+def get_card_review_feed(db: Session, card_id: int, sort: str = "recent", limit: int = 20,
+                         after: Optional[tuple] = None) -> List[Review]:
+    """
+    :param db: Database session used for the query.
+    :param card_id: ID of the card whose reviews are listed.
+    :param sort: "recent" for newest first, "rating" for best rated first (newest first among equal ratings).
+    :param limit: Maximum number of reviews to return.
+    :param after: Sort key of the last review of the previous page: (created_at, id) for "recent",
+        (rating, created_at, id) for "rating"; None for the first page.
+    :return: Reviews of the card in feed order, with their authors loaded.
+    """
+    query = db.query(Review).options(joinedload(Review.user)).filter(Review.card_id == card_id)
+    if sort == "rating":
+        if after is not None:
+            rating, created_at, review_id = after
+            query = query.filter(or_(
+                Review.rating < rating,
+                and_(Review.rating == rating, after_descending(Review.created_at, Review.id, created_at, review_id)),
+            ))
+        query = query.order_by(Review.rating.desc(), Review.created_at.desc(), Review.id.desc())
+    else:
+        if after is not None:
+            query = query.filter(after_descending(Review.created_at, Review.id, *after))
+        query = query.order_by(Review.created_at.desc(), Review.id.desc())
+    return query.limit(limit).all()
+
+
+def delete_review(db: Session, review_id: int) -> bool:
+    """
+    :param db: Database session used for the query.
+    :param review_id: ID of the review to delete.
+    :return: True if the review was found and deleted, False otherwise.
+    """
+    db_review = db.query(Review).filter(Review.id == review_id).first()
+    if db_review:
+        card_id, user_id = db_review.card_id, db_review.user_id
+        apply_card_rating(db, card_id=card_id, rating=db_review.rating, sign=-1)
+        db.delete(db_review)
+        db.commit()
+        invalidate_catalog(card_id)
+        catalog_index.refresh(db, [card_id])
+        home_reads.invalidate(f"user:{user_id}")
+        return True
+    return False
+
+
+# --------------------- CRUD Operations for UserReview --------------------- #
+
+def create_user_review(db: Session, user_review: UserReviewCreate) -> UserReview:
+    """
+    :param db: Database session used to store the feedback.
+    :param user_review: Data of the feedback to be created.
+    :return: The created UserReview object. The reputation of the reviewed user is updated in the same transaction.
+    """
+    db_user_review = UserReview(**user_review.dict(), created_at=datetime.utcnow())
+    db.add(db_user_review)
+    apply_user_rating(db, user_id=user_review.reviewed_user_id, rating=user_review.rating,
+                      created_at=db_user_review.created_at, sign=1)
+    db.commit()
+    db.refresh(db_user_review)
+    # The reputation shown on the reviewed user's home page changed
+    home_reads.invalidate(f"user:{user_review.reviewed_user_id}")
+    return db_user_review
+
+
+def get_user_review(db: Session, user_review_id: int) -> Optional[UserReview]:
+    """
+    :param db: Database session used for the query.
+    :param user_review_id: ID of the feedback to retrieve.
+    :return: The UserReview object if found, otherwise None.
+    """
+    return db.query(UserReview).filter(UserReview.id == user_review_id).first()
+
+
+def get_user_feedback(db: Session, user_id: int, given: bool = False, limit: int = 20,
+                      after: Optional[Tuple[datetime, int]] = None) -> List[UserReview]:
+    """
+    :param db: Database session used for the query.
+    :param user_id: ID of the user whose feedback is listed.
+    :param given: List the feedback the user gave instead of the feedback they received.
+    :param limit: Maximum number of feedbacks to return.
+    :param after: (created_at, id) of the last feedback of the previous page, None for the first page.
+    :return: Feedbacks, newest first, with their reviewers loaded.
+    """
+    owner_column = UserReview.reviewer_id if given else UserReview.reviewed_user_id
+    query = (db.query(UserReview)
+             .options(joinedload(UserReview.reviewer))
+             .filter(owner_column == user_id))
+    if after is not None:
+        query = query.filter(after_descending(UserReview.created_at, UserReview.id, *after))
+    return query.order_by(UserReview.created_at.desc(), UserReview.id.desc()).limit(limit).all()
+
+
+def delete_user_review(db: Session, user_review_id: int) -> bool:
+    """
+    :param db: Database session used for the query.
+    :param user_review_id: ID of the feedback to delete.
+    :return: True if the feedback was found and deleted, False otherwise.
+    """
+    db_user_review = db.query(UserReview).filter(UserReview.id == user_review_id).first()
+    if db_user_review:
+        apply_user_rating(db, user_id=db_user_review.reviewed_user_id, rating=db_user_review.rating,
+                          created_at=db_user_review.created_at, sign=-1)
+        reviewed_user_id = db_user_review.reviewed_user_id
+        db.delete(db_user_review)
+        db.commit()
+        home_reads.invalidate(f"user:{reviewed_user_id}")
+        return True
+    return False
@@ -4,6 +4,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from databases import Database
 from dotenv import load_dotenv
+from backend.app.tracing import start_span
 
 
 load_dotenv()
@@ -49,11 +50,15 @@ def get_db():
 
     :return: A database session from `SessionLocal()`
     """
+    # Not made the active span: the dependency yields across threads, and the route's statements are
+    # children of the request span anyway
+    span = start_span("db.session")
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+        span.end()
 
 
 async def connect_async_database():
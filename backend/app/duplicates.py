@@ -0,0 +1,290 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from backend.app.jobs import job_handler
+from backend.app.models import Card
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# Two listings whose image pHashes differ in at most this many bits are reported as duplicates
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "4"))
+# Hashes written by other processes (the job worker, the backfill) reach the index when it is reloaded after this long
+DUPLICATE_INDEX_MAX_AGE = float(os.getenv("DUPLICATE_INDEX_MAX_AGE", "300"))
+BACKFILL_WORKERS = int(os.getenv("IMAGE_HASH_BACKFILL_WORKERS", str(os.cpu_count() or 1)))
+_BACKFILL_BATCH_SIZE = 1000
+
+_dct_matrix = None
+
+
+# --------------------- Hashing --------------------- #
+
+def _bits_to_hex(bits) -> str:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return f"{value:016x}"
+
+
+def _dct(size: int):
+    """
+    :return: The orthonormal DCT-II matrix of the given size, computed once.
+    """
+    global _dct_matrix
+    if _dct_matrix is None or _dct_matrix.shape[0] != size:
+        import numpy as np
+        k = np.arange(size)[:, None]
+        n = np.arange(size)[None, :]
+        matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+        matrix[0] /= np.sqrt(2.0)
+        _dct_matrix = matrix
+    return _dct_matrix
+
+
+def image_hashes(path: str) -> Optional[Tuple[str, str]]:
+    """
+    Computes the average hash and the DCT perceptual hash of an image, both 64 bits wide.
+    Pillow and NumPy are imported on first use, so the app runs without Pillow; hashing is then skipped.
+
+    :param path: Path of the image file.
+    :return: (ahash, phash) as 16 hex digits each, None if the file is not a readable image.
+    """
+    try:
+        import numpy as np
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed, image hashing is disabled")
+        return None
+
+    try:
+        with Image.open(path) as image:
+            grey = image.convert("L")
+            small = np.asarray(grey.resize((8, 8), Image.LANCZOS), dtype=np.float64)
+            large = np.asarray(grey.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    except (OSError, ValueError):
+        return None
+
+    average_hash = _bits_to_hex((small > small.mean()).ravel())
+
+    dct = _dct(32)
+    # The lowest 8x8 frequencies; the DC term is left out of the median, it only encodes brightness
+    low = (dct @ large @ dct.T)[:8, :8].ravel()
+    perceptual_hash = _bits_to_hex(low > np.median(low[1:]))
+    return average_hash, perceptual_hash
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# --------------------- Near-duplicate index --------------------- #
+
+class HashIndex:
+    """
+    Multi-index hash table over 64-bit hashes (Manku et al., "Detecting near-duplicates for web crawling").
+    Each hash is split into max_distance + 1 disjoint bit ranges; by the pigeonhole principle two hashes
+    within max_distance bits agree exactly on at least one range, so a search only verifies the entries
+    sharing a bucket with the query in one of the tables instead of scanning every hash.
+
+    The index lives in each process: the card CRUD functions of the process keep it current, and it is
+    reloaded from the database once it is older than max_age seconds.
+    """
+
+    def __init__(self, max_distance: int = DUPLICATE_MAX_DISTANCE, max_age: float = DUPLICATE_INDEX_MAX_AGE):
+        chunks = max_distance + 1
+        bounds = [HASH_BITS * chunk // chunks for chunk in range(chunks + 1)]
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self._ranges = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables: List[Dict[int, set]] = [defaultdict(set) for _ in self._ranges]
+        self._hashes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def is_current(self) -> bool:
+        return self.loaded and time.monotonic() - self._loaded_at < self.max_age
+
+    def _keys(self, value: int):
+        return [(value >> start) & mask for start, mask in self._ranges]
+
+    def add(self, card_id: int, value: int):
+        with self._lock:
+            self._discard(card_id)
+            self._hashes[card_id] = value
+            for table, key in zip(self._tables, self._keys(value)):
+                table[key].add(card_id)
+
+    def remove(self, card_id: int):
+        with self._lock:
+            self._discard(card_id)
+
+    def _discard(self, card_id: int):
+        value = self._hashes.pop(card_id, None)
+        if value is None:
+            return
+        for table, key in zip(self._tables, self._keys(value)):
+            bucket = table[key]
+            bucket.discard(card_id)
+            if not bucket:
+                del table[key]
+
+    def search(self, value: int, max_distance: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        :param value: The hash to look up.
+        :param max_distance: Maximum Hamming distance, at most the distance the index was built for.
+        :return: (card_id, distance) of the indexed hashes within max_distance, closest first.
+        """
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, self._keys(value)):
+                candidates.update(table.get(key, ()))
+            matches = [(card_id, hamming_distance(value, self._hashes[card_id])) for card_id in candidates]
+        matches = [match for match in matches if match[1] <= max_distance]
+        return sorted(matches, key=lambda match: (match[1], match[0]))
+
+    def load(self, db: Session):
+        """
+        Fills the index with the pHash of every card, replacing its previous content.
+
+        :param db: Database session.
+        :return: None
+        """
+        rows = db.query(Card.id, Card.image_phash).filter(Card.image_phash.isnot(None)).yield_per(10000)
+        hashes = {card_id: int(phash, 16) for card_id, phash in rows}
+        # Built aside and swapped in, so searches during a reload see the previous content
+        tables = [defaultdict(set) for _ in self._ranges]
+        for card_id, value in hashes.items():
+            for table, key in zip(tables, self._keys(value)):
+                table[key].add(card_id)
+        with self._lock:
+            self._tables = tables
+            self._hashes = hashes
+            self._loaded_at = time.monotonic()
+        self.loaded = True
+
+
+hash_index = HashIndex()
+
+
+def index_card(card: Card):
+    """
+    Keeps the in-memory index in step with a card that was created or updated. Until the index is
+    loaded (on the first search) there is nothing to update.
+
+    :param card: The card as committed.
+    :return: None
+    """
+    if not hash_index.loaded:
+        return
+    if card.image_phash:
+        hash_index.add(card.id, int(card.image_phash, 16))
+    else:
+        hash_index.remove(card.id)
+
+
+def find_duplicates(db: Session, card: Card, max_distance: int = DUPLICATE_MAX_DISTANCE) -> List[Tuple[Card, int]]:
+    """
+    :param db: Database session.
+    :param card: The card whose near-duplicates are looked up.
+    :param max_distance: Maximum Hamming distance between the pHashes of the images.
+    :return: (Card, distance) of the other cards whose image is a near-duplicate, closest first.
+    """
+    if not card.image_phash:
+        return []
+    if not hash_index.is_current():
+        hash_index.load(db)
+    matches = [(card_id, distance) for card_id, distance
+               in hash_index.search(int(card.image_phash, 16), max_distance) if card_id != card.id]
+    if not matches:
+        return []
+    cards = {other.id: other for other in db.query(Card).filter(Card.id.in_([card_id for card_id, _ in matches]))}
+    return [(cards[card_id], distance) for card_id, distance in matches if card_id in cards]
+
+
+@job_handler("card.hash_image", concurrency=2, timeout=120)
+def hash_card_image(db: Session, card_id: int, upload_dir: str = "./uploads"):
+    """
+    Job computing the image hashes of a card after its image was uploaded, and indexing them.
+
+    :param db: Database session of the job; committed here so the index only sees committed hashes.
+    :param card_id: The card whose image is hashed.
+    :param upload_dir: Directory the /uploads/ image URLs are served from.
+    :return: None
+    """
+    card = db.query(Card).filter(Card.id == card_id).first()
+    if card is None or not card.image_url:
+        return
+    hashes = image_hashes(os.path.join(upload_dir, os.path.basename(card.image_url)))
+    card.image_ahash, card.image_phash = hashes or (None, None)
+    db.commit()
+    index_card(card)
+
+
+# --------------------- Backfill --------------------- #
+
+def _hash_file(job: Tuple[int, str]) -> Tuple[int, Optional[Tuple[str, str]]]:
+    card_id, path = job
+    return card_id, image_hashes(path)
+
+
+def backfill_hashes(db: Session, upload_dir: str = "./uploads", workers: int = BACKFILL_WORKERS) -> int:
+    """
+    Hashes the image of every card that has none yet, decoding the images in a process pool.
+
+    :param db: Database session used for the backfill; committed after every batch.
+    :param upload_dir: Directory the /uploads/ image URLs are served from.
+    :param workers: Number of worker processes.
+    :return: Number of cards hashed.
+    """
+    jobs = [(card_id, os.path.join(upload_dir, os.path.basename(image_url)))
+            for card_id, image_url in db.query(Card.id, Card.image_url)
+            .filter(Card.image_url.isnot(None), Card.image_phash.is_(None))]
+    hashed = 0
+    batch = []
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for card_id, hashes in executor.map(_hash_file, jobs, chunksize=64):
+            if hashes is None:
+                continue
+            batch.append({"id": card_id, "image_ahash": hashes[0], "image_phash": hashes[1]})
+            if len(batch) >= _BACKFILL_BATCH_SIZE:
+                db.bulk_update_mappings(Card, batch)
+                db.commit()
+                hashed += len(batch)
+                batch = []
+    if batch:
+        db.bulk_update_mappings(Card, batch)
+        db.commit()
+        hashed += len(batch)
+    hash_index.loaded = False
+    return hashed
+
+
+if __name__ == "__main__":
+    # Backfill job: python -m backend.app.duplicates [upload_dir] [workers]
+    import sys
+
+    from backend.app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        count = backfill_hashes(session, sys.argv[1] if len(sys.argv) > 1 else "./uploads",
+                                int(sys.argv[2]) if len(sys.argv) > 2 else BACKFILL_WORKERS)
+        logger.info("Hashed the images of %d cards", count)
+    finally:
+        session.close()
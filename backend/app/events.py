@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from backend.app.metrics import Counter, Gauge
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per client; a client that falls this far behind is disconnected
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_MAX_SUBSCRIBERS = int(os.getenv("EVENT_MAX_SUBSCRIBERS", "50000"))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+# Recent events kept so a reconnecting client can catch up from its Last-Event-ID
+EVENT_REPLAY_SIZE = int(os.getenv("EVENT_REPLAY_SIZE", "1024"))
+# "" delivers to the clients of this worker only; "redis" fans out through REDIS_URL to every worker
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "cardshop:catalog")
+
+sse_subscribers = Gauge("sse_subscribers", "Clients connected to /store/stream on this worker.")
+sse_dropped = Counter("sse_dropped_subscribers", "Clients disconnected for not keeping up with the event stream.")
+events_published = Counter("catalog_events", "Catalog change events delivered to this worker.", ("type",))
+
+
+class Subscriber:
+    """
+    One connected client: a bounded queue of encoded events and whether it was dropped.
+    """
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.dropped = False
+
+
+def format_event(event_id: str, event_type: str, data: dict) -> bytes:
+    """
+    :return: The event in text/event-stream format.
+    """
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class LocalBackend:
+    """
+    Fan-out backend delivering events to the clients of this worker only.
+    """
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    def publish(self, event_type: str, data: dict):
+        self._deliver(event_type, data)
+
+
+class RedisBackend:
+    """
+    Fan-out backend publishing events on a Redis channel every worker subscribes to, so a change
+    made through one worker reaches the clients of all of them. redis is imported on start only.
+    """
+
+    def __init__(self, url: str = REDIS_URL, channel: str = EVENTS_CHANNEL):
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, deliver):
+        import redis.asyncio as redis
+        self._client = redis.from_url(self.url)
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(self.channel)
+
+        async def listen():
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    event = json.loads(message["data"])
+                    deliver(event["type"], event["data"])
+
+        self._task = asyncio.create_task(listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._client is not None:
+            await self._client.close()
+
+    def publish(self, event_type: str, data: dict):
+        message = json.dumps({"type": event_type, "data": data})
+        asyncio.create_task(self._client.publish(self.channel, message))
+
+
+class Broadcaster:
+    """
+    Per-worker event hub of the /store/stream endpoint. Every client gets a bounded queue; publishing
+    never blocks, and a client whose queue is full is dropped instead of buffering without limit.
+    Events carry "<worker boot id>-<catalog version>" ids, so a reconnecting client can be sent the
+    events it missed, or told to resync when they are no longer buffered.
+    """
+
+    def __init__(self, backend=None, queue_size: int = EVENT_QUEUE_SIZE, max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.backend = backend or (RedisBackend() if EVENTS_BACKEND == "redis" else LocalBackend())
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._subscribers = set()
+        self._recent = deque(maxlen=EVENT_REPLAY_SIZE)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._version_lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def start(self):
+        """
+        Binds the broadcaster to the running loop and starts the fan-out backend.
+
+        :return: None
+        """
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self._deliver)
+
+    async def stop(self):
+        """
+        Stops the backend and ends every stream.
+
+        :return: None
+        """
+        await self.backend.stop()
+        for subscriber in list(self._subscribers):
+            self._drop(subscriber)
+        self._loop = None
+
+    def publish(self, event_type: str, data: dict):
+        """
+        Publishes a catalog event to every client; safe to call from any thread, e.g. sync routes
+        running in the thread pool. Without a running broadcaster (scripts, tests) only the catalog
+        version is bumped.
+
+        :param event_type: Event name, e.g. "card.updated".
+        :param data: JSON serializable event payload.
+        :return: None
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self._bump_version()
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.backend.publish(event_type, data)
+        else:
+            loop.call_soon_threadsafe(self.backend.publish, event_type, data)
+
+    def _bump_version(self) -> int:
+        with self._version_lock:
+            self.version += 1
+            return self.version
+
+    def _deliver(self, event_type: str, data: dict):
+        # Runs on the loop thread for every event, whichever worker published it
+        version = self._bump_version()
+        payload = format_event(f"{self.boot_id}-{version}", event_type, data)
+        self._recent.append((version, payload))
+        events_published.inc(type=event_type)
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                sse_dropped.inc()
+                self._drop(subscriber)
+
+    def _drop(self, subscriber: Subscriber):
+        subscriber.dropped = True
+        self._subscribers.discard(subscriber)
+        sse_subscribers.set(len(self._subscribers))
+        # Wake the stream if it is waiting, so it can end
+        if subscriber.queue.empty():
+            subscriber.queue.put_nowait(None)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Optional[Subscriber]:
+        """
+        :param last_event_id: The Last-Event-ID header of a reconnecting client.
+        :return: A new subscriber with any missed events queued, None if the worker is at capacity.
+        """
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(self.queue_size)
+        if last_event_id:
+            self._replay(subscriber, last_event_id)
+        self._subscribers.add(subscriber)
+        sse_subscribers.set(len(self._subscribers))
+        return subscriber
+
+    def _replay(self, subscriber: Subscriber, last_event_id: str):
+        boot_id, _, version = last_event_id.partition("-")
+        missed = None
+        if boot_id == self.boot_id and version.isdigit():
+            version = int(version)
+            if version == self.version:
+                return
+            if self._recent and self._recent[0][0] <= version + 1:
+                missed = [payload for event_version, payload in self._recent if event_version > version]
+        if missed is None or len(missed) >= self.queue_size:
+            # The missed events are gone (or came from another worker): the client must refetch the catalog
+            missed = [format_event(f"{self.boot_id}-{self.version}", "resync", {"version": self.version})]
+        for payload in missed:
+            subscriber.queue.put_nowait(payload)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """
+        :param subscriber: The subscriber of a stream that ended.
+        :return: None
+        """
+        self._subscribers.discard(subscriber)
+        sse_subscribers.set(len(self._subscribers))
+
+    async def stream(self, subscriber: Subscriber, is_disconnected):
+        """
+        Yields the events of a subscriber in text/event-stream format until the client disconnects or is dropped,
+        with a keep-alive comment whenever the stream was idle for EVENT_KEEPALIVE_SECONDS.
+
+        :param subscriber: The subscriber returned by subscribe.
+        :param is_disconnected: Coroutine function telling whether the client went away.
+        :return: An async generator of encoded events.
+        """
+        try:
+            yield f"retry: 3000\n: version {self.version}\n\n".encode()
+            while not subscriber.dropped:
+                try:
+                    payload = await asyncio.wait_for(subscriber.queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield b": keep-alive\n\n"
+                    continue
+                if payload is None or subscriber.dropped:
+                    break
+                yield payload
+        finally:
+            self.unsubscribe(subscriber)
+
+
+broadcaster = Broadcaster()
+
+
+def card_changed(card):
+    """
+    Publishes the new price and stock of a card that was created or updated.
+
+    :param card: The card as committed.
+    :return: None
+    """
+    broadcaster.publish("card.updated", {"id": card.id, "price": card.price, "quantity": card.quantity})
+
+
+def card_deleted(card_id: int):
+    """
+    :param card_id: ID of the card that was deleted.
+    :return: None
+    """
+    broadcaster.publish("card.deleted", {"id": card_id})
@@ -0,0 +1,370 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Collection, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.database import SessionLocal
+from backend.app.metrics import Counter, Histogram
+from backend.app.models import Job
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKER_ENABLED = os.getenv("JOB_WORKER_ENABLED", "1").lower() in ("1", "true", "yes")
+# The worker is woken right away by jobs enqueued in this process; polling picks up the rest
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "600"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+job_wait_seconds = Histogram("job_wait_seconds", "Time from a job becoming due to the start of its attempt.",
+                             ("type",), buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0))
+job_run_seconds = Histogram("job_run_seconds", "Duration of job attempts.", ("type",))
+jobs_processed = Counter("jobs_processed", "Job attempts by outcome (done, retry, failed).", ("type", "outcome"))
+
+
+class JobType:
+    """
+    A registered job handler and its scheduling limits.
+
+    :param name: Name jobs of this type are enqueued under.
+    :param handler: Function called as handler(db, **payload); must be idempotent, since a job whose
+        worker dies before recording completion runs again once its visibility timeout expires.
+    :param concurrency: Maximum number of jobs of this type running at once in this process.
+    :param max_attempts: Attempts after which a failing job is marked failed.
+    :param timeout: Visibility timeout in seconds; a job running longer may be picked up again.
+    """
+
+    def __init__(self, name: str, handler: Callable, concurrency: int, max_attempts: int, timeout: float):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+
+_job_types: Dict[str, JobType] = {}
+
+
+def job_handler(name: str, concurrency: int = 1, max_attempts: int = 5, timeout: float = 60.0):
+    """
+    Decorator registering a function as the handler of a job type.
+
+    :param name: Name jobs of this type are enqueued under.
+    :param concurrency: Maximum number of jobs of this type running at once in this process.
+    :param max_attempts: Attempts after which a failing job is marked failed.
+    :param timeout: Visibility timeout of a running job, in seconds.
+    :return: The decorator.
+    """
+    def decorator(fn: Callable) -> Callable:
+        _job_types[name] = JobType(name, fn, concurrency, max_attempts, timeout)
+        return fn
+    return decorator
+
+
+def enqueue(db: Session, job_type: str, payload: Optional[dict] = None, delay: float = 0.0,
+            commit: bool = True) -> Job:
+    """
+    Adds a job to the queue. With commit=False the job joins the caller's transaction, so it is only
+    queued if the work that triggered it commits as well.
+
+    :param db: Database session.
+    :param job_type: Name of a registered job type.
+    :param payload: JSON serializable keyword arguments of the handler.
+    :param delay: Seconds before the job may start.
+    :param commit: Whether to commit the session.
+    :return: The new Job.
+    """
+    if job_type not in _job_types:
+        raise ValueError(f"Unknown job type {job_type!r}")
+    job = Job(type=job_type, payload=json.dumps(payload or {}), status=QUEUED,
+              max_attempts=_job_types[job_type].max_attempts,
+              run_at=datetime.utcnow() + timedelta(seconds=delay))
+    db.add(job)
+    if commit:
+        db.commit()
+        worker.notify()
+    return job
+
+
+def _due(now: datetime):
+    # queued jobs whose time has come, and running jobs whose worker let the visibility timeout expire
+    # with attempts left
+    return or_(and_(Job.status == QUEUED, Job.run_at <= now),
+               and_(Job.status == RUNNING, Job.locked_until < now, Job.attempts < Job.max_attempts))
+
+
+def fail_expired_jobs(db: Session, job_type: str) -> int:
+    """
+    Marks failed the running jobs of a type whose visibility timeout expired on their last attempt: their
+    worker crashed or hung every time, so they are not retried.
+
+    :param db: Database session; committed.
+    :param job_type: Name of the job type.
+    :return: Number of jobs marked failed.
+    """
+    now = datetime.utcnow()
+    failed = db.query(Job).filter(Job.type == job_type, Job.status == RUNNING, Job.locked_until < now,
+                                  Job.attempts >= Job.max_attempts).update({
+        Job.status: FAILED,
+        Job.locked_until: None,
+        Job.last_error: "visibility timeout expired",
+        Job.finished_at: now,
+    }, synchronize_session=False)
+    db.commit()
+    if failed:
+        logger.warning("%d %s jobs failed: visibility timeout expired on their last attempt", failed, job_type)
+        jobs_processed.inc(failed, type=job_type, outcome=FAILED)
+    return failed
+
+
+def claim_jobs(db: Session, job_type: str, limit: int, exclude: Collection[int] = ()) -> List[int]:
+    """
+    Marks up to ``limit`` due jobs of a type as running. Each job is claimed with a conditional UPDATE,
+    so when several workers race for the same job exactly one of them gets it.
+
+    :param db: Database session; committed.
+    :param job_type: Name of the job type.
+    :param limit: Maximum number of jobs claimed.
+    :param exclude: IDs of jobs still executing in this process, not taken back when they overrun their timeout.
+    :return: IDs of the claimed jobs.
+    """
+    now = datetime.utcnow()
+    timeout = timedelta(seconds=_job_types[job_type].timeout)
+    query = db.query(Job.id).filter(Job.type == job_type, _due(now))
+    if exclude:
+        query = query.filter(Job.id.notin_(list(exclude)))
+    candidates = [row.id for row in query.order_by(Job.run_at).limit(limit)]
+    claimed = []
+    for job_id in candidates:
+        updated = db.query(Job).filter(Job.id == job_id, _due(now)).update({
+            Job.status: RUNNING,
+            Job.locked_until: now + timeout,
+            Job.attempts: Job.attempts + 1,
+            Job.started_at: now,
+        }, synchronize_session=False)
+        if updated:
+            claimed.append(job_id)
+    db.commit()
+    return claimed
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    :param attempts: Number of attempts made so far.
+    :return: Seconds to wait before the next attempt: exponential backoff with jitter.
+    """
+    return min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS) * random.uniform(0.5, 1.0)
+
+
+def run_job(job_id: int):
+    """
+    Runs one claimed job in a session of its own and records the outcome. The outcome is only written
+    while the job still belongs to this attempt, so a worker that overran its visibility timeout cannot
+    overwrite the result of the worker that took the job over.
+
+    :param job_id: ID of a job claimed by claim_jobs.
+    :return: None
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if job is None:
+            return
+        name, attempt, max_attempts = job.type, job.attempts, job.max_attempts
+        waited = (job.started_at - max(job.run_at, job.created_at)).total_seconds()
+        job_wait_seconds.observe(max(waited, 0.0), type=name)
+        started = time.perf_counter()
+        values = {Job.locked_until: None}
+        try:
+            _job_types[name].handler(db, **json.loads(job.payload))
+            db.commit()
+            values.update({Job.status: DONE, Job.finished_at: datetime.utcnow(), Job.last_error: None})
+            outcome = DONE
+        except Exception as e:
+            db.rollback()
+            logger.exception("Job %d (%s) failed on attempt %d", job_id, name, attempt)
+            values[Job.last_error] = f"{type(e).__name__}: {e}"
+            if attempt >= max_attempts:
+                values.update({Job.status: FAILED, Job.finished_at: datetime.utcnow()})
+                outcome = FAILED
+            else:
+                values.update({Job.status: QUEUED,
+                               Job.run_at: datetime.utcnow() + timedelta(seconds=retry_delay(attempt))})
+                outcome = "retry"
+        job_run_seconds.observe(time.perf_counter() - started, type=name)
+        jobs_processed.inc(type=name, outcome=outcome)
+
+        db.query(Job).filter(Job.id == job_id, Job.status == RUNNING, Job.attempts == attempt).update(
+            values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def purge_finished_jobs(db: Session, older_than_hours: float = JOB_RETENTION_HOURS) -> int:
+    """
+    :param db: Database session; committed.
+    :param older_than_hours: Completed jobs finished longer ago than this are deleted; failed jobs are kept.
+    :return: Number of jobs deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=older_than_hours)
+    deleted = db.query(Job).filter(Job.status == DONE, Job.finished_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+class JobWorker:
+    """
+    Runs queued jobs on the event loop's thread pool, at most JobType.concurrency jobs per type at a time.
+    Jobs are durable rows of the jobs table, so queued work survives restarts, and the jobs of a worker
+    that died are picked up again once their visibility timeout expires.
+
+    :param poll_interval: Seconds between two checks for due jobs when nothing wakes the worker.
+    """
+
+    def __init__(self, poll_interval: float = JOB_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        # Jobs executing in this process by type, overrunning ones included, and their IDs
+        self._running: Dict[str, int] = defaultdict(int)
+        self._executing = set()
+        self._tasks = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def notify(self):
+        """
+        Wakes the worker up to look for due jobs; safe to call from any thread.
+
+        :return: None
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    @staticmethod
+    def _claim(job_type: str, limit: int, exclude: Collection[int]) -> List[int]:
+        db = SessionLocal()
+        try:
+            fail_expired_jobs(db, job_type)
+            return claim_jobs(db, job_type, limit, exclude)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _purge() -> int:
+        db = SessionLocal()
+        try:
+            return purge_finished_jobs(db)
+        finally:
+            db.close()
+
+    async def _execute(self, job_type: str, job_id: int):
+        try:
+            await run_in_threadpool(run_job, job_id)
+        except Exception:
+            logger.exception("Job %d could not be run", job_id)
+        finally:
+            self._running[job_type] -= 1
+            self._executing.discard(job_id)
+            self._wake.set()
+
+    async def _dispatch(self):
+        for name, job_type in list(_job_types.items()):
+            free = job_type.concurrency - self._running[name]
+            if free <= 0:
+                continue
+            for job_id in await run_in_threadpool(self._claim, name, free, set(self._executing)):
+                self._running[name] += 1
+                self._executing.add(job_id)
+                task = asyncio.create_task(self._execute(name, job_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def run(self):
+        """
+        Dispatches due jobs until cancelled.
+
+        :return: None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        last_purge = 0.0
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    await self._dispatch()
+                    if time.monotonic() - last_purge > 3600:
+                        last_purge = time.monotonic()
+                        await run_in_threadpool(self._purge)
+                except Exception:
+                    logger.exception("Job dispatch failed")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = None
+
+
+worker = JobWorker()
+
+
+def _empty_stats(job_type: str) -> dict:
+    return {"type": job_type, "queued": 0, "running": 0, "failed": 0, "due": 0, "oldest_due_seconds": None,
+            "finished": 0, "wait_avg_seconds": None, "wait_p95_seconds": None, "run_avg_seconds": None}
+
+
+def queue_stats(db: Session, window_hours: float = 1.0) -> dict:
+    """
+    :param db: Database session.
+    :param window_hours: Latencies are computed over the jobs finished within this many hours.
+    :return: Per job type: queue depth by status, age of the oldest due job, and the wait and run
+        times of recently finished jobs.
+    """
+    now = datetime.utcnow()
+    stats = {name: _empty_stats(name) for name in _job_types}
+
+    def entry(name: str) -> dict:
+        # jobs of types no longer registered are still reported
+        return stats.setdefault(name, _empty_stats(name))
+
+    for job_type, status, count in (db.query(Job.type, Job.status, func.count(Job.id))
+                                    .filter(Job.status.in_((QUEUED, RUNNING, FAILED)))
+                                    .group_by(Job.type, Job.status)):
+        entry(job_type)[status] = count
+
+    for job_type, count, oldest in (db.query(Job.type, func.count(Job.id), func.min(Job.run_at))
+                                    .filter(Job.status == QUEUED, Job.run_at <= now).group_by(Job.type)):
+        entry(job_type).update(due=count, oldest_due_seconds=(now - oldest).total_seconds())
+
+    waits, runs = defaultdict(list), defaultdict(list)
+    for job_type, created_at, started_at, finished_at in (
+            db.query(Job.type, Job.created_at, Job.started_at, Job.finished_at)
+            .filter(Job.status == DONE, Job.finished_at >= now - timedelta(hours=window_hours))
+            .order_by(Job.finished_at.desc()).limit(10000)):
+        waits[job_type].append((started_at - created_at).total_seconds())
+        runs[job_type].append((finished_at - started_at).total_seconds())
+    for job_type, values in waits.items():
+        values.sort()
+        entry(job_type).update(finished=len(values), wait_avg_seconds=sum(values) / len(values),
+                               wait_p95_seconds=values[min(int(len(values) * 0.95), len(values) - 1)],
+                               run_avg_seconds=sum(runs[job_type]) / len(runs[job_type]))
+
+    return {"as_of": now, "types": sorted(stats.values(), key=lambda stat: stat["type"])}
@@ -1,24 +1,44 @@
+import asyncio
 import logging
 
-from fastapi import FastAPI, Depends, HTTPException, status, Form, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, Form, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from fastapi.responses import JSONResponse, FileResponse
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, sessionmaker
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 import os
 
 # Importing CRUD, schemas, and database utilities
-from backend.app import crud, schemas, models
+from backend.app import (crud, schemas, models, tracing, memprofile, rollups, recommendations, duplicates, jobs, events,
+                         archive)
 from backend.app.crud import authenticate_user
-from backend.app.database import get_db, initialize_database, connect_async_database, disconnect_async_database
+from backend.app.database import get_db, connect_async_database, disconnect_async_database
 from backend.app.models import User
 from backend.app.schemas import UserLogin, Token, CardCreate, UserRead, AvatarResponse
-from backend.app.utils import check_if_admin, create_access_token, create_refresh_token, verify_token, get_current_user
+from backend.app.utils import (check_if_admin, create_token_pair, verify_token, get_current_user,
+                               optional_oauth2_scheme, REFRESH_TOKEN_EXPIRE_DAYS)
+from backend.app.revocation import revocations, family_key
+from backend.app.tracing import TracingMiddleware, instrument_sqlalchemy, start_span
+from backend.app.compression import CompressionMiddleware
+from backend.app.metrics import REGISTRY
+from backend.app.monitoring import loop_monitor
+from backend.app.migrations import check_schema
+from backend.app.pagination import encode_cursor, decode_time_cursor, decode_rating_cursor
+from backend.app.serializers import dump, dump_many, fast_response
+from backend.app.negotiation import NegotiatedResponse, NegotiatedRoute, prefers_msgpack
+from backend.app.snapshot import CATALOG_SNAPSHOT_ENABLED, catalog_snapshot
+from backend.app.singleflight import card_reads, home_reads
+from backend.app.ratelimit import RateLimit, login_account, order_account
 
 # Initialize FastAPI app
-app = FastAPI()
+# orjson (or MessagePack, per the Accept header) encodes the responses of every route; the hot read routes
+# also skip response_model validation
+app = FastAPI(default_response_class=NegotiatedResponse)
+app.router.route_class = NegotiatedRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,6 +48,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware)
+
+# Added last so it is the outermost middleware and its root span covers the whole request
+app.add_middleware(TracingMiddleware)
+instrument_sqlalchemy()
+
 UPLOAD_DIR = "./uploads"
 AVATAR_DIR = "./avatars"
 
@@ -53,16 +79,32 @@ invalid_token_exception = HTTPException(
 async def startup():
     """
     This function runs during the startup event of the FastAPI application.
-    It establishes an asynchronous connection to the database and initializes the database tables
-    using the synchronous SQLAlchemy ORM engine.
+    It establishes an asynchronous connection to the database and checks that the database schema
+    is at the version the code expects.
 
     :return: None
     """
     # If using async database connection
     await connect_async_database()
 
-    # Initialize the tables using the synchronous engine (SQLAlchemy ORM)
-    initialize_database()
+    # One query for the schema version; migrations run out-of-band (python -m backend.app.migrations),
+    # or here when AUTO_MIGRATE=1
+    check_schema()
+
+    # Measure event loop lag for as long as the worker runs
+    loop_monitor.start()
+
+    # Push catalog changes to the clients of /store/stream
+    await events.broadcaster.start()
+
+    # Keep the admin sales rollups current
+    app.state.rollup_task = asyncio.create_task(rollups.compaction_loop())
+
+    # Move orders past the archival horizon out of the hot order tables
+    app.state.archive_task = asyncio.create_task(archive.archive_loop()) if archive.ORDER_ARCHIVE_ENABLED else None
+
+    # Run deferred work from the durable job queue
+    app.state.job_worker_task = asyncio.create_task(jobs.worker.run()) if jobs.JOB_WORKER_ENABLED else None
 
 # Disconnect async database on shutdown
 @app.on_event("shutdown")
@@ -75,9 +117,36 @@ async def shutdown():
 
     :return: None
     """
+    app.state.rollup_task.cancel()
+    if app.state.archive_task is not None:
+        app.state.archive_task.cancel()
+    if app.state.job_worker_task is not None:
+        app.state.job_worker_task.cancel()
+    await loop_monitor.stop()
+    await events.broadcaster.stop()
     await disconnect_async_database()
+    tracing.flush()
 
 
+def save_upload(image: UploadFile) -> str:
+    """
+    :param image: The uploaded image file to store in UPLOAD_DIR.
+    :return: The URL path (relative to the server) the image is served from.
+    :raises HTTPException: If the file could not be written.
+    """
+    file_location = f"{UPLOAD_DIR}/{image.filename}"
+    with start_span("upload.write", {"file.name": image.filename}) as span:
+        try:
+            data = image.file.read()
+            with open(file_location, "wb+") as file_object:
+                file_object.write(data)
+            span.set_attribute("file.size", len(data))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save image: {str(e)}")
+
+    # Build the image URL path (relative to the server)
+    return f"/uploads/{image.filename}"
+
 # ---------------- Routes for Card (Synchronous CRUD with SQLAlchemy ORM) ---------------- #
 
 @app.post("/store/card/", response_model=schemas.CardRead)
@@ -100,16 +169,7 @@ async def create_card_listing(
 
     """
     # Save the uploaded file to the server
-    file_location = f"{UPLOAD_DIR}/{image.filename}"
-
-    try:
-        with open(file_location, "wb+") as file_object:
-            file_object.write(image.file.read())
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to save image: {str(e)}")
-
-    # Build the image URL path (relative to the server)
-    image_url = f"/uploads/{image.filename}"
+    image_url = save_upload(image)
 
     # Create the card listing in the database
     new_card = crud.create_card(
@@ -123,30 +183,279 @@ async def create_card_listing(
         image_url=image_url
     )
 
+    # Hash the image for duplicate detection in the background
+    jobs.enqueue(db, "card.hash_image", {"card_id": new_card.id})
+
     return new_card
 
 
 @app.get("/store/cards/", response_model=List[schemas.CardRead])
-def get_cards(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+def get_cards(skip: int = 0, limit: int = 10, sort: Optional[str] = None, min_rating: Optional[float] = None,
+              min_price: Optional[float] = None, max_price: Optional[float] = None, in_stock: bool = False,
+              name: Optional[str] = None, db: Session = Depends(get_db)):
     """
     :param skip: The number of records to skip from the beginning.
     :param limit: The maximum number of records to return.
+    :param sort: "price" or "-price" for the cheapest or most expensive first, "quantity" or "-quantity" by stock,
+        "recent" for the latest listed first, "rating" for the best rated first.
+    :param min_rating: Only list cards with at least this average rating.
+    :param min_price: Only list cards priced at least this much.
+    :param max_price: Only list cards priced at most this much.
+    :param in_stock: Only list cards in stock.
+    :param name: Only list cards with this name, ignoring case.
     :param db: Database session dependency.
     :return: A list of CardRead schema models.
     """
-    return crud.get_cards(db=db, skip=skip, limit=limit)
+    if sort not in crud.CARD_SORTS:
+        raise HTTPException(status_code=400,
+                            detail=f"sort must be one of {', '.join(sort for sort in crud.CARD_SORTS if sort)}")
+    filtered = min_rating is not None or min_price is not None or max_price is not None or in_stock or name is not None
+    if CATALOG_SNAPSHOT_ENABLED and sort is None and not filtered and not prefers_msgpack():
+        body = catalog_snapshot.page_json(skip, limit)
+        if body is not None:
+            return Response(body, media_type="application/json", headers={"Vary": "Accept"})
+    cards = crud.get_cards(db=db, skip=skip, limit=limit, sort=sort, min_rating=min_rating, min_price=min_price,
+                           max_price=max_price, in_stock=in_stock, name=name)
+    return fast_response(schemas.CardRead, cards, many=True)
+
+@app.get("/store/stream")
+async def stream_catalog_changes(request: Request):
+    """
+    Server-sent events stream of catalog changes: "card.updated" (id, price, quantity), "card.deleted" (id)
+    and "resync" when a reconnecting client missed more events than this worker still buffers.
+
+    :param request: The incoming request; its Last-Event-ID header resumes an interrupted stream.
+    :return: A text/event-stream response that stays open until the client disconnects.
+    """
+    subscriber = events.broadcaster.subscribe(request.headers.get("last-event-id"))
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many stream clients, retry later")
+    return StreamingResponse(events.broadcaster.stream(subscriber, request.is_disconnected),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+MAX_BATCH_CARD_IDS = 200
+
+
+@app.get("/store/cards/batch", response_model=schemas.CartCardBatch)
+def get_cards_batch(ids: str, db: Session = Depends(get_db)):
+    """
+    :param ids: Comma separated card ids, e.g. "1,2,3"; at most MAX_BATCH_CARD_IDS distinct ids.
+    :param db: Database session dependency.
+    :return: The current price, stock and image of every requested card in request order, and the ids
+        of the cards that no longer exist.
+    """
+    return _cart_batch(db, _parse_card_ids(ids))
+
+
+def _parse_card_ids(ids: str) -> List[int]:
+    try:
+        requested = [int(card_id) for card_id in ids.split(",") if card_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    # Drop repeated ids, keeping the position of their first occurrence
+    requested = list(dict.fromkeys(requested))
+    if not 1 <= len(requested) <= MAX_BATCH_CARD_IDS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_CARD_IDS} ids are required")
+    return requested
+
+
+def _cart_batch(db: Session, requested: List[int]) -> dict:
+    found = crud.get_cards_by_ids(db=db, card_ids=requested)
+    return {"items": [found[card_id] for card_id in requested if card_id in found],
+            "missing": [card_id for card_id in requested if card_id not in found]}
+
+
+HOME_FEATURED_COUNT = int(os.getenv("HOME_FEATURED_COUNT", "3"))
+
+
+@app.get("/store/home", response_model=schemas.HomeRead)
+async def get_home(cart: Optional[str] = None, token: Optional[str] = Depends(optional_oauth2_scheme),
+                   db: Session = Depends(get_db)):
+    """
+    Everything the home page shows on first paint in one round trip. The featured cards, the user and the cart
+    are read concurrently, each in a session of its own. The featured cards are shared by every request and the
+    user summaries are kept per user (see home_reads); the cart is always read fresh.
+
+    :param cart: Comma separated ids of the cards in the cart, as for /store/cards/batch; optional.
+    :param token: Bearer access token, optional; an invalid one is answered like an anonymous request.
+    :param db: Database session dependency; its engine is used by the concurrent reads.
+    :return: The featured cards, the user if authenticated and the current state of the cart cards.
+    """
+    cart_ids = _parse_card_ids(cart) if cart else None
+    bind = db.get_bind()
+
+    async def read_user():
+        if token is None:
+            return None
+        user_id = await run_in_threadpool(_authenticate, bind, token)
+        if user_id is None:
+            return None
+        return await home_reads.get(f"user:{user_id}", lambda: run_in_threadpool(_read_user, bind, user_id))
+
+    async def read_cart():
+        if cart_ids is None:
+            return None
+        return await run_in_threadpool(_read_cart, bind, cart_ids)
+
+    featured, user, cart_batch = await asyncio.gather(
+        home_reads.get("featured", lambda: run_in_threadpool(_read_featured, bind)), read_user(), read_cart())
+    # Only the anonymous variant without a cart is the same for everyone
+    cache_control = "private, no-cache" if token is not None or cart_ids is not None else "public, max-age=10"
+    return NegotiatedResponse({"featured": featured, "user": user, "cart": cart_batch},
+                              headers={"Cache-Control": cache_control, "Vary": "Accept, Authorization"})
+
+
+def _read_featured(bind) -> list:
+    db = sessionmaker(bind=bind)()
+    try:
+        cards = crud.get_cards(db=db, limit=HOME_FEATURED_COUNT, sort="rating", in_stock=True)
+        return dump_many(schemas.CardRead, cards)
+    finally:
+        db.close()
+
+
+def _authenticate(bind, token: str) -> Optional[int]:
+    db = sessionmaker(bind=bind)()
+    try:
+        return get_current_user(token=token, db=db).id
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+
+
+def _read_user(bind, user_id: int) -> Optional[dict]:
+    db = sessionmaker(bind=bind)()
+    try:
+        user = crud.get_user(db=db, user_id=user_id)
+        return None if user is None else dump(schemas.HomeUserSummary, user)
+    finally:
+        db.close()
+
+
+def _read_cart(bind, cart_ids: List[int]) -> dict:
+    db = sessionmaker(bind=bind)()
+    try:
+        return dump(schemas.CartCardBatch, _cart_batch(db, cart_ids))
+    finally:
+        db.close()
+
 
 @app.get("/store/card/{card_id}", response_model=schemas.CardRead)
-def get_card(card_id: int, db: Session = Depends(get_db)):
+async def get_card(card_id: int, db: Session = Depends(get_db)):
     """
+    Concurrent reads of one card share a single query, and its result is cached briefly (see card_reads), so
+    a burst of requests for a hyped card costs one database round trip.
+
     :param card_id: The unique identifier of the card to retrieve.
-    :param db: The database session dependency.
+    :param db: The database session dependency; only the request that fetches the card uses it.
     :return: The card data if found, otherwise raises an HTTPException with status code 404.
     """
+    if CATALOG_SNAPSHOT_ENABLED and not prefers_msgpack():
+        try:
+            body = catalog_snapshot.card_json(card_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Card not found")
+        if body is not None:
+            return Response(body, media_type="application/json", headers={"Vary": "Accept"})
+    bind = db.get_bind()
+
+    async def fetch_card():
+        return await run_in_threadpool(_read_card, bind, card_id)
+
+    card = await card_reads.get(card_id, fetch_card)
+    if card is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+    return NegotiatedResponse(card)
+
+
+def _read_card(bind, card_id: int):
+    # A session of its own: a refresh in the background outlives the request whose session started it
+    db = sessionmaker(bind=bind)()
+    try:
+        card = crud.get_card(db=db, card_id=card_id)
+        return None if card is None else dump(schemas.CardRead, card)
+    finally:
+        db.close()
+
+
+@app.get("/store/card/{card_id}/reviews", response_model=schemas.CardReviewPage)
+def get_card_reviews(card_id: int, sort: str = "recent", limit: int = 20, cursor: Optional[str] = None,
+                     db: Session = Depends(get_db)):
+    """
+    :param card_id: The unique identifier of the card whose reviews are listed.
+    :param sort: "recent" for newest first or "rating" for best rated first.
+    :param limit: The maximum number of reviews per page (1-100).
+    :param cursor: The next_cursor of the previous page; omitted for the first page.
+    :param db: The database session dependency.
+    :return: The card's precomputed rating histogram and one page of its reviews.
+    """
+    if sort not in ("recent", "rating"):
+        raise HTTPException(status_code=400, detail="sort must be 'recent' or 'rating'")
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+
+    card = crud.get_card(db=db, card_id=card_id)
+    if card is None:
+        raise HTTPException(status_code=404, detail="Card not found")
+
+    after = decode_rating_cursor(cursor) if sort == "rating" else decode_time_cursor(cursor)
+
+    # One extra row tells whether another page follows
+    reviews = crud.get_card_review_feed(db=db, card_id=card_id, sort=sort, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        last = reviews[-1]
+        key = (last.rating, last.created_at, last.id) if sort == "rating" else (last.created_at, last.id)
+        next_cursor = encode_cursor(*key)
+
+    return {
+        "card_id": card.id,
+        "rating_count": card.rating_count,
+        "rating_avg": card.rating_avg,
+        "rating_histogram": card.rating_histogram,
+        "items": reviews,
+        "next_cursor": next_cursor,
+    }
+
+
+@app.get("/store/card/{card_id}/related", response_model=List[schemas.RelatedCardRead])
+def get_related_cards(card_id: int, limit: int = recommendations.RELATED_TOP_K, db: Session = Depends(get_db)):
+    """
+    :param card_id: The unique identifier of the card whose related cards are listed.
+    :param limit: The maximum number of related cards returned.
+    :param db: The database session dependency.
+    :return: The cards most frequently bought together with the card, read from the precomputed top-K table.
+    """
+    if not 1 <= limit <= recommendations.RELATED_TOP_K:
+        raise HTTPException(status_code=400,
+                            detail=f"limit must be between 1 and {recommendations.RELATED_TOP_K}")
+    return [{"id": card.id, "name": card.name, "price": card.price, "quantity": card.quantity,
+             "image_url": card.image_url, "rating_avg": card.rating_avg, "bought_together": orders}
+            for orders, card in recommendations.get_related_cards(db, card_id, limit)]
+
+
+@app.get("/store/card/{card_id}/duplicates", response_model=List[schemas.DuplicateCardRead])
+def get_duplicate_cards(card_id: int, max_distance: int = duplicates.DUPLICATE_MAX_DISTANCE,
+                        db: Session = Depends(get_db)):
+    """
+    :param card_id: The unique identifier of the card whose near-duplicate listings are looked up.
+    :param max_distance: The maximum number of differing bits between the image hashes.
+    :param db: The database session dependency.
+    :return: The other listings with a near-identical image, closest first.
+    """
+    if not 0 <= max_distance <= duplicates.DUPLICATE_MAX_DISTANCE:
+        raise HTTPException(status_code=400,
+                            detail=f"max_distance must be between 0 and {duplicates.DUPLICATE_MAX_DISTANCE}")
     card = crud.get_card(db=db, card_id=card_id)
     if card is None:
         raise HTTPException(status_code=404, detail="Card not found")
-    return card
+    return [{"id": other.id, "name": other.name, "price": other.price, "image_url": other.image_url,
+             "distance": distance}
+            for other, distance in duplicates.find_duplicates(db, card, max_distance)]
 
 
 @app.put("/cards/{card_id}", response_model=schemas.CardRead)
@@ -183,13 +492,7 @@ def update_card(
     # Handle image upload if a new image has been uploaded
     if image is not None:
         # Save the new image if it is provided (replace the existing one)
-        file_location = f"{UPLOAD_DIR}/{image.filename}"
-        try:
-            with open(file_location, "wb+") as file_object:
-                file_object.write(image.file.read())
-            image_url = f"/uploads/{image.filename}"
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to save image: {str(e)}")
+        image_url = save_upload(image)
     else:
         # Keep the original image if no new image is uploaded
         image_url = card.image_url
@@ -210,6 +513,9 @@ def update_card(
     if updated_card is None:
         raise HTTPException(status_code=404, detail="Failed to update card")
 
+    if image is not None:
+        jobs.enqueue(db, "card.hash_image", {"card_id": card_id})
+
     return updated_card
 
 
@@ -241,7 +547,8 @@ def delete_card(card_id: int, current_user: models.User = Depends(get_current_us
 
 # ---------------- Routes for User (Synchronous CRUD with SQLAlchemy ORM) ---------------- #
 
-@app.post("/users/", response_model=schemas.UserRead,status_code=status.HTTP_201_CREATED)
+@app.post("/users/", response_model=schemas.UserRead,status_code=status.HTTP_201_CREATED,
+          dependencies=[Depends(RateLimit("signup", per_ip="10/hour"))])
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """
     :param user: The user information to create a new user, defined by schemas.UserCreate.
@@ -260,7 +567,7 @@ async def read_users_me(current_user: models.User = Depends(get_current_user)):
     :param current_user: The user object of the currently authenticated user.
     :return: The user object of the currently authenticated user.
     """
-    return current_user
+    return fast_response(schemas.UserRead, current_user)
 
 
 @app.get("/users/{user_id}", response_model=schemas.UserRead)
@@ -277,7 +584,30 @@ def read_user(user_id: int, db: Session = Depends(get_db)):
     db_user = crud.get_user(db=db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return fast_response(schemas.UserRead, db_user)
+
+
+@app.get("/users/{user_id}/feedback", response_model=schemas.FeedbackPage)
+def read_user_feedback(user_id: int, given: bool = False, limit: int = 20, cursor: Optional[str] = None,
+                       db: Session = Depends(get_db)):
+    """
+    :param user_id: The ID of the user whose feedback is listed.
+    :param given: List the feedback the user gave instead of the feedback they received.
+    :param limit: The maximum number of feedbacks per page (1-100).
+    :param cursor: The next_cursor of the previous page; omitted for the first page.
+    :param db: Database session dependency.
+    :return: One page of feedback, newest first, and the cursor of the next page.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    after = decode_time_cursor(cursor)
+    # One extra row tells whether another page follows
+    feedback = crud.get_user_feedback(db=db, user_id=user_id, given=given, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(feedback) > limit:
+        feedback = feedback[:limit]
+        next_cursor = encode_cursor(feedback[-1].created_at, feedback[-1].id)
+    return {"items": feedback, "next_cursor": next_cursor}
 
 
 @app.put("/users/{user_id}", response_model=schemas.UserRead)
@@ -374,7 +704,9 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 
 
 # ---------------- Routes for User Authentication (Synchronous CRUD with SQLAlchemy ORM) ---------------- #
-@app.post("/login/", response_model=Token)
+@app.post("/login/", response_model=Token,
+          dependencies=[Depends(RateLimit("login", per_ip="20/minute", per_account="5/minute",
+                                          account=login_account))])
 def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """
     :param user_credentials: User credential information containing username and password required for authentication.
@@ -392,30 +724,63 @@ def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session =
             detail="Invalid credentials"
         )
 
-    access_token = create_access_token(data={"sub": authenticated_user.email})
-    refresh_token = create_refresh_token(data={"sub": authenticated_user.email})
+    return create_token_pair(authenticated_user.email)
 
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
-
-@app.post("/token/refresh", response_model=Token)
-def refresh_token(refresh_token: str):
+def _verify_refresh_token(refresh_token: str) -> dict:
     """
-    :param refresh_token: The refresh token used to obtain a new access token.
-    :return: A dictionary containing the new access token, the same refresh token, and the token type (bearer).
+    :param refresh_token: A refresh token sent by a client.
+    :return: Its payload; tokens issued before refresh tokens carried a jti and a family are rejected.
     """
     payload = verify_token(refresh_token, invalid_token_exception)
+    if payload.get("type") != "refresh" or not payload.get("jti") or not payload.get("fam"):
+        raise invalid_token_exception
+    return payload
+
+
+@app.post("/token/refresh", response_model=Token, dependencies=[Depends(RateLimit("refresh", per_ip="30/minute"))])
+def refresh_token(body: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Rotates a refresh token: it is revoked and a new one of the same family is issued with the new access token.
+    Presenting a refresh token that was already rotated means it leaked (or was replayed), so the whole family
+    is revoked and the session has to log in again.
 
-    if not payload:
+    :param body: The refresh token used to obtain a new access token.
+    :param db: Database session dependency.
+    :return: A dictionary containing the new access token, the new refresh token, and the token type (bearer).
+    """
+    payload = _verify_refresh_token(body.refresh_token)
+    family = family_key(payload["fam"])
+    if revocations.is_revoked(db, family, exact=True):
         raise invalid_token_exception
 
-    new_access_token = create_access_token(data={"sub": payload["sub"]})
+    if not revocations.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"])):
+        # Every token of the family expires within REFRESH_TOKEN_EXPIRE_DAYS of its latest rotation
+        revocations.revoke(db, family, datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+        logging.warning("Refresh token reuse detected, revoked token family %s", payload["fam"])
+        raise invalid_token_exception
+
+    return create_token_pair(payload["sub"], family=payload["fam"])
+
 
-    return {"access_token": new_access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+@app.post("/token/revoke", dependencies=[Depends(RateLimit("revoke", per_ip="30/minute"))])
+def revoke_token(body: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Logs a session out: revokes the family of the refresh token, which also rejects its access tokens.
+
+    :param body: The refresh token of the session.
+    :param db: Database session dependency.
+    :return: A confirmation message.
+    """
+    payload = _verify_refresh_token(body.refresh_token)
+    revocations.revoke(db, family_key(payload["fam"]), datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    return {"message": "Token revoked"}
 
 # ---------------- Routes for Order (Synchronous CRUD with SQLAlchemy ORM) ---------------- #
 
-@app.post("/orders/", response_model=schemas.OrderRead)
+@app.post("/orders/", response_model=schemas.OrderRead,
+          dependencies=[Depends(RateLimit("orders", per_ip="30/minute", per_account="10/minute",
+                                          account=order_account))])
 def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
     """
     :param order: An instance of schemas.OrderCreate containing the details of the order to be created.
@@ -433,7 +798,29 @@ def read_orders(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
     :param db: Database session dependency.
     :return: A list of orders retrieved from the database.
     """
-    return crud.get_orders(db=db, skip=skip, limit=limit)
+    return fast_response(schemas.OrderRead, crud.get_orders(db=db, skip=skip, limit=limit), many=True)
+
+
+@app.get("/me/orders", response_model=schemas.OrderHistoryPage)
+def read_my_orders(limit: int = 20, cursor: Optional[str] = None, db: Session = Depends(get_db),
+                   current_user: models.User = Depends(get_current_user)):
+    """
+    :param limit: The maximum number of orders per page (1-100).
+    :param cursor: The next_cursor of the previous page; omitted for the first page.
+    :param db: Database session dependency.
+    :param current_user: The currently authenticated user.
+    :return: One page of the current user's orders with their items, newest first.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    after = decode_time_cursor(cursor)
+    # One extra row tells whether another page follows
+    orders = crud.get_user_orders(db=db, user_id=current_user.id, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return fast_response(schemas.OrderHistoryPage, {"items": orders, "next_cursor": next_cursor})
 
 
 @app.get("/orders/{order_id}", response_model=schemas.OrderRead)
@@ -446,7 +833,7 @@ def read_order(order_id: int, db: Session = Depends(get_db)):
     order = crud.get_order(db=db, order_id=order_id)
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return fast_response(schemas.OrderRead, order)
 
 
 @app.put("/orders/{order_id}", response_model=schemas.OrderRead)
@@ -485,6 +872,8 @@ def create_review(review: schemas.ReviewCreate, db: Session = Depends(get_db)):
     :param db: Database session dependency, provided by FastAPI's Depends mechanism.
     :return: The created review object as per schemas.ReviewRead.
     """
+    if crud.get_card(db=db, card_id=review.card_id) is None:
+        raise HTTPException(status_code=404, detail="Card not found")
     return crud.create_review(db=db, review=review)
 
 
@@ -524,6 +913,10 @@ def create_user_review(user_review: schemas.UserReviewCreate, db: Session = Depe
     :param db: Database session dependency used for performing database operations.
     :return: The newly created user review object following the UserReviewRead schema.
     """
+    if user_review.reviewer_id == user_review.reviewed_user_id:
+        raise HTTPException(status_code=400, detail="Users cannot review themselves")
+    if crud.get_user(db=db, user_id=user_review.reviewed_user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
     return crud.create_user_review(db=db, user_review=user_review)
 
 
@@ -553,4 +946,165 @@ def delete_user_review(user_review_id: int, db: Session = Depends(get_db)):
     success = crud.delete_user_review(db=db, user_review_id=user_review_id)
     if not success:
         raise HTTPException(status_code=404, detail="UserReview not found")
-    return {"message": "UserReview deleted successfully"}
\ No newline at end of file
+    return {"message": "UserReview deleted successfully"}
+
+
+# ---------------- Routes for Monitoring ---------------- #
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """
+    :return: Process metrics (event loop lag, ...) in the Prometheus text exposition format.
+    """
+    return REGISTRY.render()
+
+
+# ---------------- Routes for Admin Memory Profiling ---------------- #
+
+@app.post("/admin/memory/start")
+def start_memory_profiling(frames: int = 10, current_user: models.User = Depends(get_current_user)):
+    """
+    :param frames: Number of stack frames recorded per allocation.
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: The profiler status after tracing was started.
+    """
+    check_if_admin(current_user)
+    if not 1 <= frames <= 50:
+        raise HTTPException(status_code=400, detail="frames must be between 1 and 50")
+    return memprofile.start(frames)
+
+
+@app.post("/admin/memory/stop")
+def stop_memory_profiling(current_user: models.User = Depends(get_current_user)):
+    """
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: The profiler status after tracing was stopped.
+    """
+    check_if_admin(current_user)
+    return memprofile.stop()
+
+
+@app.get("/admin/memory/status")
+def read_memory_status(current_user: models.User = Depends(get_current_user)):
+    """
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: Whether tracing is active, traced memory and process RSS.
+    """
+    check_if_admin(current_user)
+    return memprofile.status()
+
+
+@app.post("/admin/memory/snapshot")
+def take_memory_snapshot(limit: int = 20, group_by: str = "lineno",
+                         current_user: models.User = Depends(get_current_user)):
+    """
+    :param limit: Maximum number of allocation sites returned.
+    :param group_by: How allocations are grouped: "lineno", "filename" or "traceback".
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: The top allocation sites, diffed against the previous snapshot when there is one.
+    """
+    check_if_admin(current_user)
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    try:
+        return memprofile.take_snapshot(limit=limit, group_by=group_by)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/admin/memory/objects")
+def read_orm_object_counts(current_user: models.User = Depends(get_current_user)):
+    """
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: The number of live instances per ORM model class.
+    """
+    check_if_admin(current_user)
+    return memprofile.orm_object_counts()
+
+
+# ---------------- Routes for Admin Sales Reports ---------------- #
+
+def _report_range(start: Optional[date], end: Optional[date]):
+    """
+    :param start: Requested first day, defaults to 30 days before end.
+    :param end: Requested last day, defaults to today.
+    :return: The validated (start, end) pair.
+    """
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=30)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+
+@app.get("/admin/reports/sales/daily", response_model=schemas.SalesReport)
+def read_daily_sales(start: Optional[date] = None, end: Optional[date] = None, db: Session = Depends(get_db),
+                     current_user: models.User = Depends(get_current_user)):
+    """
+    :param start: First day of the report (inclusive), defaults to 30 days ago.
+    :param end: Last day of the report (inclusive), defaults to today.
+    :param db: Database session dependency.
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: Orders and revenue per day, read from the sales rollups only.
+    """
+    check_if_admin(current_user)
+    start, end = _report_range(start, end)
+    return {"start": start, "end": end, "as_of": rollups.get_rollup_freshness(db),
+            "days": rollups.get_daily_sales(db, start, end)}
+
+
+@app.get("/admin/reports/sales/cards", response_model=schemas.SalesReport)
+def read_card_sales(start: Optional[date] = None, end: Optional[date] = None, limit: int = 20,
+                    db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """
+    :param start: First day of the report (inclusive), defaults to 30 days ago.
+    :param end: Last day of the report (inclusive), defaults to today.
+    :param limit: The maximum number of cards returned (1-100).
+    :param db: Database session dependency.
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: The best selling cards of the range by revenue, read from the sales rollups only.
+    """
+    check_if_admin(current_user)
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    start, end = _report_range(start, end)
+    return {"start": start, "end": end, "as_of": rollups.get_rollup_freshness(db),
+            "cards": rollups.get_top_cards(db, start, end, limit)}
+
+
+@app.get("/admin/reports/pricing", response_model=List[schemas.PricingInsight])
+def read_pricing_insights(card_id: Optional[int] = None, limit: int = 50, db: Session = Depends(get_db),
+                          current_user: models.User = Depends(get_current_user)):
+    """
+    :param card_id: Only return the insights of this card.
+    :param limit: The maximum number of cards returned (1-100).
+    :param db: Database session dependency.
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: Pricing insights of the best selling cards by revenue, recomputed only when new orders arrived.
+    """
+    check_if_admin(current_user)
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    # NumPy is only imported by the first report, not when a worker boots
+    from backend.app import pricing
+    insights = pricing.get_pricing_insights(db)
+    if card_id is not None:
+        insights = [insight for insight in insights if insight["card_id"] == card_id]
+    return insights[:limit]
+
+
+# ---------------- Routes for Admin Job Queue ---------------- #
+
+@app.get("/admin/jobs", response_model=schemas.JobQueueStats)
+def read_job_queue(window_hours: float = 1.0, db: Session = Depends(get_db),
+                   current_user: models.User = Depends(get_current_user)):
+    """
+    :param window_hours: Latencies are computed over the jobs finished within this many hours.
+    :param db: Database session dependency.
+    :param current_user: The currently authenticated user, must be an admin.
+    :return: Queue depth and job latency per job type.
+    """
+    check_if_admin(current_user)
+    if not 0 < window_hours <= 24 * 7:
+        raise HTTPException(status_code=400, detail="window_hours must be between 0 and 168")
+    return jobs.queue_stats(db, window_hours)
@@ -0,0 +1,136 @@
+import gc
+import os
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from backend.app.database import Base
+
+# Allocations made by the profiler itself would otherwise dominate the diffs
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+_lock = threading.Lock()
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def is_tracing() -> bool:
+    """
+    :return: True if tracemalloc is currently recording allocations.
+    """
+    return tracemalloc.is_tracing()
+
+
+def start(frames: int = 10) -> dict:
+    """
+    Starts recording allocations. Nothing is traced, and nothing costs anything, until this is called.
+
+    :param frames: Number of stack frames stored per allocation; more frames give better attribution but cost more.
+    :return: The profiler status.
+    """
+    global _previous_snapshot
+    with _lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _previous_snapshot = None
+    return status()
+
+
+def stop() -> dict:
+    """
+    Stops recording allocations and releases every stored snapshot and trace.
+
+    :return: The profiler status.
+    """
+    global _previous_snapshot
+    with _lock:
+        _previous_snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+    return status()
+
+
+def status() -> dict:
+    """
+    :return: Whether allocations are being traced, the traced memory and the process resident set size.
+    """
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "rss_bytes": rss_bytes(),
+    }
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    :return: The resident set size of the process, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def take_snapshot(limit: int = 20, group_by: str = "lineno") -> dict:
+    """
+    Takes a snapshot and returns the top allocation sites. The first snapshot after start() reports
+    absolute sizes; every later one reports the growth since the previous snapshot.
+
+    :param limit: Maximum number of allocation sites returned.
+    :param group_by: "lineno", "filename" or "traceback".
+    :return: A dictionary with the comparison mode and the top allocation sites.
+    :raises RuntimeError: If tracing has not been started.
+    """
+    global _previous_snapshot
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("Memory tracing is not started")
+
+    with _lock:
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        previous, _previous_snapshot = _previous_snapshot, snapshot
+
+    if previous is None:
+        stats = snapshot.statistics(group_by)[:limit]
+        sites = [{
+            "location": _format_traceback(stat.traceback),
+            "size_bytes": stat.size,
+            "count": stat.count,
+        } for stat in stats]
+        return {"compared_to_previous": False, "sites": sites}
+
+    stats = snapshot.compare_to(previous, group_by)[:limit]
+    sites = [{
+        "location": _format_traceback(stat.traceback),
+        "size_bytes": stat.size,
+        "size_diff_bytes": stat.size_diff,
+        "count": stat.count,
+        "count_diff": stat.count_diff,
+    } for stat in stats]
+    return {"compared_to_previous": True, "sites": sites}
+
+
+def _format_traceback(tb: tracemalloc.Traceback) -> list:
+    return [f"{frame.filename}:{frame.lineno}" for frame in tb]
+
+
+def orm_object_counts() -> dict:
+    """
+    Counts the live instances of every ORM model class, e.g. rows held by session identity maps
+    or by cached response graphs. Walks the whole heap, so it is only run on demand.
+
+    :return: A mapping of model class name to number of live instances.
+    """
+    model_classes = {mapper.class_ for mapper in Base.registry.mappers}
+    counts = Counter()
+    for obj in gc.get_objects():
+        cls = type(obj)
+        if cls in model_classes:
+            counts[cls.__name__] += 1
+    return {cls.__name__: counts.get(cls.__name__, 0) for cls in sorted(model_classes, key=lambda c: c.__name__)}
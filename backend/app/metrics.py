@@ -0,0 +1,233 @@
+import threading
+from bisect import bisect_left
+from typing import Dict, Tuple
+
+
+class _Metric:
+    """
+    Base class for metrics kept in the process-wide registry.
+
+    :param name: Metric name in Prometheus format, e.g. "event_loop_lag_seconds".
+    :param documentation: One line help text shown in the exposition output.
+    :param label_names: Names of the labels the metric is partitioned by.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def _format_labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing value.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        :param amount: Amount to add, must be non-negative.
+        :param labels: Label values identifying the series.
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """
+        :param labels: Label values identifying the series.
+        :return: The current value of the series.
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield f"{self.name}_total{self._format_labels(key)}", value
+
+
+class Gauge(_Metric):
+    """
+    A value that can go up and down.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        """
+        :param value: New value of the series.
+        :param labels: Label values identifying the series.
+        :return: None
+        """
+        self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        """
+        :param labels: Label values identifying the series.
+        :return: The current value of the series.
+        """
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in list(self._values.items()):
+            yield f"{self.name}{self._format_labels(key)}", value
+
+
+class TopCounter(_Metric):
+    """
+    Counts events by a key of unbounded cardinality, keeping only the heaviest keys. The last label is the key;
+    for each combination of the other labels at most `capacity` keys are kept with the space-saving algorithm:
+    a new key replaces the smallest one and starts from its count, so the value of a key is an upper bound,
+    overestimated by at most the smallest value kept. Exposed as a gauge since replaced keys disappear.
+
+    :param capacity: Keys kept per combination of the other labels.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), capacity: int = 20):
+        super().__init__(name, documentation, label_names)
+        self.capacity = capacity
+        self._groups: Dict[tuple, Dict[str, float]] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        :param amount: Amount to add, must be non-negative.
+        :param labels: Label values identifying the series, the key last.
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts = self._groups.setdefault(key[:-1], {})
+            if key[-1] in counts:
+                counts[key[-1]] += amount
+            elif len(counts) < self.capacity:
+                counts[key[-1]] = amount
+            else:
+                smallest = min(counts, key=counts.get)
+                counts[key[-1]] = counts.pop(smallest) + amount
+
+    def get(self, **labels) -> float:
+        """
+        :param labels: Label values identifying the series, the key last.
+        :return: The count of the key, 0 if it is not among the kept ones.
+        """
+        key = self._key(labels)
+        return self._groups.get(key[:-1], {}).get(key[-1], 0)
+
+    def samples(self):
+        for group, counts in list(self._groups.items()):
+            for item, value in list(counts.items()):
+                yield f"{self.name}{self._format_labels(group + (item,))}", value
+
+
+class Histogram(_Metric):
+    """
+    Counts observations into cumulative buckets, in the Prometheus histogram format.
+
+    :param buckets: Sorted upper bounds of the buckets; +Inf is implied.
+    """
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        :param value: The observed value, e.g. a duration in seconds.
+        :param labels: Label values identifying the series.
+        :return: None
+        """
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # one slot per bucket plus +Inf, then the running sum
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        """
+        :param labels: Label values identifying the series.
+        :return: Number of observations recorded for the series.
+        """
+        series = self._series.get(self._key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def total(self, **labels) -> float:
+        """
+        :param labels: Label values identifying the series.
+        :return: Sum of all observations recorded for the series.
+        """
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0.0
+
+    def samples(self):
+        for key, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le_label = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                yield f"{self.name}_bucket{self._format_labels(key, le_label)}", cumulative
+            yield f"{self.name}_sum{self._format_labels(key)}", series[-1]
+            yield f"{self.name}_count{self._format_labels(key)}", cumulative
+
+
+class Registry:
+    """
+    Holds every metric of the process and renders them in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        """
+        :param metric: The metric to add.
+        :return: None
+        :raises ValueError: If a metric with the same name is already registered.
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        :return: All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, value in metric.samples():
+                lines.append(f"{sample_name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
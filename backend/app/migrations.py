@@ -0,0 +1,232 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import Column, Integer, MetaData, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from backend.app import models
+from backend.app.database import engine as default_engine
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Create and migrate the schema at boot when it is behind; for development only, production migrates out-of-band
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") == "1"
+
+_metadata = MetaData()
+schema_version = Table("schema_version", _metadata, Column("version", Integer, nullable=False))
+
+
+def _add_column_if_missing(conn: Connection, table: str, column_ddl: str):
+    """
+    :param conn: Connection the migration runs on.
+    :param table: Name of the table to alter.
+    :param column_ddl: Column definition, e.g. "rating_count INTEGER NOT NULL DEFAULT 0".
+    :return: None
+    """
+    column_name = column_ddl.split()[0]
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    if column_name not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column_ddl}"))
+
+
+def _create_model_indexes(conn: Connection, model, *names: str):
+    """
+    Creates the named indexes declared on a model, unless the table has them already. A migration names the
+    indexes it adds instead of creating all of the model's: later ones may cover columns it does not have yet.
+
+    :param conn: Connection the migration runs on.
+    :param model: The ORM model declaring the indexes.
+    :param names: Names of the indexes to create.
+    :return: None
+    """
+    indexes = {index.name: index for index in model.__table__.indexes}
+    for name in names:
+        indexes[name].create(bind=conn, checkfirst=True)
+
+
+def _create_model_tables(conn: Connection, *model_classes):
+    """
+    :param conn: Connection the migration runs on.
+    :param model_classes: ORM models whose tables (and indexes) are created if missing.
+    :return: None
+    """
+    for model in model_classes:
+        model.__table__.create(bind=conn, checkfirst=True)
+
+
+# --------------------- Migrations --------------------- #
+
+def _001_card_rating_aggregates(conn: Connection):
+    for column_ddl in (
+        "rating_count INTEGER NOT NULL DEFAULT 0",
+        "rating_sum INTEGER NOT NULL DEFAULT 0",
+        "rating_avg FLOAT",
+        "rating_hist_1 INTEGER NOT NULL DEFAULT 0",
+        "rating_hist_2 INTEGER NOT NULL DEFAULT 0",
+        "rating_hist_3 INTEGER NOT NULL DEFAULT 0",
+        "rating_hist_4 INTEGER NOT NULL DEFAULT 0",
+        "rating_hist_5 INTEGER NOT NULL DEFAULT 0",
+    ):
+        _add_column_if_missing(conn, "cards", column_ddl)
+    _create_model_indexes(conn, models.Card, "ix_cards_rating_avg")
+
+    from backend.app.ratings import recompute_card_ratings
+    session = Session(bind=conn)
+    recompute_card_ratings(session)
+    session.close()
+
+
+def _002_user_reputation_aggregates(conn: Connection):
+    for column_ddl in (
+        "reputation_count INTEGER NOT NULL DEFAULT 0",
+        "reputation_sum INTEGER NOT NULL DEFAULT 0",
+        "reputation_weight FLOAT NOT NULL DEFAULT 0",
+        "reputation_weighted_sum FLOAT NOT NULL DEFAULT 0",
+    ):
+        _add_column_if_missing(conn, "users", column_ddl)
+    _create_model_indexes(conn, models.UserReview, "ix_user_reviews_reviewed_user_created",
+                          "ix_user_reviews_reviewer_created")
+
+    from backend.app.ratings import recompute_user_reputations
+    session = Session(bind=conn)
+    recompute_user_reputations(session)
+    session.close()
+
+
+def _003_review_feed_indexes(conn: Connection):
+    _create_model_indexes(conn, models.Review, "ix_reviews_card_created", "ix_reviews_card_rating_created")
+
+
+def _004_order_history_indexes(conn: Connection):
+    _create_model_indexes(conn, models.Order, "ix_orders_user_created")
+    _create_model_indexes(conn, models.OrderItem, "ix_order_items_order_id", "ix_order_items_card_id")
+
+
+def _005_sales_rollups(conn: Connection):
+    _create_model_tables(conn, models.SalesDaily, models.CardSalesDaily, models.RollupWatermark)
+
+
+def _006_card_recommendations(conn: Connection):
+    _create_model_tables(conn, models.CardCooccurrence, models.CardRelated)
+
+    from backend.app.recommendations import rebuild_recommendations
+    session = Session(bind=conn)
+    rebuild_recommendations(session, workers=1)
+    session.close()
+
+
+def _007_card_image_hashes(conn: Connection):
+    _add_column_if_missing(conn, "cards", "image_ahash VARCHAR(16)")
+    _add_column_if_missing(conn, "cards", "image_phash VARCHAR(16)")
+    _create_model_indexes(conn, models.Card, "ix_cards_image_phash")
+
+
+def _008_job_queue(conn: Connection):
+    _create_model_tables(conn, models.Job)
+
+
+def _009_revoked_tokens(conn: Connection):
+    _create_model_tables(conn, models.RevokedToken)
+
+
+def _010_card_created_at(conn: Connection):
+    _add_column_if_missing(conn, "cards", "created_at TIMESTAMP")
+    _create_model_indexes(conn, models.Card, "ix_cards_created_at")
+
+
+def _011_order_archive(conn: Connection):
+    _create_model_tables(conn, models.ArchivedOrder, models.ArchivedOrderItem)
+
+
+# Ordered list of (version, description, migration). Never edit or reorder a released entry, append new ones.
+MIGRATIONS = [
+    (1, "Denormalized rating aggregates on cards", _001_card_rating_aggregates),
+    (2, "Reputation aggregates on users, feedback pagination indexes", _002_user_reputation_aggregates),
+    (3, "Review feed indexes on reviews(card_id, created_at)", _003_review_feed_indexes),
+    (4, "Order history index on orders(user_id, created_at DESC), order_items FK indexes", _004_order_history_indexes),
+    (5, "Sales rollup tables and their watermarks", _005_sales_rollups),
+    (6, "Card co-occurrence matrix and top-K related cards", _006_card_recommendations),
+    # Existing images are hashed out-of-band: python -m backend.app.duplicates
+    (7, "Perceptual image hashes on cards", _007_card_image_hashes),
+    (8, "Durable background job queue", _008_job_queue),
+    (9, "Revoked refresh tokens and token families", _009_revoked_tokens),
+    # Cards listed before have no listing time; they sort last by recency
+    (10, "Listing time on cards", _010_card_created_at),
+    # Partitioned by month on PostgreSQL; the archiver creates the partitions as it moves orders in
+    (11, "Archive tables for old orders and their items", _011_order_archive),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> int:
+    """
+    :param conn: An open database connection.
+    :return: The version the database schema is at, 0 if it was never migrated.
+    """
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(select(schema_version.c.version)).scalar() or 0
+
+
+def run_migrations(engine: Engine = default_engine) -> int:
+    """
+    Applies every migration newer than the database's schema version, each in its own transaction,
+    recording the new version after each one.
+
+    :param engine: The engine of the database to migrate.
+    :return: The schema version after migrating.
+    """
+    with engine.begin() as conn:
+        _metadata.create_all(bind=conn)
+        if conn.execute(select(schema_version.c.version)).first() is None:
+            conn.execute(schema_version.insert().values(version=0))
+
+    version = 0
+    for version, description, migration in MIGRATIONS:
+        with engine.begin() as conn:
+            if get_schema_version(conn) >= version:
+                continue
+            logger.info("Applying migration %03d: %s", version, description)
+            migration(conn)
+            conn.execute(schema_version.update().values(version=version))
+    return version
+
+
+def check_schema(engine: Engine = default_engine) -> int:
+    """
+    Boot-time schema check: a single query for the schema version, instead of creating every table and
+    inspecting each migration on every worker start. Migrations run out-of-band with
+    ``python -m backend.app.migrations``, or here when AUTO_MIGRATE=1.
+
+    :param engine: The engine of the database.
+    :return: The schema version of the database.
+    :raises RuntimeError: If the schema is behind the code and AUTO_MIGRATE is off.
+    """
+    with engine.connect() as conn:
+        try:
+            version = conn.execute(select(schema_version.c.version)).scalar() or 0
+        except (OperationalError, ProgrammingError):
+            # No schema_version table: the database was never migrated
+            version = 0
+    if version >= LATEST_VERSION:
+        if version > LATEST_VERSION:
+            logger.warning("Database schema at version %d is newer than this code (%d)", version, LATEST_VERSION)
+        return version
+    if AUTO_MIGRATE:
+        models.Base.metadata.create_all(bind=engine)
+        return run_migrations(engine)
+    raise RuntimeError(f"Database schema at version {version}, this code needs {LATEST_VERSION}: "
+                       f"run python -m backend.app.migrations (or set AUTO_MIGRATE=1 in development)")
+
+
+if __name__ == "__main__":
+    # python -m backend.app.migrations
+    logging.basicConfig(level=logging.INFO)
+    models.Base.metadata.create_all(bind=default_engine)
+    logger.info("Database schema at version %d", run_migrations())
@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Index, Date, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from backend.app.database import Base
 
+# Reviews rate cards (and users) from 1 to 5 stars
+RATING_VALUES = range(1, 6)
+
 COMMON_FIELDS = {
     'id': Column(Integer, primary_key=True, index=True),
     'created_at': Column(DateTime, default=datetime.utcnow),
@@ -35,6 +38,13 @@ class Card(Base):
         price (Column): The price of the card.
         quantity (Column): The available quantity of the card in stock.
         image_url (Column): The URL to an image of the card; can be null.
+        rating_count (Column): Number of reviews of the card, maintained with every review write.
+        rating_sum (Column): Sum of the ratings of all reviews of the card.
+        rating_avg (Column): rating_sum / rating_count, null while the card has no reviews; indexed for sorting.
+        rating_hist_1 .. rating_hist_5 (Column): Number of reviews per star rating.
+        image_ahash (Column): 64-bit average hash of the image as 16 hex digits, null without a readable image.
+        image_phash (Column): 64-bit DCT perceptual hash of the image as 16 hex digits; indexed.
+        created_at (Column): When the card was listed, null for cards listed before it was recorded; indexed.
         order_items (relationship): A relationship to the OrderItem entity, representing items in an order.
         reviews (relationship): A relationship to the Review entity, representing reviews for the card.
     """
@@ -45,10 +55,30 @@ class Card(Base):
     price = Column(Float)
     quantity = Column(Integer)
     image_url = Column(String, nullable=True)
+    # Denormalized review aggregates, kept in step with the reviews table by backend.app.ratings
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_avg = Column(Float, nullable=True, index=True)
+    rating_hist_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_hist_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_hist_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_hist_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    rating_hist_5 = Column(Integer, nullable=False, default=0, server_default="0")
+    # Perceptual hashes of the image, for near-duplicate listing detection in backend.app.duplicates
+    image_ahash = Column(String(16), nullable=True)
+    image_phash = Column(String(16), nullable=True, index=True)
+    created_at = Column(DateTime, nullable=True, default=datetime.utcnow, index=True)
     # Relationships
     order_items = relationship("OrderItem", back_populates="card")
     reviews = relationship("Review", back_populates="card")
 
+    @property
+    def rating_histogram(self):
+        """
+        :return: The number of reviews per star rating, from 1 star to 5 stars.
+        """
+        return [getattr(self, f"rating_hist_{rating}") or 0 for rating in RATING_VALUES]
+
 
 class User(BaseModel):
     """
@@ -61,6 +91,10 @@ class User(BaseModel):
         avatar_url: URL/path to the user’s avatar image.
         is_active: Boolean attribute denoting if the user is active or not. Default is True.
         is_admin: Boolean attribute indicating if the user has admin privileges. Default is False.
+        reputation_count: Number of feedbacks (UserReview) received by the user.
+        reputation_sum: Sum of the ratings of all received feedbacks.
+        reputation_weight: Sum of the recency weights of all received feedbacks.
+        reputation_weighted_sum: Sum of rating * recency weight over all received feedbacks.
     Relationships:
         orders: A relationship to the orders placed by the user.
         reviews: A relationship to the reviews authored by the user.
@@ -74,6 +108,11 @@ class User(BaseModel):
     avatar_url = Column(String, nullable=True)  # URL/path for the user’s avatar image
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
+    # Denormalized reputation aggregates, kept in step with the user_reviews table by backend.app.ratings
+    reputation_count = Column(Integer, nullable=False, default=0, server_default="0")
+    reputation_sum = Column(Integer, nullable=False, default=0, server_default="0")
+    reputation_weight = Column(Float, nullable=False, default=0.0, server_default="0")
+    reputation_weighted_sum = Column(Float, nullable=False, default=0.0, server_default="0")
     # Relationships
     orders = relationship("Order", back_populates="user")
     reviews = relationship("Review", back_populates="user")
@@ -81,6 +120,18 @@ class User(BaseModel):
     received_reviews = relationship("UserReview", foreign_keys="UserReview.reviewed_user_id",
                                     back_populates="reviewed_user")
 
+    @property
+    def reputation(self):
+        """
+        :return: The reputation summary: number of feedbacks, mean rating and recency-weighted mean rating.
+        """
+        count = self.reputation_count or 0
+        return {
+            "count": count,
+            "mean": self.reputation_sum / count if count else None,
+            "recent_mean": self.reputation_weighted_sum / self.reputation_weight if count else None,
+        }
+
 class Order(BaseModel):
     """
     Order class represents an order in the e-commerce application.
@@ -100,6 +151,10 @@ class Order(BaseModel):
     order_items = relationship("OrderItem", back_populates="order")
 
 
+# A user's order history, newest first; also serves as the index on the user_id foreign key
+Index("ix_orders_user_created", Order.user_id, Order.created_at.desc(), Order.id.desc())
+
+
 class OrderItem(BaseModel):
     """
         Represents an item within an order, storing details such as quantity and price.
@@ -116,8 +171,8 @@ class OrderItem(BaseModel):
             card: A relationship to the Card model, providing access to the associated card.
     """
     __tablename__ = "order_items"
-    order_id = Column(Integer, ForeignKey("orders.id"))
-    card_id = Column(Integer, ForeignKey("cards.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
+    card_id = Column(Integer, ForeignKey("cards.id"), index=True)
     quantity = Column(Integer)
     price = Column(Float)
     # Relationships
@@ -125,6 +180,67 @@ class OrderItem(BaseModel):
     card = relationship("Card", back_populates="order_items")
 
 
+class ArchivedOrder(Base):
+    """
+    An order moved out of the orders table by the archiver (see archive.py), once older than the archival
+    horizon. The rows are copied as they were, ids included, and are read-only.
+
+    On PostgreSQL the table is partitioned by month of created_at, which is therefore part of the primary key.
+
+    Attributes:
+        __tablename__ (str): The name of the database table.
+        id (Column): The id the order had in the orders table.
+        created_at (Column): When the order was placed.
+        user_id (Column): ID of the user who placed the order.
+        total_price (Column): The total price of the order.
+        user (relationship): The user who placed the order.
+        order_items (relationship): The archived items of the order.
+    """
+    __tablename__ = "orders_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, primary_key=True)
+    user_id = Column(Integer)
+    total_price = Column(Float)
+    # No foreign keys: archived history outlives the rows it refers to
+    user = relationship("User", primaryjoin="foreign(ArchivedOrder.user_id) == User.id", viewonly=True)
+    order_items = relationship("ArchivedOrderItem",
+                               primaryjoin="ArchivedOrder.id == foreign(ArchivedOrderItem.order_id)", viewonly=True)
+
+
+Index("ix_orders_archive_id", ArchivedOrder.id)
+Index("ix_orders_archive_user_created", ArchivedOrder.user_id, ArchivedOrder.created_at.desc(),
+      ArchivedOrder.id.desc())
+
+
+class ArchivedOrderItem(Base):
+    """
+    An item of an archived order, moved together with it. Partitioned like ArchivedOrder on PostgreSQL.
+
+    Attributes:
+        __tablename__ (str): The name of the database table.
+        id (Column): The id the item had in the order_items table.
+        created_at (Column): When the item was added; the order's time for items that had none.
+        order_id (Column): ID of the archived order.
+        card_id (Column): ID of the ordered card.
+        quantity (Column): The quantity of the card ordered.
+        price (Column): The price of one unit of the card.
+        order (relationship): The archived order.
+        card (relationship): The ordered card.
+    """
+    __tablename__ = "order_items_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, primary_key=True)
+    order_id = Column(Integer, index=True)
+    card_id = Column(Integer, index=True)
+    quantity = Column(Integer)
+    price = Column(Float)
+    order = relationship("ArchivedOrder", primaryjoin="foreign(ArchivedOrderItem.order_id) == ArchivedOrder.id",
+                         viewonly=True)
+    card = relationship("Card", primaryjoin="foreign(ArchivedOrderItem.card_id) == Card.id", viewonly=True)
+
+
 class Review(BaseModel):
     """
         Review model class representing user reviews for cards.
@@ -148,6 +264,11 @@ class Review(BaseModel):
             Relationship to the Card model. Indicates the card being reviewed.
     """
     __tablename__ = "reviews"
+    __table_args__ = (
+        # Keyset pagination of a card's review feed, by recency and by rating
+        Index("ix_reviews_card_created", "card_id", "created_at", "id"),
+        Index("ix_reviews_card_rating_created", "card_id", "rating", "created_at", "id"),
+    )
     user_id = Column(Integer, ForeignKey("users.id"))
     card_id = Column(Integer, ForeignKey("cards.id"))
     rating = Column(Integer)
@@ -187,6 +308,11 @@ class UserReview(BaseModel):
                            access to reviews received by a particular user.
     """
     __tablename__ = "user_reviews"
+    __table_args__ = (
+        # Keyset pagination of a user's received and given feedback, newest first
+        Index("ix_user_reviews_reviewed_user_created", "reviewed_user_id", "created_at", "id"),
+        Index("ix_user_reviews_reviewer_created", "reviewer_id", "created_at", "id"),
+    )
     reviewed_user_id = Column(Integer, ForeignKey("users.id"))
     rating = Column(Integer)
     comment = Column(String, nullable=True)
@@ -196,3 +322,139 @@ class UserReview(BaseModel):
     reviewer = relationship("User", foreign_keys="UserReview.reviewer_id", back_populates="given_reviews")
     reviewed_user = relationship("User", foreign_keys="UserReview.reviewed_user_id",
                                  back_populates="received_reviews")
+
+
+class SalesDaily(Base):
+    """
+    Rollup of orders per calendar day (UTC), maintained by backend.app.rollups.
+
+    Attributes:
+        day (Column): The day the orders were placed on; primary key.
+        orders (Column): Number of orders placed that day.
+        revenue (Column): Sum of the total price of those orders.
+    """
+    __tablename__ = "sales_daily"
+    day = Column(Date, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class CardSalesDaily(Base):
+    """
+    Rollup of order items per card and calendar day (UTC), maintained by backend.app.rollups.
+
+    Attributes:
+        day (Column): The day the items were ordered on.
+        card_id (Column): The card that was sold.
+        units (Column): Number of units of the card sold that day.
+        revenue (Column): Sum of price * quantity of those items.
+    """
+    __tablename__ = "card_sales_daily"
+    day = Column(Date, primary_key=True)
+    card_id = Column(Integer, primary_key=True, index=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class RollupWatermark(Base):
+    """
+    Highest source row id already folded into a rollup, so each compaction only reads newer rows.
+
+    Attributes:
+        name (Column): The rollup the watermark belongs to; primary key.
+        last_id (Column): ID of the last source row included in the rollup.
+        updated_at (Column): When the rollup was last compacted.
+    """
+    __tablename__ = "rollup_watermarks"
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+
+
+class CardCooccurrence(Base):
+    """
+    Sparse card x card co-occurrence matrix: in how many orders two cards were bought together.
+    Every pair is stored in both directions, maintained by backend.app.recommendations.
+
+    Attributes:
+        card_id (Column): The card the row belongs to.
+        other_card_id (Column): A card bought in the same orders.
+        orders (Column): Number of orders containing both cards.
+    """
+    __tablename__ = "card_cooccurrence"
+    __table_args__ = (
+        # Top-K neighbours of a card without sorting its whole row
+        Index("ix_card_cooccurrence_card_orders", "card_id", "orders", "other_card_id"),
+    )
+    card_id = Column(Integer, primary_key=True)
+    other_card_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+
+
+class CardRelated(Base):
+    """
+    Precomputed top-K "frequently bought together" neighbours per card, read by /store/card/{id}/related.
+
+    Attributes:
+        card_id (Column): The card the neighbours belong to.
+        rank (Column): Position of the neighbour, 0 being the most frequently bought together.
+        related_card_id (Column): The neighbour.
+        orders (Column): Number of orders containing both cards.
+    """
+    __tablename__ = "card_related"
+    card_id = Column(Integer, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    related_card_id = Column(Integer, nullable=False)
+    orders = Column(Integer, nullable=False)
+
+
+class Job(Base):
+    """
+    A unit of deferred work in the durable job queue run by backend.app.jobs.
+
+    Attributes:
+        id (Column): The primary key of the job.
+        type (Column): Name of the registered handler that runs the job.
+        payload (Column): JSON encoded arguments of the handler.
+        status (Column): "queued", "running", "done" or "failed".
+        attempts (Column): Number of times the job was started.
+        max_attempts (Column): Attempts after which a failing job is given up.
+        run_at (Column): Earliest time the job may (re)start; pushed back after each failure.
+        locked_until (Column): Visibility timeout of a running job; once past, another worker may reclaim it.
+        created_at (Column): When the job was enqueued.
+        started_at (Column): When the latest attempt started.
+        finished_at (Column): When the job completed or was given up.
+        last_error (Column): Error of the latest failed attempt.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Claiming scans the due jobs of one type in run_at order
+        Index("ix_jobs_type_status_run_at", "type", "status", "run_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False, default="{}")
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+
+class RevokedToken(Base):
+    """
+    A refresh token id (jti), or a whole token family, that may no longer be used; see backend.app.revocation.
+
+    Attributes:
+        token_id (Column): The jti of a rotated or revoked refresh token, or "family:<id>" for a revoked login session.
+        expires_at (Column): When every token the row refers to has expired; the row can be purged after that.
+        created_at (Column): When the token was revoked; indexed so workers can load the revocations they missed.
+    """
+    __tablename__ = "revoked_tokens"
+    token_id = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from backend.app.metrics import Counter, Gauge, Histogram
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEBUG = os.getenv("DEBUG", "").lower() in ("1", "true", "yes")
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+# A callback holding the loop for longer than this is reported as blocking
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))
+LOOP_MONITOR_DEBUG = os.getenv("LOOP_MONITOR_DEBUG", str(DEBUG)).lower() in ("1", "true", "yes")
+
+loop_lag_seconds = Gauge("event_loop_lag_seconds", "Delay of the most recent event loop probe.")
+loop_lag_max_seconds = Gauge("event_loop_lag_max_seconds", "Largest event loop probe delay since start.")
+loop_lag_histogram = Histogram("event_loop_lag_distribution_seconds", "Distribution of event loop probe delays.",
+                               buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+loop_blocked = Counter("event_loop_blocked", "Number of times the loop was blocked past LOOP_BLOCK_THRESHOLD.")
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag by scheduling a probe every ``interval`` seconds and recording how late
+    it wakes up. With ``debug`` enabled a watchdog thread also samples the stack of the loop thread
+    whenever the loop stops making progress for longer than ``threshold``, pointing at the exact
+    blocking call (sync DB access, file writes, ...).
+
+    :param interval: Seconds between lag probes.
+    :param threshold: Lag in seconds above which the loop counts as blocked.
+    :param debug: Whether to run the stack-capturing watchdog.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_BLOCK_THRESHOLD,
+                 debug: bool = LOOP_MONITOR_DEBUG):
+        self.interval = interval
+        self.threshold = threshold
+        self.debug = debug
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+
+    def start(self):
+        """
+        Starts the probe on the running loop, and the watchdog thread in debug mode.
+
+        :return: None
+        """
+        if self._task is not None:
+            return
+        self._stopped.clear()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self):
+        """
+        Cancels the probe and stops the watchdog.
+
+        :return: None
+        """
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        # In debug mode the probe doubles as the watchdog heartbeat, so it must tick faster than the threshold
+        interval = min(self.interval, self.threshold / 2) if self.debug else self.interval
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - expected)
+            self._last_beat = time.monotonic()
+            loop_lag_seconds.set(lag)
+            loop_lag_histogram.observe(lag)
+            if lag > loop_lag_max_seconds.get():
+                loop_lag_max_seconds.set(lag)
+            if lag > self.threshold:
+                loop_blocked.inc()
+                if not self.debug:
+                    logger.warning("Event loop was blocked for %.3fs", lag)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat
+            # One report per stall: the same heartbeat stays stale until the loop recovers
+            if stalled > self.threshold + self.threshold / 2 and beat != reported_beat:
+                reported_beat = beat
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                stack = "".join(traceback.format_stack(frame))
+                logger.warning("Event loop blocked for at least %.3fs, loop thread stack:\n%s", stalled, stack)
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,118 @@
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+# Whether the request being handled asked for MessagePack; set by NegotiatedRoute, read by NegotiatedResponse.
+# Context variables are copied into the thread pool, so sync routes see it too.
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+def wants_msgpack(accept: str) -> bool:
+    """
+    :param accept: The Accept header of the request.
+    :return: Whether MessagePack is preferred over JSON; JSON wins ties, e.g. with "*/*".
+    """
+    msgpack_quality = json_quality = 0.0
+    for item in accept.lower().split(","):
+        media_type, _, params = item.strip().partition(";")
+        media_type = media_type.strip()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if media_type in _MSGPACK_TYPES:
+            msgpack_quality = max(msgpack_quality, quality)
+        elif media_type == "application/json":
+            json_quality = max(json_quality, quality)
+    return msgpack_quality > 0 and msgpack_quality > json_quality
+
+
+def prefers_msgpack() -> bool:
+    """
+    :return: Whether the request being handled asked for MessagePack, for routes that hold pre-encoded JSON.
+    """
+    return _wants_msgpack.get()
+
+
+def _encode_default(value):
+    # Same text as the JSON representation, so both formats decode to equal data
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+
+def packb(content) -> bytes:
+    """
+    :param content: Plain data, as emitted by the compiled serializers.
+    :return: The MessagePack encoding of the data.
+    """
+    import msgpack
+    return msgpack.packb(content, default=_encode_default, use_bin_type=True, datetime=False)
+
+
+class NegotiatedResponse(ORJSONResponse):
+    """
+    Default response class of the app: JSON encoded with orjson, or MessagePack when the request's Accept
+    header prefers it. The data is encoded as given, so routes returning the plain data of the compiled
+    serializers are encoded straight to either format.
+    """
+
+    def __init__(self, content=None, *args, **kwargs):
+        if _wants_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, *args, **kwargs)
+        self.headers.setdefault("vary", "Accept")
+
+    def render(self, content) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return packb(content)
+        return super().render(content)
+
+
+class MsgPackRequest(Request):
+    """
+    Request whose MessagePack body is parsed in place of a JSON one.
+    """
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            import msgpack
+            self._json = msgpack.unpackb(await self.body(), raw=False)
+        return self._json
+
+
+class NegotiatedRoute(APIRoute):
+    """
+    Route class of the app: accepts MessagePack request bodies (Content-Type: application/msgpack) wherever
+    a JSON body is accepted, and records whether the response should be MessagePack.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type in _MSGPACK_TYPES:
+                # FastAPI only parses bodies labelled as JSON; the labelled body is then parsed by
+                # MsgPackRequest.json, so it is validated against the route's schema like a JSON one
+                scope = dict(request.scope)
+                scope["headers"] = [(name, value) for name, value in request.scope["headers"]
+                                    if name != b"content-type"] + [(b"content-type", b"application/json")]
+                request = MsgPackRequest(scope, request.receive)
+            token = _wants_msgpack.set(wants_msgpack(request.headers.get("accept", "")))
+            try:
+                return await handler(request)
+            finally:
+                _wants_msgpack.reset(token)
+
+        return negotiated_handler
@@ -0,0 +1,75 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(*values) -> str:
+    """
+    :param values: The sort key of the last row of a page, e.g. (created_at, id).
+    :return: An opaque, URL-safe cursor string pointing after that row.
+    """
+    raw = "|".join(value.isoformat() if isinstance(value, datetime) else str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    :param cursor: A cursor produced by encode_cursor.
+    :return: The raw string components of the sort key.
+    :raises HTTPException: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def decode_time_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """
+    :param cursor: A cursor produced by encode_cursor(created_at, id), or None for the first page.
+    :return: The (created_at, id) pair the next page starts after, or None.
+    :raises HTTPException: If the cursor is malformed.
+    """
+    if cursor is None:
+        return None
+    parts = decode_cursor(cursor)
+    try:
+        created_at, row_id = parts
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def decode_rating_cursor(cursor: Optional[str]) -> Optional[Tuple[int, datetime, int]]:
+    """
+    :param cursor: A cursor produced by encode_cursor(rating, created_at, id), or None for the first page.
+    :return: The (rating, created_at, id) triple the next page starts after, or None.
+    :raises HTTPException: If the cursor is malformed.
+    """
+    if cursor is None:
+        return None
+    parts = decode_cursor(cursor)
+    try:
+        rating, created_at, row_id = parts
+        return int(rating), datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_descending(time_column, id_column, created_at: datetime, row_id: int):
+    """
+    Keyset condition selecting the rows that come after (created_at, row_id) in (time, id) descending order.
+    Written as a range on the time column first so it can be served from a (..., time, id) index.
+
+    :param time_column: The timestamp column the rows are sorted by.
+    :param id_column: The primary key column used as tie breaker.
+    :param created_at: Timestamp of the last row of the previous page.
+    :param row_id: ID of the last row of the previous page.
+    :return: A SQLAlchemy boolean expression.
+    """
+    return and_(time_column <= created_at,
+                or_(time_column < created_at, id_column < row_id))
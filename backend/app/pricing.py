@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.app.models import Card, OrderItem
+
+logger = logging.getLogger(__name__)
+
+MOVING_AVERAGE_DAYS = 30
+# Weighted price quantiles used as the suggested price band
+BAND_QUANTILES = (0.25, 0.5, 0.75)
+FETCH_BATCH_SIZE = 100000
+# Above this many (card, day) cells the daily points are grouped by sorting instead of a lookup table
+DENSE_DAY_GROUPS = 50_000_000
+
+
+def _epoch_seconds_sql(dialect_name: str) -> str:
+    if dialect_name == "postgresql":
+        return "EXTRACT(EPOCH FROM created_at)"
+    return "CAST(strftime('%s', created_at) AS INTEGER)"
+
+
+def load_order_item_columns(db: Session) -> Dict[str, np.ndarray]:
+    """
+    Reads the card_id, price, quantity and created_at columns of every order item into NumPy arrays,
+    streaming the rows in batches straight from the DBAPI cursor (no ORM objects are built).
+
+    :param db: Database session.
+    :return: A dictionary of equally long arrays: card_id (int64), price (float64), quantity (float64)
+        and created (float64, seconds since the epoch).
+    """
+    connection = db.connection()
+    statement = (f"SELECT card_id, price, quantity, {_epoch_seconds_sql(connection.dialect.name)} "
+                 f"FROM order_items WHERE card_id IS NOT NULL AND price > 0 AND quantity > 0")
+    cursor = connection.exec_driver_sql(statement).cursor
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64))
+    cursor.close()
+
+    table = np.concatenate(chunks) if chunks else np.empty((0, 4), dtype=np.float64)
+    return {
+        "card_id": table[:, 0].astype(np.int64),
+        "price": table[:, 1],
+        "quantity": table[:, 2],
+        "created": np.nan_to_num(table[:, 3]),
+    }
+
+
+def _group_slope(groups: np.ndarray, x: np.ndarray, y: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+    """
+    Weighted least-squares slope of y on x for every group at once.
+
+    :return: One slope per group, NaN where x does not vary within the group.
+    """
+    w = np.bincount(groups, weights=weights, minlength=size)
+    sx = np.bincount(groups, weights=weights * x, minlength=size)
+    sy = np.bincount(groups, weights=weights * y, minlength=size)
+    sxx = np.bincount(groups, weights=weights * x * x, minlength=size)
+    sxy = np.bincount(groups, weights=weights * x * y, minlength=size)
+    denominator = w * sxx - sx * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (w * sxy - sx * sy) / denominator
+    slope[~(np.abs(denominator) > 1e-12 * np.maximum(w * sxx, 1e-300))] = np.nan
+    return slope
+
+
+def _group_weighted_quantiles(groups: np.ndarray, price: np.ndarray, weights: np.ndarray, size: int,
+                              quantiles=BAND_QUANTILES) -> np.ndarray:
+    """
+    Weighted price quantiles for every group at once, without a Python loop over groups.
+
+    :return: An array of shape (size, len(quantiles)).
+    """
+    # Collapse the rows to distinct (group, price in cents) pairs; np.unique returns them sorted by
+    # group, then price, which is all the ordering the quantiles need.
+    cents = np.rint(price * 100).astype(np.int64)
+    span = int(cents.max()) + 1
+    keys, inverse = np.unique(groups * span + cents, return_inverse=True)
+    pair_weights = np.bincount(inverse, weights=weights)
+    pair_groups = keys // span
+    pair_prices = (keys % span) / 100.0
+
+    totals = np.bincount(pair_groups, weights=pair_weights, minlength=size)
+    cumulative = np.cumsum(pair_weights)
+    group_starts = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+    fraction = (cumulative - group_starts[pair_groups]) / totals[pair_groups]
+    # 2 * group + fraction increases monotonically across the pairs, so one searchsorted per quantile
+    # finds, for every group, the first price whose cumulative weight reaches the quantile.
+    search_keys = 2.0 * pair_groups + fraction
+    result = np.empty((size, len(quantiles)))
+    for column, quantile in enumerate(quantiles):
+        positions = np.searchsorted(search_keys, 2.0 * np.arange(size) + quantile - 1e-9)
+        result[:, column] = pair_prices[np.minimum(positions, len(pair_prices) - 1)]
+    return result
+
+
+def _group_days(groups: np.ndarray, day: np.ndarray, size: int):
+    """
+    :return: A (card, day) group index per row and the card group of every (card, day) group.
+    """
+    day = day - day.min()
+    days = int(day.max()) + 1
+    keys = groups * days + day
+    if size * days <= DENSE_DAY_GROUPS:
+        present = np.flatnonzero(np.bincount(keys, minlength=size * days))
+        lookup = np.zeros(size * days, dtype=np.int64)
+        lookup[present] = np.arange(len(present))
+        return lookup[keys], present // days
+    present, inverse = np.unique(keys, return_inverse=True)
+    return inverse, present // days
+
+
+def compute_insights(card_id: np.ndarray, price: np.ndarray, quantity: np.ndarray, created: np.ndarray,
+                     stock: Dict[int, int], now: Optional[float] = None) -> list:
+    """
+    Computes per-card pricing insights from order item columns, fully vectorized.
+
+    :param card_id: Card of every order item.
+    :param price: Unit price of every order item.
+    :param quantity: Units of every order item.
+    :param created: Creation time of every order item, in seconds since the epoch.
+    :param stock: Current stock per card id, used for the sell-through rate.
+    :param now: Reference time for the moving average, defaults to the current time.
+    :return: One dictionary per card that sold at least once.
+    """
+    if len(card_id) == 0:
+        return []
+    now = time.time() if now is None else now
+
+    # Card ids are dense enough to index a lookup table, which avoids sorting them
+    cards = np.flatnonzero(np.bincount(card_id))
+    lookup = np.zeros(int(cards[-1]) + 1, dtype=np.int64)
+    lookup[cards] = np.arange(len(cards))
+    groups = lookup[card_id]
+    size = len(cards)
+    revenue = price * quantity
+
+    units = np.bincount(groups, weights=quantity, minlength=size)
+    total_revenue = np.bincount(groups, weights=revenue, minlength=size)
+    average_price = total_revenue / units
+
+    recent = created >= now - MOVING_AVERAGE_DAYS * 86400
+    recent_units = np.bincount(groups, weights=quantity * recent, minlength=size)
+    recent_revenue = np.bincount(groups, weights=revenue * recent, minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moving_average = np.where(recent_units > 0, recent_revenue / recent_units, np.nan)
+
+    stock_left = np.array([max(stock.get(int(card), 0) or 0, 0) for card in cards], dtype=np.float64)
+    sell_through = units / (units + stock_left)
+
+    # Elasticity: slope of log(daily units) on log(daily average price), one point per card and day
+    day_groups, day_cards = _group_days(groups, (created // 86400).astype(np.int64), size)
+    day_units = np.bincount(day_groups, weights=quantity)
+    day_price = np.bincount(day_groups, weights=revenue) / day_units
+    elasticity = _group_slope(day_cards, np.log(day_price), np.log(day_units), np.ones_like(day_units), size)
+
+    bands = _group_weighted_quantiles(groups, price, quantity, size)
+
+    insights = []
+    for index in range(size):
+        insights.append({
+            "card_id": int(cards[index]),
+            "units_sold": int(units[index]),
+            "revenue": float(total_revenue[index]),
+            "average_price": float(average_price[index]),
+            "moving_average_price": None if np.isnan(moving_average[index]) else float(moving_average[index]),
+            "sell_through_rate": float(sell_through[index]),
+            "price_elasticity": None if np.isnan(elasticity[index]) else float(elasticity[index]),
+            "suggested_price_low": float(bands[index, 0]),
+            "suggested_price": float(bands[index, 1]),
+            "suggested_price_high": float(bands[index, 2]),
+        })
+    return insights
+
+
+_cache_lock = threading.Lock()
+_cache_key = None
+_cache_insights: list = []
+
+
+def get_pricing_insights(db: Session) -> list:
+    """
+    Returns the pricing insights of every card, recomputing them only when order items were added or
+    removed since the last computation (checked with one aggregate query).
+
+    :param db: Database session.
+    :return: One insight dictionary per card that sold at least once, best selling first.
+    """
+    global _cache_key, _cache_insights
+    key = db.query(func.max(OrderItem.id), func.count(OrderItem.id)).one()
+    key = tuple(key)
+    if key == _cache_key:
+        return _cache_insights
+
+    with _cache_lock:
+        if key == _cache_key:
+            return _cache_insights
+        started = time.perf_counter()
+        columns = load_order_item_columns(db)
+        stock = dict(db.query(Card.id, Card.quantity).all())
+        insights = compute_insights(columns["card_id"], columns["price"], columns["quantity"],
+                                    columns["created"], stock)
+        insights.sort(key=lambda insight: insight["revenue"], reverse=True)
+        logger.info("Computed pricing insights for %d cards from %d order items in %.2fs",
+                    len(insights), len(columns["card_id"]), time.perf_counter() - started)
+        _cache_key, _cache_insights = key, insights
+    return insights
+
+
+if __name__ == "__main__":
+    # Benchmark on synthetic data: python -m backend.app.pricing [rows]
+    import sys
+
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    rng = np.random.default_rng(0)
+    now = time.time()
+    card_id = rng.integers(1, 50_000, rows)
+    price = rng.uniform(1, 100, rows).round(2)
+    quantity = rng.integers(1, 5, rows).astype(np.float64)
+    created = now - rng.uniform(0, 365 * 86400, rows)
+    stock = {card: 10 for card in range(1, 50_000)}
+
+    started = time.perf_counter()
+    result = compute_insights(card_id, price, quantity, created, stock, now)
+    print(f"{rows} order items, {len(result)} cards: {time.perf_counter() - started:.2f}s")
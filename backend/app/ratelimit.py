@@ -0,0 +1,193 @@
+import math
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request, status
+
+from backend.app.metrics import Counter
+from backend.app.tracing import start_span
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+# "" keeps the buckets in this worker's memory; "redis" shares them between workers through REDIS_URL
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Only behind a proxy that sets it: otherwise clients pick their own address with the header
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "0") == "1"
+# Buckets kept in memory before the full (idle) ones are swept
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+rate_limited = Counter("rate_limited_requests", "Requests rejected by a rate limit.", ("scope", "key"))
+
+
+def parse_rate(rate: str) -> Tuple[float, float]:
+    """
+    :param rate: A rate like "5/minute": at most 5 requests in a burst, refilled at 5 per minute.
+    :return: (capacity, tokens refilled per second).
+    """
+    count, _, period = rate.partition("/")
+    if period not in _PERIODS:
+        raise ValueError(f"Invalid rate {rate!r}, expected <count>/<second|minute|hour|day>")
+    return float(count), float(count) / _PERIODS[period]
+
+
+class MemoryStore:
+    """
+    Token buckets in the memory of this worker; each worker enforces the limits on its own share of the traffic.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [tokens, last refill time, capacity, rate]
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        return self.take_now(key, capacity, rate, cost, time.monotonic())
+
+    def take_now(self, key: str, capacity: float, rate: float, cost: float, now: float) -> float:
+        """
+        :return: 0 if the tokens were taken, else the seconds until the bucket holds enough of them.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._sweep(now)
+                bucket = self._buckets[key] = [capacity, now, capacity, rate]
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return 0.0
+            bucket[0] = tokens
+            return (cost - tokens) / rate
+
+    def _sweep(self, now: float):
+        # A bucket that has refilled completely is the same as no bucket
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[0] + (now - bucket[1]) * bucket[3] < bucket[2]}
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """
+    Token buckets in Redis, shared by every worker; the refill and take run atomically in a Lua script,
+    timed with the Redis clock. redis is imported on first use only.
+    """
+
+    _SCRIPT = """
+    local capacity, rate, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "cardshop:ratelimit:"):
+        self.url = url
+        self.prefix = prefix
+        self._script = None
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        if self._script is None:
+            import redis.asyncio as redis
+            self._script = redis.from_url(self.url).register_script(self._SCRIPT)
+        return float(await self._script(keys=[self.prefix + key], args=[capacity, rate, cost]))
+
+
+store = RedisStore() if RATE_LIMIT_BACKEND == "redis" else MemoryStore()
+
+
+def client_ip(request: Request) -> str:
+    """
+    :return: The address of the client, from X-Forwarded-For when TRUST_FORWARDED_FOR is set.
+    """
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def login_account(request: Request) -> Optional[str]:
+    """
+    :return: The username of a login form; the parsed form is cached on the request for the route.
+    """
+    username = (await request.form()).get("username")
+    return username.strip().lower() if isinstance(username, str) and username.strip() else None
+
+
+async def order_account(request: Request) -> Optional[str]:
+    """
+    :return: The user_id of an order body, None if the body is not an object with one.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    user_id = body.get("user_id") if isinstance(body, dict) else None
+    return str(user_id) if user_id is not None else None
+
+
+class RateLimit:
+    """
+    Route dependency enforcing a per-IP and an optional per-account token bucket, e.g.
+    ``dependencies=[Depends(RateLimit("login", per_ip="20/minute", per_account="5/minute", account=login_account))]``.
+    Route dependencies run before the route's own parameters, so a rejected request never opens a DB session or
+    hashes a password. Each rate can be overridden with RATE_LIMIT_<SCOPE>_IP / RATE_LIMIT_<SCOPE>_ACCOUNT.
+
+    :param scope: Name of the limit; routes sharing a scope share their buckets.
+    :param per_ip: Rate of each client address, e.g. "20/minute"; None for no per-IP limit.
+    :param per_account: Rate of each account; None for no per-account limit.
+    :param account: Coroutine function returning the account a request acts on, None when it has none.
+    """
+
+    def __init__(self, scope: str, per_ip: Optional[str] = None, per_account: Optional[str] = None,
+                 account: Optional[Callable[[Request], Awaitable[Optional[str]]]] = None):
+        self.scope = scope
+        per_ip = os.getenv(f"RATE_LIMIT_{scope.upper()}_IP", per_ip)
+        per_account = os.getenv(f"RATE_LIMIT_{scope.upper()}_ACCOUNT", per_account)
+        self.per_ip = parse_rate(per_ip) if per_ip else None
+        self.per_account = parse_rate(per_account) if per_account and account else None
+        self.account = account
+
+    async def __call__(self, request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        with start_span("auth.rate_limit", {"rate_limit.scope": self.scope}):
+            if self.per_ip:
+                await self._take("ip", client_ip(request), self.per_ip)
+            if self.per_account:
+                account = await self.account(request)
+                if account is not None:
+                    await self._take("account", account, self.per_account)
+
+    async def _take(self, kind: str, value: str, limit: Tuple[float, float]):
+        wait = await store.take(f"{self.scope}:{kind}:{value}", *limit)
+        if wait > 0:
+            rate_limited.inc(scope=self.scope, key=kind)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, try again later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
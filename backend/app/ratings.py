@@ -0,0 +1,171 @@
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from backend.app.models import Card, Review, User, UserReview, RATING_VALUES
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A feedback counts half as much towards the recent reputation every REPUTATION_HALF_LIFE_DAYS
+REPUTATION_HALF_LIFE_DAYS = float(os.getenv("REPUTATION_HALF_LIFE_DAYS", "90"))
+# Recency weights grow from this fixed epoch instead of decaying towards now, so adding or removing a
+# feedback is a plain relative UPDATE and the weighted mean never needs to be re-decayed on read.
+_REPUTATION_EPOCH = datetime(2024, 1, 1)
+
+
+def _histogram_column(rating: int):
+    return getattr(Card, f"rating_hist_{rating}")
+
+
+def apply_card_rating(db: Session, card_id: int, rating: int, sign: int = 1):
+    """
+    Adds (sign=1) or removes (sign=-1) one rating to the aggregates of a card. The update is a single
+    relative UPDATE executed in the caller's transaction, so concurrent review writes never lose counts
+    and the aggregates commit or roll back together with the review itself.
+
+    :param db: Database session whose transaction the update joins.
+    :param card_id: ID of the reviewed card.
+    :param rating: Star rating of the review being added or removed.
+    :param sign: 1 when a review is created, -1 when it is deleted.
+    :return: None
+    """
+    if rating not in RATING_VALUES:
+        # Reviews written before ratings were validated may be out of range; like recompute_card_ratings,
+        # the aggregates leave them out
+        return
+    new_count = Card.rating_count + sign
+    new_sum = Card.rating_sum + sign * rating
+    db.query(Card).filter(Card.id == card_id).update({
+        Card.rating_count: new_count,
+        Card.rating_sum: new_sum,
+        _histogram_column(rating): _histogram_column(rating) + sign,
+        # the right-hand sides see the pre-update row, so the average is computed from the new totals
+        Card.rating_avg: case((new_count > 0, new_sum * 1.0 / new_count), else_=None),
+    }, synchronize_session=False)
+
+
+def recompute_card_ratings(db: Session, card_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Rebuilds the rating aggregates from the reviews table with one GROUP BY pass, repairing any drift.
+
+    :param db: Database session used for the recompute; committed on success.
+    :param card_ids: Optional subset of cards to repair; all cards when omitted.
+    :return: Number of cards that have at least one review.
+    """
+    card_ids = list(card_ids) if card_ids is not None else None
+
+    reset = {Card.rating_count: 0, Card.rating_sum: 0, Card.rating_avg: None}
+    reset.update({_histogram_column(rating): 0 for rating in RATING_VALUES})
+    reset_query = db.query(Card)
+    if card_ids is not None:
+        reset_query = reset_query.filter(Card.id.in_(card_ids))
+    reset_query.update(reset, synchronize_session=False)
+
+    grouped = db.query(Review.card_id, Review.rating, func.count(Review.id)).group_by(Review.card_id, Review.rating)
+    if card_ids is not None:
+        grouped = grouped.filter(Review.card_id.in_(card_ids))
+
+    aggregates = defaultdict(lambda: {"rating_count": 0, "rating_sum": 0})
+    for card_id, rating, count in grouped:
+        if card_id is None or rating not in RATING_VALUES:
+            continue
+        row = aggregates[card_id]
+        row["id"] = card_id
+        row["rating_count"] += count
+        row["rating_sum"] += rating * count
+        row[f"rating_hist_{rating}"] = count
+
+    for row in aggregates.values():
+        row["rating_avg"] = row["rating_sum"] / row["rating_count"]
+
+    db.bulk_update_mappings(Card, list(aggregates.values()))
+    db.commit()
+    return len(aggregates)
+
+
+# --------------------- Seller reputation (UserReview) --------------------- #
+
+def recency_weight(created_at: Optional[datetime]) -> float:
+    """
+    :param created_at: Creation time of a feedback.
+    :return: The weight of the feedback in the recent reputation mean, doubling every half-life after the epoch.
+    """
+    age_days = ((created_at or datetime.utcnow()) - _REPUTATION_EPOCH).total_seconds() / 86400
+    return 2.0 ** (age_days / REPUTATION_HALF_LIFE_DAYS)
+
+
+def apply_user_rating(db: Session, user_id: int, rating: int, created_at: Optional[datetime], sign: int = 1):
+    """
+    Adds (sign=1) or removes (sign=-1) one feedback to the reputation aggregates of the reviewed user,
+    as a single relative UPDATE in the caller's transaction.
+
+    :param db: Database session whose transaction the update joins.
+    :param user_id: ID of the reviewed user.
+    :param rating: Rating of the feedback being added or removed.
+    :param created_at: Creation time of the feedback, which determines its recency weight.
+    :param sign: 1 when a feedback is created, -1 when it is deleted.
+    :return: None
+    """
+    weight = recency_weight(created_at)
+    db.query(User).filter(User.id == user_id).update({
+        User.reputation_count: User.reputation_count + sign,
+        User.reputation_sum: User.reputation_sum + sign * rating,
+        User.reputation_weight: User.reputation_weight + sign * weight,
+        User.reputation_weighted_sum: User.reputation_weighted_sum + sign * weight * rating,
+    }, synchronize_session=False)
+
+
+def recompute_user_reputations(db: Session, batch_size: int = 10000) -> int:
+    """
+    Rebuilds the reputation aggregates of every user from the user_reviews table in one streaming pass.
+
+    :param db: Database session used for the recompute; committed on success.
+    :param batch_size: Number of feedback rows fetched per round trip.
+    :return: Number of users that received at least one feedback.
+    """
+    db.query(User).update({
+        User.reputation_count: 0,
+        User.reputation_sum: 0,
+        User.reputation_weight: 0.0,
+        User.reputation_weighted_sum: 0.0,
+    }, synchronize_session=False)
+
+    aggregates = {}
+    rows = db.query(UserReview.reviewed_user_id, UserReview.rating, UserReview.created_at).yield_per(batch_size)
+    for user_id, rating, created_at in rows:
+        if user_id is None or rating is None:
+            continue
+        row = aggregates.setdefault(user_id, {"id": user_id, "reputation_count": 0, "reputation_sum": 0,
+                                              "reputation_weight": 0.0, "reputation_weighted_sum": 0.0})
+        weight = recency_weight(created_at)
+        row["reputation_count"] += 1
+        row["reputation_sum"] += rating
+        row["reputation_weight"] += weight
+        row["reputation_weighted_sum"] += weight * rating
+
+    db.bulk_update_mappings(User, list(aggregates.values()))
+    db.commit()
+    return len(aggregates)
+
+
+if __name__ == "__main__":
+    # Repair job: python -m backend.app.ratings
+    from backend.app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        repaired = recompute_card_ratings(session)
+        logger.info("Recomputed rating aggregates for %d reviewed cards", repaired)
+        repaired = recompute_user_reputations(session)
+        logger.info("Recomputed reputation aggregates for %d reviewed users", repaired)
+    finally:
+        session.close()
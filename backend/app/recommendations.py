@@ -0,0 +1,207 @@
+import heapq
+import logging
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, groupby
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+
+from backend.app.models import ArchivedOrderItem, Card, CardCooccurrence, CardRelated, OrderItem
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RELATED_TOP_K = int(os.getenv("RELATED_TOP_K", "10"))
+# Orders with more distinct cards than this (bulk buys, store restocks) say little about which cards
+# go together and would add a quadratic number of pairs, so they are left out of the matrix.
+MAX_BASKET_SIZE = int(os.getenv("RECOMMENDATION_MAX_BASKET_SIZE", "50"))
+REBUILD_WORKERS = int(os.getenv("RECOMMENDATION_REBUILD_WORKERS", str(os.cpu_count() or 1)))
+_INSERT_BATCH_SIZE = 10000
+
+
+def _bump_pair(db: Session, card_id: int, other_card_id: int, sign: int):
+    """
+    Adds sign to one direction of a pair with a relative UPDATE, inserting the pair if it is new.
+    """
+    updated = (db.query(CardCooccurrence)
+               .filter(CardCooccurrence.card_id == card_id, CardCooccurrence.other_card_id == other_card_id)
+               .update({CardCooccurrence.orders: CardCooccurrence.orders + sign}, synchronize_session=False))
+    if not updated and sign > 0:
+        db.add(CardCooccurrence(card_id=card_id, other_card_id=other_card_id, orders=sign))
+
+
+def refresh_related(db: Session, card_ids: Iterable[int]):
+    """
+    Recomputes the precomputed top-K neighbours of some cards from the co-occurrence matrix,
+    each one with a single range scan of ix_card_cooccurrence_card_orders.
+
+    :param db: Database session whose transaction the update joins.
+    :param card_ids: IDs of the cards whose neighbours changed.
+    :return: None
+    """
+    card_ids = list(card_ids)
+    if not card_ids:
+        return
+    db.flush()
+    (db.query(CardCooccurrence)
+     .filter(CardCooccurrence.card_id.in_(card_ids), CardCooccurrence.orders <= 0)
+     .delete(synchronize_session=False))
+    db.query(CardRelated).filter(CardRelated.card_id.in_(card_ids)).delete(synchronize_session=False)
+    for card_id in card_ids:
+        neighbours = (db.query(CardCooccurrence.other_card_id, CardCooccurrence.orders)
+                      .filter(CardCooccurrence.card_id == card_id)
+                      .order_by(CardCooccurrence.orders.desc(), CardCooccurrence.other_card_id.desc())
+                      .limit(RELATED_TOP_K).all())
+        db.add_all([CardRelated(card_id=card_id, rank=rank, related_card_id=other_card_id, orders=orders)
+                    for rank, (other_card_id, orders) in enumerate(neighbours)])
+
+
+def apply_order_item(db: Session, order_id: Optional[int], card_id: Optional[int], sign: int = 1,
+                     exclude_item_id: Optional[int] = None):
+    """
+    Adds (sign=1) or removes (sign=-1) one order item to the co-occurrence matrix and refreshes the
+    top-K neighbours it affects, in the caller's transaction. A card counts once per order, so an item
+    of a card the order already contains changes nothing. Like the full rebuild, an order with more than
+    MAX_BASKET_SIZE distinct cards counts no pairs at all: the item crossing the limit takes the pairs of
+    the order's other cards out of the matrix, removing it puts them back.
+
+    :param db: Database session whose transaction the update joins.
+    :param order_id: Order of the item.
+    :param card_id: Card of the item.
+    :param sign: 1 when the item is created, -1 when it is deleted.
+    :param exclude_item_id: ID of the item itself if it is still in the table (deletes).
+    :return: None
+    """
+    if order_id is None or card_id is None:
+        return
+    query = db.query(OrderItem.card_id).filter(OrderItem.order_id == order_id, OrderItem.card_id.isnot(None))
+    if exclude_item_id is not None:
+        query = query.filter(OrderItem.id != exclude_item_id)
+    basket = {row.card_id for row in query}
+    if card_id in basket or len(basket) > MAX_BASKET_SIZE:
+        return
+
+    if len(basket) < MAX_BASKET_SIZE:
+        pairs, pair_sign = [(card_id, other_card_id) for other_card_id in basket], sign
+    else:
+        pairs, pair_sign = list(combinations(sorted(basket), 2)), -sign
+    for first, second in pairs:
+        _bump_pair(db, first, second, pair_sign)
+        _bump_pair(db, second, first, pair_sign)
+    refresh_related(db, [card_id, *basket])
+
+
+def get_related_cards(db: Session, card_id: int, limit: int = RELATED_TOP_K) -> list:
+    """
+    :param db: Database session.
+    :param card_id: The card whose neighbours are returned.
+    :param limit: Maximum number of neighbours returned.
+    :return: (orders, Card) rows of the cards most frequently bought together with the card.
+    """
+    return (db.query(CardRelated.orders, Card)
+            .join(Card, Card.id == CardRelated.related_card_id)
+            .filter(CardRelated.card_id == card_id)
+            .order_by(CardRelated.rank)
+            .limit(limit).all())
+
+
+# --------------------- Full rebuild --------------------- #
+
+def _count_pairs(baskets: List[List[int]]) -> Counter:
+    """
+    Counts the co-occurring pairs of a chunk of baskets; runs in a worker process.
+
+    :param baskets: Distinct card ids of each order, sorted.
+    :return: Number of orders per (smaller card id, larger card id) pair.
+    """
+    counts = Counter()
+    for basket in baskets:
+        counts.update(combinations(basket, 2))
+    return counts
+
+
+def _load_baskets(db: Session) -> List[List[int]]:
+    # Archived orders keep counting; all items of an order are in the same one of the two tables
+    hot, archived = (select(model.order_id, model.card_id)
+                     .where(model.order_id.isnot(None), model.card_id.isnot(None)).distinct()
+                     for model in (OrderItem, ArchivedOrderItem))
+    baskets_query = union_all(hot, archived).subquery()
+    rows = (db.query(baskets_query.c.order_id, baskets_query.c.card_id)
+            .order_by(baskets_query.c.order_id, baskets_query.c.card_id)
+            .yield_per(_INSERT_BATCH_SIZE))
+    baskets = []
+    for _, items in groupby(rows, key=lambda row: row[0]):
+        basket = [card_id for _, card_id in items]
+        if 1 < len(basket) <= MAX_BASKET_SIZE:
+            baskets.append(basket)
+    return baskets
+
+
+def _insert_in_batches(db: Session, model, rows: Iterable[dict]):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= _INSERT_BATCH_SIZE:
+            db.bulk_insert_mappings(model, batch)
+            batch = []
+    if batch:
+        db.bulk_insert_mappings(model, batch)
+
+
+def rebuild_recommendations(db: Session, workers: int = REBUILD_WORKERS) -> int:
+    """
+    Rebuilds the co-occurrence matrix and the top-K tables from all order items. Pair counting is
+    split into chunks of orders counted in parallel by a process pool, then merged.
+
+    :param db: Database session used for the rebuild; committed on success.
+    :param workers: Number of worker processes, 1 counts in this process.
+    :return: Number of distinct co-occurring pairs.
+    """
+    baskets = _load_baskets(db)
+    if workers > 1 and len(baskets) > workers:
+        chunk_size = -(-len(baskets) // (workers * 4))
+        chunks = [baskets[start:start + chunk_size] for start in range(0, len(baskets), chunk_size)]
+        counts = Counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(_count_pairs, chunks):
+                counts.update(partial)
+    else:
+        counts = _count_pairs(baskets)
+
+    neighbours = defaultdict(list)
+    for (card_id, other_card_id), orders in counts.items():
+        neighbours[card_id].append((orders, other_card_id))
+        neighbours[other_card_id].append((orders, card_id))
+
+    db.query(CardCooccurrence).delete(synchronize_session=False)
+    db.query(CardRelated).delete(synchronize_session=False)
+    _insert_in_batches(db, CardCooccurrence, (
+        {"card_id": card_id, "other_card_id": other_card_id, "orders": orders}
+        for card_id, pairs in neighbours.items() for orders, other_card_id in pairs))
+    # Same order as the range scan of refresh_related: most orders first, then highest card id
+    _insert_in_batches(db, CardRelated, (
+        {"card_id": card_id, "rank": rank, "related_card_id": other_card_id, "orders": orders}
+        for card_id, pairs in neighbours.items()
+        for rank, (orders, other_card_id) in enumerate(heapq.nlargest(RELATED_TOP_K, pairs))))
+    db.commit()
+    return len(counts)
+
+
+if __name__ == "__main__":
+    # Rebuild job: python -m backend.app.recommendations [workers]
+    import sys
+
+    from backend.app.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        pairs = rebuild_recommendations(session, int(sys.argv[1]) if len(sys.argv) > 1 else REBUILD_WORKERS)
+        logger.info("Rebuilt recommendations from %d co-occurring card pairs", pairs)
+    finally:
+        session.close()
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.app.metrics import Counter
+from backend.app.models import RevokedToken
+from backend.app.tracing import traced
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Revocations expected per day of token expiry, and the false positive rate of the filter at that load.
+# The defaults take 1.8 MB per day, at most REFRESH_TOKEN_EXPIRE_DAYS + 1 days are live at once.
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "1000000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+# How often a worker loads the revocations made by the other workers
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+REVOCATION_PURGE_SECONDS = float(os.getenv("REVOCATION_PURGE_SECONDS", "3600"))
+# A revocation is stamped before its transaction commits, so a row can become visible after rows stamped later,
+# or come from a worker whose clock is behind: every sync re-reads this many seconds before its watermark
+REVOCATION_SYNC_OVERLAP_SECONDS = float(os.getenv("REVOCATION_SYNC_OVERLAP_SECONDS", "60"))
+
+revocation_checks = Counter("revocation_checks", "Token revocation checks, by how they were answered.", ("result",))
+
+
+def family_key(family: str) -> str:
+    """
+    :param family: The family id shared by all tokens of one login session.
+    :return: The token_id under which the revocation of the whole family is recorded.
+    """
+    return f"family:{family}"
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: no false negatives, about error_rate false positives at capacity.
+    The bit positions come from one blake2b digest with double hashing.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    """
+    Set of revoked token ids with a constant-time negative answer. The exact set is the revoked_tokens table;
+    in front of it, every worker keeps one Bloom filter per day of token expiry. A lookup checks the filters
+    of the days not yet past and only queries the table when one of them may hold the id, so checking a token
+    that was never revoked (almost all of them) costs a few hashes and no query. A day's filter is dropped
+    once every token filed under it has expired, so the filters never fill up with dead entries.
+    """
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filters: Dict[int, BloomFilter] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._synced_at = 0.0
+        self._purged_at = time.monotonic()
+        self._watermark = datetime.min
+
+    def _add(self, token_id: str, expires_at: datetime):
+        day = expires_at.toordinal()
+        bloom = self._filters.get(day)
+        if bloom is None:
+            bloom = self._filters[day] = BloomFilter(self.capacity, self.error_rate)
+        bloom.add(token_id)
+
+    def _sync(self, db: Session):
+        """
+        Loads the revocations recorded since the last sync, by this or any other worker, and drops expired filters.
+        The rows of the overlap window before the watermark are loaded again, which adding to a filter allows.
+        """
+        now = datetime.utcnow()
+        overlap = timedelta(seconds=REVOCATION_SYNC_OVERLAP_SECONDS)
+        since = max(self._watermark, datetime.min + overlap) - overlap
+        rows = (db.query(RevokedToken.token_id, RevokedToken.expires_at, RevokedToken.created_at)
+                .filter(RevokedToken.created_at >= since, RevokedToken.expires_at > now)
+                .yield_per(10000))
+        with self._lock:
+            for token_id, expires_at, created_at in rows:
+                self._add(token_id, expires_at)
+                self._watermark = max(self._watermark, created_at)
+            today = now.toordinal()
+            for day in [day for day in self._filters if day < today]:
+                del self._filters[day]
+            self._loaded = True
+            self._synced_at = time.monotonic()
+        if time.monotonic() - self._purged_at >= REVOCATION_PURGE_SECONDS:
+            self._purged_at = time.monotonic()
+            purged = db.query(RevokedToken).filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+            db.commit()
+            logger.info("Purged %d expired token revocations", purged)
+
+    @traced("auth.is_revoked")
+    def is_revoked(self, db: Session, token_id: str, exact: bool = False) -> bool:
+        """
+        :param db: Database session.
+        :param token_id: A jti, or the family_key of a token family.
+        :param exact: Skip the filters and query the table, for checks that must see the revocations made by
+            other workers in the last REVOCATION_SYNC_SECONDS.
+        :return: Whether the id was revoked.
+        """
+        if not exact:
+            if not self._loaded or time.monotonic() - self._synced_at >= REVOCATION_SYNC_SECONDS:
+                self._sync(db)
+            today = datetime.utcnow().toordinal()
+            with self._lock:
+                maybe = any(token_id in bloom for day, bloom in self._filters.items() if day >= today)
+            if not maybe:
+                revocation_checks.inc(result="filtered")
+                return False
+        revoked = db.query(RevokedToken.token_id).filter(RevokedToken.token_id == token_id).first() is not None
+        revocation_checks.inc(result="revoked" if revoked else ("queried" if exact else "false_positive"))
+        return revoked
+
+    @traced("auth.revoke")
+    def revoke(self, db: Session, token_id: str, expires_at: datetime) -> bool:
+        """
+        Records the revocation of a token id. The insert is atomic, so when two requests race to revoke (rotate)
+        the same token, exactly one of them succeeds.
+
+        :param db: Database session; committed here.
+        :param token_id: A jti, or the family_key of a token family.
+        :param expires_at: When every token the id refers to has expired.
+        :return: True if the id was revoked now, False if it already was.
+        """
+        db.add(RevokedToken(token_id=token_id, expires_at=expires_at))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return False
+        with self._lock:
+            self._add(token_id, expires_at)
+        return True
+
+
+revocations = RevocationStore()
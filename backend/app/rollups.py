@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.database import SessionLocal
+from backend.app.models import (ArchivedOrder, ArchivedOrderItem, Card, CardSalesDaily, Order, OrderItem,
+                               RollupWatermark, SalesDaily)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "50000"))
+# Rows younger than this are left for the next run, so transactions still in flight are not skipped
+ROLLUP_GRACE_SECONDS = float(os.getenv("ROLLUP_GRACE_SECONDS", "5"))
+
+SALES_DAILY = "sales_daily"
+CARD_SALES_DAILY = "card_sales_daily"
+
+
+def _watermark(db: Session, name: str) -> int:
+    """
+    :param db: Database session.
+    :param name: Name of the rollup.
+    :return: ID of the last source row already folded into the rollup.
+    """
+    watermark = db.query(RollupWatermark).filter(RollupWatermark.name == name).first()
+    if watermark is None:
+        db.add(RollupWatermark(name=name, last_id=0))
+        db.flush()
+        return 0
+    return watermark.last_id
+
+
+def _advance_watermark(db: Session, name: str, old_id: int, new_id: int) -> bool:
+    """
+    Moves a watermark forward only if nobody else moved it since it was read, so two workers
+    compacting at the same time cannot both fold in the same rows.
+
+    :param db: Database session whose transaction also holds the rollup changes.
+    :param name: Name of the rollup.
+    :param old_id: The watermark value the batch was read from.
+    :param new_id: ID of the last row of the batch.
+    :return: True if the watermark was advanced.
+    """
+    updated = (db.query(RollupWatermark)
+               .filter(RollupWatermark.name == name, RollupWatermark.last_id == old_id)
+               .update({RollupWatermark.last_id: new_id, RollupWatermark.updated_at: datetime.utcnow()},
+                       synchronize_session=False))
+    return updated == 1
+
+
+def _settled(rows: list, cutoff: datetime) -> list:
+    """
+    :param rows: Source rows ordered by id, each starting with (id, created_at).
+    :param cutoff: Rows created at or after this time are not folded in yet.
+    :return: The leading rows created before the cutoff.
+    """
+    for position, row in enumerate(rows):
+        if row[1] is not None and row[1] >= cutoff:
+            return rows[:position]
+    return rows
+
+
+def _fold_orders(db: Session, rows: list, cutoff: datetime):
+    """
+    Adds (id, created_at, total_price) order rows to the daily sales rollup, in the caller's transaction.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for _, created_at, total_price in rows:
+        delta = deltas[(created_at or cutoff).date()]
+        delta[0] += 1
+        delta[1] += total_price or 0.0
+
+    existing = {row.day: row for row in db.query(SalesDaily).filter(SalesDaily.day.in_(list(deltas)))}
+    for day, (orders, revenue) in deltas.items():
+        row = existing.get(day)
+        if row is None:
+            db.add(SalesDaily(day=day, orders=orders, revenue=revenue))
+        else:
+            row.orders += orders
+            row.revenue += revenue
+
+
+def _fold_order_items(db: Session, rows: list, cutoff: datetime):
+    """
+    Adds (id, created_at, card_id, quantity, price) order item rows to the daily card sales rollup, in the
+    caller's transaction.
+    """
+    deltas = defaultdict(lambda: [0, 0.0])
+    for _, created_at, card_id, quantity, price in rows:
+        if card_id is None:
+            continue
+        delta = deltas[((created_at or cutoff).date(), card_id)]
+        delta[0] += quantity or 0
+        delta[1] += (quantity or 0) * (price or 0.0)
+
+    days = {day for day, _ in deltas}
+    card_ids = {card_id for _, card_id in deltas}
+    existing = {(row.day, row.card_id): row for row in db.query(CardSalesDaily)
+                .filter(CardSalesDaily.day.in_(days), CardSalesDaily.card_id.in_(card_ids))}
+    for (day, card_id), (units, revenue) in deltas.items():
+        row = existing.get((day, card_id))
+        if row is None:
+            db.add(CardSalesDaily(day=day, card_id=card_id, units=units, revenue=revenue))
+        else:
+            row.units += units
+            row.revenue += revenue
+
+
+def _compact_orders(db: Session, batch_size: int, cutoff: datetime) -> int:
+    last_id = _watermark(db, SALES_DAILY)
+    rows = _settled(db.query(Order.id, Order.created_at, Order.total_price)
+                    .filter(Order.id > last_id).order_by(Order.id).limit(batch_size).all(), cutoff)
+    if not rows:
+        return 0
+
+    _fold_orders(db, rows, cutoff)
+    if not _advance_watermark(db, SALES_DAILY, last_id, rows[-1][0]):
+        db.rollback()
+        return 0
+    db.commit()
+    return len(rows)
+
+
+def _compact_order_items(db: Session, batch_size: int, cutoff: datetime) -> int:
+    last_id = _watermark(db, CARD_SALES_DAILY)
+    rows = _settled(db.query(OrderItem.id, OrderItem.created_at, OrderItem.card_id, OrderItem.quantity, OrderItem.price)
+                    .filter(OrderItem.id > last_id).order_by(OrderItem.id).limit(batch_size).all(), cutoff)
+    if not rows:
+        return 0
+
+    _fold_order_items(db, rows, cutoff)
+    if not _advance_watermark(db, CARD_SALES_DAILY, last_id, rows[-1][0]):
+        db.rollback()
+        return 0
+    db.commit()
+    return len(rows)
+
+
+def compact_sales(db: Session, batch_size: int = ROLLUP_BATCH_SIZE) -> dict:
+    """
+    Folds every order and order item newer than the rollup watermarks into the daily rollups,
+    in batches of ``batch_size`` rows, each batch in its own transaction.
+
+    :param db: Database session used for the compaction.
+    :param batch_size: Maximum number of source rows read per transaction.
+    :return: The number of orders and order items folded in.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=ROLLUP_GRACE_SECONDS)
+    folded = {"orders": 0, "order_items": 0}
+    for key, compact in (("orders", _compact_orders), ("order_items", _compact_order_items)):
+        while True:
+            count = compact(db, batch_size, cutoff)
+            folded[key] += count
+            if count < batch_size:
+                break
+    return folded
+
+
+def rebuild_sales_rollups(db: Session, batch_size: int = ROLLUP_BATCH_SIZE) -> dict:
+    """
+    Drops the rollups and rebuilds them from scratch, e.g. after orders were edited or deleted, from the
+    archived orders and the hot ones.
+
+    :param db: Database session used for the rebuild.
+    :param batch_size: Maximum number of source rows read per transaction.
+    :return: The number of orders and order items folded in.
+    """
+    db.query(SalesDaily).delete(synchronize_session=False)
+    db.query(CardSalesDaily).delete(synchronize_session=False)
+    db.query(RollupWatermark).filter(RollupWatermark.name.in_((SALES_DAILY, CARD_SALES_DAILY))).delete(
+        synchronize_session=False)
+    db.commit()
+    # The compaction only reads the hot tables, so the archived orders are folded in here. The archiver only
+    # moves orders below the watermarks, which were just reset, so none moves while this runs.
+    archived = {"orders": 0, "order_items": 0}
+    cutoff = datetime.utcnow()
+    for key, fold, columns in (
+            ("orders", _fold_orders, (ArchivedOrder.id, ArchivedOrder.created_at, ArchivedOrder.total_price)),
+            ("order_items", _fold_order_items, (ArchivedOrderItem.id, ArchivedOrderItem.created_at,
+                                                ArchivedOrderItem.card_id, ArchivedOrderItem.quantity,
+                                                ArchivedOrderItem.price))):
+        last_id = 0
+        while True:
+            rows = db.query(*columns).filter(columns[0] > last_id).order_by(columns[0]).limit(batch_size).all()
+            if not rows:
+                break
+            fold(db, rows, cutoff)
+            db.commit()
+            archived[key] += len(rows)
+            last_id = rows[-1][0]
+    folded = compact_sales(db, batch_size)
+    return {key: folded[key] + archived[key] for key in folded}
+
+
+def compact_sales_in_new_session() -> dict:
+    """
+    :return: The result of compact_sales, run in a session of its own.
+    """
+    db = SessionLocal()
+    try:
+        return compact_sales(db)
+    finally:
+        db.close()
+
+
+async def compaction_loop(interval: float = ROLLUP_INTERVAL_SECONDS):
+    """
+    Compacts the sales rollups every ``interval`` seconds until cancelled.
+
+    :param interval: Seconds between two compactions.
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            folded = await run_in_threadpool(compact_sales_in_new_session)
+            if folded["orders"] or folded["order_items"]:
+                logger.info("Compacted %(orders)d orders and %(order_items)d order items into sales rollups", folded)
+        except Exception:
+            logger.exception("Sales rollup compaction failed")
+
+
+# --------------------- Reports (read the rollups only) --------------------- #
+
+def get_daily_sales(db: Session, start: date, end: date) -> list:
+    """
+    :param db: Database session.
+    :param start: First day of the report, inclusive.
+    :param end: Last day of the report, inclusive.
+    :return: SalesDaily rows of the range, oldest first.
+    """
+    return (db.query(SalesDaily)
+            .filter(SalesDaily.day >= start, SalesDaily.day <= end)
+            .order_by(SalesDaily.day).all())
+
+
+def get_top_cards(db: Session, start: date, end: date, limit: int = 20) -> list:
+    """
+    :param db: Database session.
+    :param start: First day of the report, inclusive.
+    :param end: Last day of the report, inclusive.
+    :param limit: Maximum number of cards returned.
+    :return: (card_id, name, units, revenue) rows for the best selling cards of the range, by revenue.
+    """
+    revenue = func.sum(CardSalesDaily.revenue).label("revenue")
+    return (db.query(CardSalesDaily.card_id, Card.name, func.sum(CardSalesDaily.units).label("units"), revenue)
+            .outerjoin(Card, Card.id == CardSalesDaily.card_id)
+            .filter(CardSalesDaily.day >= start, CardSalesDaily.day <= end)
+            .group_by(CardSalesDaily.card_id, Card.name)
+            .order_by(revenue.desc())
+            .limit(limit).all())
+
+
+def get_rollup_freshness(db: Session) -> Optional[datetime]:
+    """
+    :param db: Database session.
+    :return: When the rollups were last compacted, None if they never were.
+    """
+    return db.query(func.min(RollupWatermark.updated_at)).filter(
+        RollupWatermark.name.in_((SALES_DAILY, CARD_SALES_DAILY))).scalar()
+
+
+if __name__ == "__main__":
+    # Compaction job: python -m backend.app.rollups [--rebuild]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        result = rebuild_sales_rollups(session) if "--rebuild" in sys.argv else compact_sales(session)
+        logger.info("Folded %(orders)d orders and %(order_items)d order items into sales rollups", result)
+    finally:
+        session.close()
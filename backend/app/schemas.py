@@ -1,5 +1,5 @@
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel, EmailStr, constr, conint
 
 
@@ -63,18 +63,111 @@ class CardCreate(BaseModel):
 
 class CardRead(CardBase, BaseSchema):
     """
-    Represents a card entity with associated order items and reviews.
+    Represents a card entity with its associated order items and review aggregates. The reviews
+    themselves are served page by page from /store/card/{card_id}/reviews.
 
     Attributes:
         id (int): Unique identifier for the card.
-        order_items (Optional[List['OrderItemRead']]): List of order items associated with the card.
-        reviews (Optional[List['ReviewRead']]): List of reviews associated with the card.
+        order_items (Optional[List['OrderItemSummary']]): List of order items associated with the card.
         image_url (str): URL for the image of the card.
+        rating_count (int): Number of reviews of the card.
+        rating_avg (Optional[float]): Average rating, None while the card has no reviews.
+        rating_histogram (List[int]): Number of reviews per star rating, from 1 to 5 stars.
     """
     id: int
-    order_items: Optional[List['OrderItemRead']] = []
-    reviews: Optional[List['ReviewRead']] = []
+    order_items: Optional[List['OrderItemSummary']] = []
     image_url: str = None
+    rating_count: int = 0
+    rating_avg: Optional[float] = None
+    rating_histogram: List[int] = []
+
+
+class CartCardRead(BaseModel):
+    """
+    The fields of a card a shopping cart needs to revalidate its items.
+
+    Attributes:
+        id (int): Unique identifier of the card.
+        name (str): Current name of the card.
+        price (float): Current price of the card.
+        quantity (int): Number of units currently in stock.
+        image_url (Optional[str]): URL for the image of the card.
+    """
+    id: int
+    name: str
+    price: float
+    quantity: int
+    image_url: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class CartCardBatch(BaseModel):
+    """
+    Result of a batch card lookup.
+
+    Attributes:
+        items (List[CartCardRead]): The cards found, in the order their ids were requested.
+        missing (List[int]): Requested ids of cards that do not exist (any more).
+    """
+    items: List[CartCardRead] = []
+    missing: List[int] = []
+
+
+class HomeRead(BaseModel):
+    """
+    Everything the home page needs before its first paint, in one response.
+
+    Attributes:
+        featured (List[CardRead]): The featured cards: the best rated cards in stock.
+        user (Optional[HomeUserSummary]): The authenticated user; None for anonymous requests or invalid tokens.
+        cart (Optional[CartCardBatch]): Current price and stock of the requested cart cards; None if no ids
+            were passed.
+    """
+    featured: List['CardRead'] = []
+    user: Optional['HomeUserSummary'] = None
+    cart: Optional[CartCardBatch] = None
+
+
+class RelatedCardRead(BaseModel):
+    """
+    A card frequently bought together with another one.
+
+    Attributes:
+        id (int): Unique identifier of the related card.
+        name (str): Name of the related card.
+        price (float): Price of the related card.
+        quantity (int): Number of units in stock.
+        image_url (Optional[str]): URL for the image of the related card.
+        rating_avg (Optional[float]): Average rating, None while the card has no reviews.
+        bought_together (int): Number of orders containing both cards.
+    """
+    id: int
+    name: str
+    price: float
+    quantity: int
+    image_url: Optional[str] = None
+    rating_avg: Optional[float] = None
+    bought_together: int
+
+
+class DuplicateCardRead(BaseModel):
+    """
+    A listing whose image is a near-duplicate of another listing's image.
+
+    Attributes:
+        id (int): Unique identifier of the duplicate card.
+        name (str): Name of the duplicate card.
+        price (float): Price of the duplicate card.
+        image_url (Optional[str]): URL for the image of the duplicate card.
+        distance (int): Number of differing bits between the perceptual hashes of the two images.
+    """
+    id: int
+    name: str
+    price: float
+    image_url: Optional[str] = None
+    distance: int
 
 
 # User Schema
@@ -127,16 +220,67 @@ class UserRead(UserBase, BaseSchema):
 
         Attributes:
             id (int): The unique identifier for the user.
-            orders (Optional[List[OrderRead]]): A list of orders associated with the user.
-            reviews (Optional[List[ReviewRead]]): A list of reviews provided by the user.
-            given_feedbacks (Optional[List[UserReviewRead]]): A list of feedbacks given by the user.
-            received_feedbacks (Optional[List[UserReviewRead]]): A list of feedbacks received by the user.
+            orders (Optional[List[OrderSummary]]): A list of orders associated with the user.
+            reviews (Optional[List[ReviewSummary]]): A list of reviews provided by the user.
+            reputation (ReputationRead): Aggregated feedback received by the user. The feedback itself is
+                served page by page from /users/{user_id}/feedback.
     """
     id: int
-    orders: Optional[List['OrderRead']] = []
-    reviews: Optional[List['ReviewRead']] = []
-    given_feedbacks: Optional[List['UserReviewRead']] = []
-    received_feedbacks: Optional[List['UserReviewRead']] = []
+    orders: Optional[List['OrderSummary']] = []
+    reviews: Optional[List['ReviewSummary']] = []
+    reputation: 'ReputationRead'
+
+
+class UserSummary(BaseModel):
+    """
+    The public identity of a user, embedded where a full UserRead would be too heavy.
+
+    Attributes:
+        id (int): The unique identifier for the user.
+        username (str): The username of the user.
+        avatar_url (Optional[str]): URL/path to the user’s avatar image.
+    """
+    id: int
+    username: str
+    avatar_url: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class HomeUserSummary(BaseModel):
+    """
+    The authenticated user as the home page shows it; orders and reviews are left to /me.
+
+    Attributes:
+        id (int): The unique identifier for the user.
+        username (str): The username of the user.
+        email (EmailStr): The email address of the user.
+        is_admin (bool): Indicates if the user has administrative privileges.
+        reputation (ReputationRead): Aggregated feedback received by the user.
+    """
+    id: int
+    username: str
+    email: EmailStr
+    is_admin: bool = False
+    reputation: 'ReputationRead'
+
+    class Config:
+        orm_mode = True
+
+
+class ReputationRead(BaseModel):
+    """
+    Constant-size summary of the feedback a user received.
+
+    Attributes:
+        count (int): Number of feedbacks received.
+        mean (Optional[float]): Mean rating over all feedbacks, None without feedback.
+        recent_mean (Optional[float]): Mean rating weighted towards recent feedbacks, None without feedback.
+    """
+    count: int = 0
+    mean: Optional[float] = None
+    recent_mean: Optional[float] = None
 
 #User Login Schema
 class UserLogin(BaseModel):
@@ -150,6 +294,15 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class RefreshTokenRequest(BaseModel):
+    """
+    Body of the token refresh and revocation routes.
+
+    Attributes:
+        refresh_token (str): The refresh token issued by /login/ or by the latest refresh.
+    """
+    refresh_token: str
+
 class AvatarResponse(BaseModel):
     avatar_url: Optional[str]
 
@@ -192,7 +345,7 @@ class OrderRead(OrderBase, BaseSchema):
     """
     id: int
     user: UserRead
-    order_items: Optional[List['OrderItemRead']] = []
+    order_items: Optional[List['OrderItemSummary']] = []
 
 
 # OrderItem Schema
@@ -245,6 +398,41 @@ class OrderItemRead(OrderItemBase, BaseSchema):
     card: Optional[CardRead] = None
 
 
+class OrderItemSummary(OrderItemBase, BaseSchema):
+    """
+    An order item without its nested order and card. Used where items are embedded in orders and
+    cards, since embedding OrderItemRead there would make the graph cyclic (order -> item -> order).
+
+    Attributes:
+    id (int): Unique identifier for the order item.
+    """
+    id: int
+
+
+class OrderSummary(OrderBase, BaseSchema):
+    """
+    An order with its items but without the nested user, as listed in a user's order history.
+
+    Attributes:
+    id (int): The unique identifier of the order.
+    order_items (List[OrderItemSummary]): The items of the order.
+    """
+    id: int
+    order_items: List[OrderItemSummary] = []
+
+
+class OrderHistoryPage(BaseModel):
+    """
+    One page of a user's order history, newest first.
+
+    Attributes:
+        items (List[OrderSummary]): The orders of the page, with their items.
+        next_cursor (Optional[str]): Cursor of the following page, None on the last page.
+    """
+    items: List[OrderSummary] = []
+    next_cursor: Optional[str] = None
+
+
 # Review Schema
 class ReviewBase(BaseModel):
     """
@@ -257,7 +445,8 @@ class ReviewBase(BaseModel):
         card_id : int
             The ID of the card being reviewed.
         rating : int
-            The rating given to the card.
+            The rating given to the card, in stars. New reviews give 1 to 5 (see ReviewCreate); older rows
+            may hold other values.
         comment : Optional[str], optional
             An optional comment about the card, by default None.
     """
@@ -270,8 +459,9 @@ class ReviewBase(BaseModel):
 class ReviewCreate(ReviewBase):
     """
     Class for creating a new review by inheriting from ReviewBase. This class can be used to create instances that represent new reviews in the system.
+    The rating must be from 1 to 5 stars.
     """
-    pass
+    rating: conint(ge=1, le=5)
 
 
 class ReviewRead(ReviewBase, BaseSchema):
@@ -294,6 +484,47 @@ class ReviewRead(ReviewBase, BaseSchema):
     card: CardRead
 
 
+class ReviewSummary(ReviewBase, BaseSchema):
+    """
+    A review without its nested user and card. Used where reviews are embedded in other models, since
+    embedding ReviewRead there would make the graph cyclic (user -> review -> user).
+
+    Attributes:
+    id (int): Unique identifier for the review.
+    """
+    id: int
+
+
+class CardReviewSummary(ReviewSummary):
+    """
+    A review as listed in a card's review feed: the review fields plus the public identity of its author.
+
+    Attributes:
+    user (Optional[UserSummary]): The user who wrote the review.
+    """
+    user: Optional['UserSummary'] = None
+
+
+class CardReviewPage(BaseModel):
+    """
+    One page of a card's review feed, headed by the card's precomputed rating aggregates.
+
+    Attributes:
+        card_id (int): The reviewed card.
+        rating_count (int): Number of reviews of the card.
+        rating_avg (Optional[float]): Average rating, None while the card has no reviews.
+        rating_histogram (List[int]): Number of reviews per star rating, from 1 to 5 stars.
+        items (List[CardReviewSummary]): The reviews of the page.
+        next_cursor (Optional[str]): Cursor of the following page, None on the last page.
+    """
+    card_id: int
+    rating_count: int = 0
+    rating_avg: Optional[float] = None
+    rating_histogram: List[int] = []
+    items: List[CardReviewSummary] = []
+    next_cursor: Optional[str] = None
+
+
 # UserReview Schema
 class UserReviewBase(BaseModel):
     """
@@ -344,6 +575,150 @@ class UserReviewRead(UserReviewBase, BaseSchema):
     reviewed_user: UserRead
     reviewer: UserRead
 
+class UserReviewSummary(UserReviewBase, BaseSchema):
+    """
+    A feedback as listed on a profile: the review fields plus the public identity of the reviewer.
+
+    Attributes:
+    id (int): Unique identifier for the review.
+    reviewer (UserSummary): The user who wrote the review.
+    """
+    id: int
+    reviewer: UserSummary
+
+
+class FeedbackPage(BaseModel):
+    """
+    One page of a user's feedback, newest first.
+
+    Attributes:
+        items (List[UserReviewSummary]): The feedbacks of the page.
+        next_cursor (Optional[str]): Cursor of the following page, None on the last page.
+    """
+    items: List[UserReviewSummary] = []
+    next_cursor: Optional[str] = None
+
+
+class SalesDayRead(BaseModel):
+    """
+    Orders and revenue of one day, read from the sales_daily rollup.
+
+    Attributes:
+        day (date): The day, in UTC.
+        orders (int): Number of orders placed that day.
+        revenue (float): Total price of those orders.
+    """
+    day: date
+    orders: int
+    revenue: float
+
+    class Config:
+        orm_mode = True
+
+
+class CardSalesRead(BaseModel):
+    """
+    Units sold and revenue of one card over a report range, read from the card_sales_daily rollup.
+
+    Attributes:
+        card_id (int): The card.
+        name (Optional[str]): Name of the card, None if it was deleted.
+        units (int): Number of units sold.
+        revenue (float): Sum of price * quantity of the units sold.
+    """
+    card_id: int
+    name: Optional[str] = None
+    units: int
+    revenue: float
+
+    class Config:
+        orm_mode = True
+
+
+class SalesReport(BaseModel):
+    """
+    A sales report together with how fresh the rollups it was read from are.
+
+    Attributes:
+        start (date): First day of the report.
+        end (date): Last day of the report.
+        as_of (Optional[datetime]): When the rollups were last compacted.
+        days (List[SalesDayRead]): Per-day totals, for the daily report.
+        cards (List[CardSalesRead]): Best selling cards, for the card report.
+    """
+    start: date
+    end: date
+    as_of: Optional[datetime] = None
+    days: List[SalesDayRead] = []
+    cards: List[CardSalesRead] = []
+
+
+class PricingInsight(BaseModel):
+    """
+    Pricing metrics of one card, computed from its whole order history.
+
+    Attributes:
+        card_id (int): The card.
+        units_sold (int): Number of units sold.
+        revenue (float): Sum of price * quantity of the units sold.
+        average_price (float): Average unit price paid.
+        moving_average_price (Optional[float]): Average unit price paid over the last 30 days, None without recent sales.
+        sell_through_rate (float): Units sold / (units sold + units still in stock).
+        price_elasticity (Optional[float]): Slope of log(daily units) on log(daily price), None if the price never changed.
+        suggested_price_low (float): 25th percentile of the prices paid, weighted by units.
+        suggested_price (float): Median of the prices paid, weighted by units.
+        suggested_price_high (float): 75th percentile of the prices paid, weighted by units.
+    """
+    card_id: int
+    units_sold: int
+    revenue: float
+    average_price: float
+    moving_average_price: Optional[float] = None
+    sell_through_rate: float
+    price_elasticity: Optional[float] = None
+    suggested_price_low: float
+    suggested_price: float
+    suggested_price_high: float
+
+
+class JobTypeStats(BaseModel):
+    """
+    Queue depth and latency of one job type.
+
+    Attributes:
+        type (str): Name of the job type.
+        queued (int): Jobs waiting to run, including those waiting for a retry.
+        running (int): Jobs currently claimed by a worker.
+        failed (int): Jobs given up after their last attempt.
+        due (int): Queued jobs whose start time has come.
+        oldest_due_seconds (Optional[float]): How long the oldest due job has been waiting.
+        finished (int): Jobs completed within the window.
+        wait_avg_seconds (Optional[float]): Average time from enqueueing to start of the completed jobs.
+        wait_p95_seconds (Optional[float]): 95th percentile of that time.
+        run_avg_seconds (Optional[float]): Average duration of the last attempt of the completed jobs.
+    """
+    type: str
+    queued: int = 0
+    running: int = 0
+    failed: int = 0
+    due: int = 0
+    oldest_due_seconds: Optional[float] = None
+    finished: int = 0
+    wait_avg_seconds: Optional[float] = None
+    wait_p95_seconds: Optional[float] = None
+    run_avg_seconds: Optional[float] = None
+
+
+class JobQueueStats(BaseModel):
+    """
+    Attributes:
+        as_of (datetime): When the statistics were computed.
+        types (List[JobTypeStats]): Statistics per job type.
+    """
+    as_of: datetime
+    types: List[JobTypeStats] = []
+
+
 class Token(BaseModel):
     """
     Token class is a data model representing an authentication token.
@@ -368,7 +743,12 @@ class TokenData(BaseModel):
 
 # Here is the necessary Config so you can refer to related models within the schemas
 CardRead.update_forward_refs()
+UserRead.update_forward_refs()
 OrderRead.update_forward_refs()
 OrderItemRead.update_forward_refs()
 ReviewRead.update_forward_refs()
-UserReviewRead.update_forward_refs()
\ No newline at end of file
+UserReviewRead.update_forward_refs()
+CardReviewSummary.update_forward_refs()
+CardReviewPage.update_forward_refs()
+HomeUserSummary.update_forward_refs()
+HomeRead.update_forward_refs()
\ No newline at end of file
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+from dotenv import load_dotenv
+
+from backend.app.metrics import Counter, TopCounter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# A card read is served from memory for CARD_CACHE_TTL seconds, then stale for up to CARD_CACHE_STALE_TTL more
+# while one background fetch refreshes it
+CARD_CACHE_TTL = float(os.getenv("CARD_CACHE_TTL", "1"))
+CARD_CACHE_STALE_TTL = float(os.getenv("CARD_CACHE_STALE_TTL", "30"))
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "10000"))
+# The featured cards and the per-user summaries of the home page
+HOME_CACHE_TTL = float(os.getenv("HOME_CACHE_TTL", "10"))
+HOME_CACHE_STALE_TTL = float(os.getenv("HOME_CACHE_STALE_TTL", "60"))
+HOME_CACHE_SIZE = int(os.getenv("HOME_CACHE_SIZE", "10000"))
+# Keys of each cache given a collapsed_reads series, the most collapsed ones
+COLLAPSED_READS_TOP_KEYS = int(os.getenv("COLLAPSED_READS_TOP_KEYS", "20"))
+
+# result="collapsed" counts the reads that waited for a fetch already in flight
+coalesced_reads = Counter("coalesced_reads", "Reads of coalescing caches, by how they were answered.",
+                          ("cache", "result"))
+# The same by key, for the hottest keys only: every card ever read concurrently would otherwise get a series
+collapsed_reads = TopCounter("collapsed_reads", "Reads that waited for a fetch already in flight, by key, "
+                             "for the most collapsed keys of each cache.", ("cache", "key"),
+                             capacity=COLLAPSED_READS_TOP_KEYS)
+
+
+class CoalescingCache:
+    """
+    Read-through cache in front of an expensive fetch, for keys read by many concurrent requests at once.
+
+    Concurrent misses of one key share a single in-flight fetch: the first request runs it and the others
+    await its result, so a burst of identical reads costs one query. An entry is fresh for `ttl` seconds;
+    for `stale_ttl` seconds after that it is still served as is while one background fetch replaces it.
+
+    The cache lives in the event loop of the worker. invalidate() may be called from any thread, e.g. by the
+    CRUD functions after a commit: it drops the entry and detaches any fetch in flight, whose result then
+    reaches the requests already waiting on it but is not stored.
+
+    :param name: Name of the cache in the metrics.
+    :param ttl: Seconds an entry is served without refreshing it.
+    :param stale_ttl: Seconds past the ttl an entry is still served while it is refreshed.
+    :param max_entries: Entries kept, least recently used dropped first.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float, max_entries: int):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[object, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        """
+        :param key: Identifies the value.
+        :param fetch: Coroutine function returning the current value; its exceptions reach every waiting request
+            and nothing is cached.
+        :return: The cached, shared or fetched value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                coalesced_reads.inc(cache=self.name, result="hit")
+                return value
+            if age < self.ttl + self.stale_ttl:
+                coalesced_reads.inc(cache=self.name, result="stale")
+                if key not in self._inflight:
+                    self._start(key, fetch).add_done_callback(self._log_refresh_failure)
+                return value
+
+        future = self._inflight.get(key)
+        if future is not None:
+            coalesced_reads.inc(cache=self.name, result="collapsed")
+            collapsed_reads.inc(cache=self.name, key=key)
+            # shield: a waiter whose client disconnects must not cancel the fetch the others are waiting on
+            return await asyncio.shield(future)
+        coalesced_reads.inc(cache=self.name, result="miss")
+        return await asyncio.shield(self._start(key, fetch))
+
+    def _start(self, key: Hashable, fetch: Callable[[], Awaitable]) -> asyncio.Future:
+        future = asyncio.ensure_future(self._fetch(key, fetch))
+        with self._lock:
+            self._inflight[key] = future
+        return future
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable]):
+        try:
+            value = await fetch()
+        finally:
+            current = asyncio.current_task()
+            with self._lock:
+                stored = self._inflight.get(key) is current
+                if stored:
+                    del self._inflight[key]
+        if stored:
+            with self._lock:
+                self._entries[key] = (value, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def _log_refresh_failure(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Refreshing a %s cache entry failed, serving it stale", self.name,
+                           exc_info=future.exception())
+
+    def invalidate(self, *keys: Hashable):
+        """
+        :param keys: Keys whose values changed; none to drop every entry.
+        :return: None
+        """
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+                self._inflight.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+
+
+card_reads = CoalescingCache("card", CARD_CACHE_TTL, CARD_CACHE_STALE_TTL, CARD_CACHE_SIZE)
+home_reads = CoalescingCache("home", HOME_CACHE_TTL, HOME_CACHE_STALE_TTL, HOME_CACHE_SIZE)
@@ -0,0 +1,283 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session, selectinload
+
+from backend.app import schemas
+from backend.app.metrics import Counter
+from backend.app.models import Card
+from backend.app.serializers import dump
+from backend.app.singleflight import card_reads
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; the snapshot is then disabled
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Serve the default catalog listing and card details from a memory-mapped snapshot shared by all workers of a host
+CATALOG_SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT_ENABLED", "0") == "1" and fcntl is not None
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "./snapshots")
+# Writes made outside the card CRUD functions (scripts, other hosts) show up after at most this long
+CATALOG_SNAPSHOT_MAX_AGE = float(os.getenv("CATALOG_SNAPSHOT_MAX_AGE", "60"))
+# Listings larger than this are served from the database
+CATALOG_SNAPSHOT_MAX_PAGE = 1000
+
+MAGIC = b"CSNAP001"
+# magic, catalog version the snapshot was built at, card count, build time, heap size
+_HEADER = struct.Struct("<8sQQdQ")
+# Fixed-width columns stored after the heap, 8 bytes per card each: id, price, quantity, heap offset, heap length
+_COLUMNS = (("ids", "q"), ("prices", "d"), ("quantities", "q"), ("offsets", "q"), ("lengths", "q"))
+_VERSION = struct.Struct("<Q")
+
+snapshot_reads = Counter("catalog_snapshot_reads", "Catalog reads, by whether the snapshot served them.", ("result",))
+
+
+class _Mapping:
+    """
+    One snapshot file mapped read-only. The columns are memoryviews over the mapping, so lookups copy nothing.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self.inode = os.fstat(file.fileno()).st_ino
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self.count, self.built_at, heap_size = _HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self.heap = memoryview(self.mm)[_HEADER.size:_HEADER.size + heap_size]
+        start = _HEADER.size + heap_size
+        start += -start % 8
+        for name, typecode in _COLUMNS:
+            setattr(self, name, memoryview(self.mm)[start:start + 8 * self.count].cast(typecode))
+            start += 8 * self.count
+
+
+class CatalogSnapshot:
+    """
+    Catalog snapshot in a memory-mapped file that every worker of the host maps read-only, so the catalog is
+    held once in the page cache instead of once per worker. The file holds fixed-width columns plus a heap of
+    the cards' CardRead JSON, pre-encoded in id order and comma separated, so a page of the default listing
+    is a single slice of the heap.
+
+    Card writes bump a version counter in a small shared file (invalidate_catalog); a worker whose mapping is
+    older than the counter serves from the database and has one worker of the host rebuild the snapshot in the
+    background. The new file replaces the old one atomically, and each worker maps it on its next read.
+    """
+
+    def __init__(self, directory: str = CATALOG_SNAPSHOT_DIR, max_age: float = CATALOG_SNAPSHOT_MAX_AGE):
+        self.path = os.path.join(directory, "catalog.snapshot")
+        self.directory = directory
+        self.max_age = max_age
+        self._mapping: Optional[_Mapping] = None
+        self._version_mm = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    # --------------------- Version counter --------------------- #
+
+    def _version_map(self):
+        if self._version_mm is None:
+            with self._lock:
+                if self._version_mm is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = os.path.join(self.directory, "catalog.version")
+                    with open(path, "a+b") as file:
+                        if os.fstat(file.fileno()).st_size < _VERSION.size:
+                            file.write(b"\0" * _VERSION.size)
+                            file.flush()
+                        self._version_mm = mmap.mmap(file.fileno(), _VERSION.size)
+        return self._version_mm
+
+    def version(self) -> int:
+        """
+        :return: The catalog version shared by the workers of this host.
+        """
+        return _VERSION.unpack_from(self._version_map(), 0)[0]
+
+    def bump(self):
+        """
+        Marks every snapshot built so far as stale, in all workers of the host.
+
+        :return: None
+        """
+        version_mm = self._version_map()
+        with open(os.path.join(self.directory, "catalog.version.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            _VERSION.pack_into(version_mm, 0, _VERSION.unpack_from(version_mm, 0)[0] + 1)
+
+    # --------------------- Reads --------------------- #
+
+    def _is_fresh(self, mapping: Optional[_Mapping]) -> bool:
+        return (mapping is not None and mapping.version == self.version()
+                and time.time() - mapping.built_at < self.max_age)
+
+    def _current(self) -> Optional[_Mapping]:
+        """
+        :return: The mapping of an up-to-date snapshot, None if there is none yet (a rebuild is then started).
+        """
+        mapping = self._mapping
+        if self._is_fresh(mapping):
+            return mapping
+        # Another worker may have built a newer file already
+        try:
+            if mapping is None or os.stat(self.path).st_ino != mapping.inode:
+                # The old mapping is not closed: requests may still be reading it. It is unmapped once unreferenced.
+                mapping = self._mapping = _Mapping(self.path)
+        except (OSError, ValueError):
+            mapping = None
+        if self._is_fresh(mapping):
+            return mapping
+        self._schedule_rebuild()
+        return None
+
+    def card_json(self, card_id: int) -> Optional[bytes]:
+        """
+        :param card_id: ID of the card.
+        :return: The CardRead JSON of the card, None if the snapshot cannot answer.
+        :raises KeyError: If the snapshot is current and has no such card.
+        """
+        mapping = self._current()
+        if mapping is None:
+            snapshot_reads.inc(result="miss")
+            return None
+        position = bisect_left(mapping.ids, card_id)
+        if position == mapping.count or mapping.ids[position] != card_id:
+            snapshot_reads.inc(result="hit")
+            raise KeyError(card_id)
+        offset = mapping.offsets[position]
+        snapshot_reads.inc(result="hit")
+        return mapping.heap[offset:offset + mapping.lengths[position]].tobytes()
+
+    def page_json(self, skip: int, limit: int) -> Optional[bytes]:
+        """
+        :param skip: Number of cards skipped, in id order.
+        :param limit: Maximum number of cards returned.
+        :return: The JSON array of the CardRead of the cards on the page, None if the snapshot cannot answer.
+        """
+        if skip < 0 or not 0 < limit <= CATALOG_SNAPSHOT_MAX_PAGE:
+            return None
+        mapping = self._current()
+        if mapping is None:
+            snapshot_reads.inc(result="miss")
+            return None
+        snapshot_reads.inc(result="hit")
+        end = min(skip + limit, mapping.count)
+        if skip >= end:
+            return b"[]"
+        first, last = mapping.offsets[skip], mapping.offsets[end - 1] + mapping.lengths[end - 1]
+        # The cards are stored comma separated, so the page is one slice of the heap: the only copy made
+        return b"".join((b"[", mapping.heap[first:last], b"]"))
+
+    # --------------------- Builds --------------------- #
+
+    def _schedule_rebuild(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild, name="catalog-snapshot", daemon=True).start()
+
+    def _rebuild(self):
+        from backend.app.database import SessionLocal
+        try:
+            with open(os.path.join(self.directory, "catalog.snapshot.lock"), "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another worker of the host is building it
+                    return
+                try:
+                    if self._is_fresh(_Mapping(self.path)):
+                        return
+                except (OSError, ValueError):
+                    pass
+                db = SessionLocal()
+                try:
+                    self.build(db)
+                finally:
+                    db.close()
+        except Exception:
+            logger.exception("Building the catalog snapshot failed")
+        finally:
+            self._building = False
+
+    def build(self, db: Session) -> int:
+        """
+        Writes a snapshot of the cards table next to the current one, then swaps it in atomically.
+
+        :param db: Database session used to read the catalog.
+        :return: Number of cards in the snapshot.
+        """
+        import orjson
+
+        # Read before the catalog: a write during the build leaves the snapshot stale rather than silently missing it
+        version = self.version()
+        columns = {name: array(typecode) for name, typecode in _COLUMNS}
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(b"\0" * _HEADER.size)
+            heap_size = 0
+            cards = db.query(Card).options(selectinload(Card.order_items)).order_by(Card.id).yield_per(1000)
+            for card in cards:
+                encoded = orjson.dumps(dump(schemas.CardRead, card))
+                if heap_size:
+                    file.write(b",")
+                    heap_size += 1
+                columns["ids"].append(card.id)
+                columns["prices"].append(card.price or 0.0)
+                columns["quantities"].append(card.quantity or 0)
+                columns["offsets"].append(heap_size)
+                columns["lengths"].append(len(encoded))
+                file.write(encoded)
+                heap_size += len(encoded)
+            file.write(b"\0" * (-(_HEADER.size + heap_size) % 8))
+            for name, _ in _COLUMNS:
+                columns[name].tofile(file)
+            file.seek(0)
+            file.write(_HEADER.pack(MAGIC, version, len(columns["ids"]), time.time(), heap_size))
+        os.replace(temporary, self.path)
+        logger.info("Built the catalog snapshot of %d cards at version %d", len(columns["ids"]), version)
+        return len(columns["ids"])
+
+
+catalog_snapshot = CatalogSnapshot()
+
+
+_local_version = 0
+_local_version_lock = threading.Lock()
+
+
+def catalog_version() -> tuple:
+    """
+    :return: A value that changes on every invalidate_catalog of this worker, and of any worker of the host
+        when the snapshot is enabled.
+    """
+    return _local_version, catalog_snapshot.version() if CATALOG_SNAPSHOT_ENABLED else 0
+
+
+def invalidate_catalog(*card_ids: int):
+    """
+    Called after every committed write that changes what a card's CardRead looks like (the card itself,
+    its order items or its ratings).
+
+    :param card_ids: IDs of the changed cards; none when they are not known, which drops every cached card read.
+    :return: None
+    """
+    global _local_version
+    with _local_version_lock:
+        _local_version += 1
+    card_reads.invalidate(*card_ids)
+    if CATALOG_SNAPSHOT_ENABLED:
+        catalog_snapshot.bump()
@@ -0,0 +1,132 @@
+import random
+from datetime import datetime, timedelta
+from itertools import product
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import catalog_index, crud
+from backend.app.catalog_index import SORTS, CatalogIndex
+from backend.app.database import Base
+from backend.app.models import Card
+
+FILTERS = [
+    {},
+    {"min_price": 20.0},
+    {"max_price": 35.5},
+    {"min_price": 10.0, "max_price": 12.0},
+    {"in_stock": True},
+    {"min_rating": 3.5},
+    {"name": "PIKACHU"},
+    {"name": "Missingno"},
+    {"min_price": 5.0, "max_price": 45.0, "in_stock": True, "min_rating": 2.0},
+]
+PAGES = [(0, 10), (7, 25), (180, 50), (0, 500)]
+
+
+@pytest.fixture()
+def db(tmp_path):
+    """
+    :return: A session on a SQLite database of 300 random cards, with ties and missing values in every
+        sorted column.
+    """
+    rng = random.Random(11)
+    engine = create_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    names = ["Pikachu", "pikachu", "Charizard", "Mewtwo", "Eevee"]
+    session.add_all([Card(id=card_id, name=rng.choice(names),
+                          price=None if rng.random() < 0.05 else float(rng.randint(1, 100)) / 2,
+                          quantity=None if rng.random() < 0.05 else rng.randint(0, 5),
+                          rating_avg=None if rng.random() < 0.3 else rng.randint(2, 10) / 2,
+                          created_at=None if rng.random() < 0.2 else datetime(2024, 1, 1) + timedelta(
+                              hours=rng.randint(0, 100)))
+                     for card_id in range(1, 301)])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _database_ids(db, monkeypatch, **query):
+    monkeypatch.setattr(catalog_index, "CATALOG_INDEX_ENABLED", False)
+    ids = [card.id for card in crud.get_cards(db, **query)]
+    monkeypatch.setattr(catalog_index, "CATALOG_INDEX_ENABLED", True)
+    return ids
+
+
+def _index_ids(index, skip=0, limit=10, sort=None, in_stock=False, **filters):
+    return index.query(skip=skip, limit=limit, sort=sort, min_quantity=1 if in_stock else None, **filters)
+
+
+@pytest.mark.parametrize("scan_limit", [1 << 20, 16])
+@pytest.mark.parametrize("sort", [None, *[sort for sort in SORTS if sort != "id"]])
+def test_index_matches_database(db, monkeypatch, sort, scan_limit):
+    # A small scan limit answers the selective filters with the masked argpartition instead of the walk
+    monkeypatch.setattr(catalog_index, "_SCAN_CHUNK", 8)
+    monkeypatch.setattr(catalog_index, "_SCAN_LIMIT", scan_limit)
+    index = CatalogIndex()
+    index.load(db)
+    for filters, (skip, limit) in product(FILTERS, PAGES):
+        query = dict(skip=skip, limit=limit, sort=sort, **filters)
+        assert _index_ids(index, **query) == _database_ids(db, monkeypatch, **query), query
+
+
+def test_index_follows_writes(db, monkeypatch):
+    rng = random.Random(5)
+    index = CatalogIndex()
+    index.load(db)
+    for step in range(60):
+        card = db.get(Card, rng.randint(1, 300 + step))
+        if card is None or rng.random() < 0.3:
+            card = Card(name="Eevee", price=float(rng.randint(1, 100)), quantity=rng.randint(0, 3),
+                        created_at=datetime(2024, 1, 1) + timedelta(hours=rng.randint(0, 100)))
+            db.add(card)
+        elif rng.random() < 0.2:
+            db.delete(card)
+            db.commit()
+            index.remove(db, card.id)
+            continue
+        else:
+            card.price = None if rng.random() < 0.1 else float(rng.randint(1, 100))
+            card.quantity = rng.randint(0, 3)
+            card.rating_avg = rng.randint(2, 10) / 2
+        db.commit()
+        index.upsert(db, card)
+
+    for sort, filters in product([None, *SORTS], FILTERS):
+        sort = None if sort == "id" else sort
+        query = dict(skip=3, limit=40, sort=sort, **filters)
+        assert _index_ids(index, **query) == _database_ids(db, monkeypatch, **query), query
+
+
+def test_listing_falls_back_to_the_database_until_the_index_is_current(db, monkeypatch):
+    index = CatalogIndex()
+    monkeypatch.setattr(catalog_index, "catalog_index", index)
+    monkeypatch.setattr(index, "_schedule_load", lambda session: index.load(session))
+    assert catalog_index.query_cards(db, sort="price") is None
+    assert catalog_index.query_cards(db, sort="price") == _database_ids(db, monkeypatch, sort="price")
+
+    index.max_age = 0
+    assert catalog_index.query_cards(db, sort="price") is None
+
+
+def test_writes_of_other_workers_make_the_index_stale(db, monkeypatch):
+    index = CatalogIndex()
+    index.load(db)
+    # Without a shared version, a card created behind the index's back is found by the probe
+    monkeypatch.setattr(catalog_index, "CATALOG_INDEX_PROBE_SECONDS", 0)
+    assert index.is_current(db)
+    db.add(Card(id=301, name="Eevee", price=1.0, quantity=1))
+    db.commit()
+    assert not index.is_current(db)
+
+    # With it, only the bumps not matched by a write of this worker count
+    version = [(10, 40)]
+    monkeypatch.setattr(catalog_index, "catalog_version", lambda: version[0])
+    index.load(db)
+    version[0] = (12, 42)
+    assert index.is_current(db)
+    version[0] = (12, 43)
+    assert not index.is_current(db)
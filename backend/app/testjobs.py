@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import jobs
+from backend.app.database import Base
+from backend.app.jobs import FAILED, RUNNING, claim_jobs, enqueue, fail_expired_jobs
+from backend.app.models import Job
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    """
+    :return: A session on an empty SQLite database, with a job type of two attempts registered.
+    """
+    monkeypatch.setitem(jobs._job_types, "test", jobs.JobType("test", lambda db: None, concurrency=2,
+                                                              max_attempts=2, timeout=60.0))
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _expire(db, job_id):
+    db.query(Job).filter(Job.id == job_id).update({Job.locked_until: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+
+
+def test_expired_jobs_are_reclaimed_until_their_attempts_run_out(db):
+    job_id = enqueue(db, "test").id
+    assert claim_jobs(db, "test", 2) == [job_id]
+    assert claim_jobs(db, "test", 2) == []
+
+    _expire(db, job_id)
+    assert fail_expired_jobs(db, "test") == 0
+    assert claim_jobs(db, "test", 2) == [job_id]
+
+    # The second attempt was the last one
+    _expire(db, job_id)
+    assert claim_jobs(db, "test", 2) == []
+    assert fail_expired_jobs(db, "test") == 1
+    job = db.get(Job, job_id)
+    db.refresh(job)
+    assert (job.status, job.last_error, job.attempts) == (FAILED, "visibility timeout expired", 2)
+    assert job.finished_at is not None
+
+
+def test_jobs_executing_locally_are_not_reclaimed(db):
+    job_id = enqueue(db, "test").id
+    assert claim_jobs(db, "test", 2) == [job_id]
+    _expire(db, job_id)
+    assert claim_jobs(db, "test", 2, exclude={job_id}) == []
+    job = db.get(Job, job_id)
+    db.refresh(job)
+    assert (job.status, job.attempts) == (RUNNING, 1)
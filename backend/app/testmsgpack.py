@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import msgpack
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app.database import Base, get_db
+from backend.app.main import app
+from backend.app.models import Card, Order, OrderItem, User
+
+MSGPACK = "application/msgpack"
+
+
+@pytest.fixture()
+def client():
+    """
+    Serves the app from an in-memory SQLite database holding a few cards and one order.
+
+    :return: A test client of the app.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(User(id=1, username="buyer", email="buyer@test.com"))
+    session.add_all([Card(id=card_id, name=f"Card {card_id}", description="Near mint", price=card_id + 0.5,
+                          quantity=card_id) for card_id in range(1, 6)])
+    session.add(Order(id=1, user_id=1, total_price=3.0, created_at=datetime(2024, 5, 1, 12, 30, 15, 250000)))
+    session.add(OrderItem(id=1, order_id=1, card_id=2, quantity=1, price=2.5, created_at=datetime(2024, 5, 1)))
+    session.commit()
+    session.close()
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path", ["/store/cards/?limit=5", "/store/card/2", "/orders/", "/orders/1",
+                                  "/store/card/2/reviews"])
+def test_msgpack_matches_json(client, path):
+    as_json = client.get(path)
+    as_msgpack = client.get(path, headers={"Accept": MSGPACK})
+
+    assert as_json.status_code == as_msgpack.status_code == 200
+    assert as_msgpack.headers["content-type"] == MSGPACK
+    assert "Accept" in as_msgpack.headers["vary"]
+    assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+
+
+def test_json_wins_unless_msgpack_preferred(client):
+    response = client.get("/store/card/2", headers={"Accept": f"application/json, {MSGPACK};q=0.5"})
+    assert response.headers["content-type"] == "application/json"
+
+
+def test_msgpack_request_body(client):
+    body = msgpack.packb({"user_id": 1, "total_price": 12.5})
+    response = client.post("/orders/", content=body, headers={"Content-Type": MSGPACK, "Accept": MSGPACK})
+
+    assert response.status_code == 200
+    created = msgpack.unpackb(response.content)
+    assert created["user_id"] == 1 and created["total_price"] == 12.5
+    assert client.get(f"/orders/{created['id']}").json() == created
+
+    invalid = client.post("/orders/", content=msgpack.packb({"user_id": "x"}), headers={"Content-Type": MSGPACK})
+    assert invalid.status_code == 422
+    malformed = client.post("/orders/", content=b"\xc1", headers={"Content-Type": MSGPACK})
+    assert malformed.status_code == 400
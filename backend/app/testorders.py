@@ -0,0 +1,222 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import archive, crud, rollups
+from backend.app.database import Base
+from backend.app.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, RollupWatermark, User
+
+# Planner statistics describing a production-sized history: 10M orders from 100k users, 3 items per order
+SIMULATED_STATS = [
+    ("orders", None, "10000000"),
+    ("orders", "ix_orders_user_created", "10000000 100 1 1"),
+    ("orders", "ix_orders_id", "10000000 1"),
+    ("order_items", None, "30000000"),
+    ("order_items", "ix_order_items_order_id", "30000000 3"),
+    ("order_items", "ix_order_items_card_id", "30000000 3000"),
+    ("order_items", "ix_order_items_id", "30000000 1"),
+]
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    """
+    Creates a SQLite database with a small order history whose planner statistics claim 10M orders,
+    so the query plans are the ones SQLite would pick at production scale.
+
+    :param tmp_path: Pytest fixture providing a temporary directory.
+    :return: The engine of the database.
+    """
+    url = f"sqlite:///{tmp_path / 'orders.db'}"
+    setup_engine = create_engine(url)
+    Base.metadata.create_all(bind=setup_engine)
+    session = sessionmaker(bind=setup_engine)()
+    session.add_all([User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@test.com")
+                     for user_id in (1, 2)])
+    start = datetime(2024, 1, 1)
+    for order_id in range(1, 41):
+        session.add(Order(id=order_id, user_id=1 + order_id % 2, total_price=10.0,
+                          created_at=start + timedelta(days=order_id)))
+        session.add_all([OrderItem(order_id=order_id, card_id=card_id, quantity=1, price=5.0)
+                         for card_id in (1, 2)])
+    session.commit()
+    session.close()
+
+    with setup_engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+        conn.execute(text("DELETE FROM sqlite_stat1 WHERE tbl IN ('orders', 'order_items')"))
+        for table, index, stat in SIMULATED_STATS:
+            conn.execute(text("INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES (:tbl, :idx, :stat)"),
+                         {"tbl": table, "idx": index, "stat": stat})
+    setup_engine.dispose()
+
+    # A fresh engine so new connections load the simulated statistics
+    test_engine = create_engine(url)
+    yield test_engine
+    test_engine.dispose()
+
+
+def _capture_statements(engine, fn):
+    """
+    :param engine: The engine whose statements are recorded.
+    :param fn: Callable run with a session bound to the engine; the session is closed once it returns.
+    :return: The callable's result and the (statement, parameters) pairs it executed.
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    session = sessionmaker(bind=engine)()
+    try:
+        result = fn(session)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        session.close()
+    return result, statements
+
+
+def _query_plan(engine, statement, parameters) -> str:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def test_user_orders_use_history_index(engine):
+    """
+    :param engine: Fixture providing the database with simulated statistics.
+    :return: None
+    """
+    orders, statements = _capture_statements(
+        engine, lambda db: crud.get_user_orders(db, user_id=1, limit=5))
+    assert [order.id for order in orders] == [40, 38, 36, 34, 32]
+
+    orders_plan = _query_plan(engine, *statements[0])
+    assert "USING INDEX ix_orders_user_created (user_id=?)" in orders_plan
+    assert "SCAN orders" not in orders_plan
+    assert "TEMP B-TREE" not in orders_plan
+
+
+def test_user_orders_next_page_seeks_index(engine):
+    """
+    :param engine: Fixture providing the database with simulated statistics.
+    :return: None
+    """
+    last = datetime(2024, 1, 1) + timedelta(days=32)
+    orders, statements = _capture_statements(
+        engine, lambda db: crud.get_user_orders(db, user_id=1, limit=5, after=(last, 32)))
+    assert [order.id for order in orders] == [30, 28, 26, 24, 22]
+
+    orders_plan = _query_plan(engine, *statements[0])
+    assert "USING INDEX ix_orders_user_created (user_id=? AND created_at<?)" in orders_plan
+    assert "TEMP B-TREE" not in orders_plan
+
+
+def test_user_orders_load_items_in_fixed_number_of_queries(engine):
+    """
+    :param engine: Fixture providing the database with simulated statistics.
+    :return: None
+    """
+    def load_history(db):
+        orders = crud.get_user_orders(db, user_id=2, limit=20)
+        # Touching every item must not issue any further query
+        return sum(len(order.order_items) for order in orders)
+
+    item_count, statements = _capture_statements(engine, load_history)
+    assert item_count == 40
+    assert len(statements) == 2
+
+    items_plan = _query_plan(engine, *statements[1])
+    assert "USING INDEX ix_order_items_order_id (order_id=?)" in items_plan
+    assert "SCAN order_items" not in items_plan
+
+
+def test_archived_orders_are_still_read(engine, monkeypatch):
+    """
+    :param engine: Fixture providing the database with simulated statistics.
+    :param monkeypatch: Pytest fixture used to fold the just created order items into the rollups at once.
+    :return: None
+    """
+    monkeypatch.setattr(rollups, "ROLLUP_GRACE_SECONDS", 0)
+    session = sessionmaker(bind=engine)()
+    # Orders the sales rollups have not folded in yet stay hot
+    assert archive.archive_orders(session, horizon=datetime(2024, 1, 21), batch_size=7, pause=0) == 0
+    rollups.compact_sales(session)
+    assert archive.archive_orders(session, horizon=datetime(2024, 1, 21), batch_size=7, pause=0) == 19
+    assert session.query(Order).count() == 21
+    assert session.query(ArchivedOrderItem).count() == 38
+
+    order = crud.get_order(session, order_id=3)
+    assert isinstance(order, ArchivedOrder)
+    assert order.user.id == 2
+    assert len(order.order_items) == len(crud.get_order_items(session, order_id=3)) == 2
+
+    # The history continues from the hot orders into the archived ones
+    orders = crud.get_user_orders(session, user_id=1, limit=5, after=(datetime(2024, 1, 25), 24))
+    assert [order.id for order in orders] == [22, 20, 18, 16, 14]
+    session.close()
+
+
+def _set_watermarks(session, last_order_id: int, last_item_id: int):
+    session.merge(RollupWatermark(name=rollups.SALES_DAILY, last_id=last_order_id))
+    session.merge(RollupWatermark(name=rollups.CARD_SALES_DAILY, last_id=last_item_id))
+    session.commit()
+
+
+def test_archive_batch_moves_only_folded_orders(engine):
+    """
+    :param engine: Fixture providing the database with simulated statistics; order n holds items 2n-1 and 2n.
+    :return: None
+    """
+    session = sessionmaker(bind=engine)()
+    horizon = datetime(2024, 1, 21)
+    # Orders up to 10 are folded into the sales rollup, but only the items of orders 1-3 into the card rollup
+    _set_watermarks(session, last_order_id=10, last_item_id=6)
+    assert archive.archive_batch(session, horizon, batch_size=100) == 3
+    assert sorted(order_id for order_id, in session.query(ArchivedOrder.id)) == [1, 2, 3]
+    assert sorted(item_id for item_id, in session.query(ArchivedOrderItem.id)) == [1, 2, 3, 4, 5, 6]
+    assert session.query(OrderItem).filter(OrderItem.order_id <= 3).count() == 0
+
+    # An order folded in with only one of its items stays hot
+    _set_watermarks(session, last_order_id=10, last_item_id=9)
+    assert archive.archive_batch(session, horizon, batch_size=100) == 1
+    assert session.query(Order).filter(Order.id == 5).count() == 1
+
+    # Folded orders past the horizon stay hot too, and a batch is at most batch_size orders, oldest first
+    _set_watermarks(session, last_order_id=40, last_item_id=80)
+    assert archive.archive_batch(session, horizon, batch_size=10) == 10
+    assert archive.archive_batch(session, horizon, batch_size=10) == 5
+    assert archive.archive_batch(session, horizon, batch_size=10) == 0
+    assert session.query(ArchivedOrder).count() == 19
+    assert min(order_id for order_id, in session.query(Order.id)) == 20
+    assert session.query(OrderItem).count() + session.query(ArchivedOrderItem).count() == 80
+    session.close()
+
+
+def test_archived_orders_read_through(engine):
+    """
+    :param engine: Fixture providing the database with simulated statistics.
+    :return: None
+    """
+    session = sessionmaker(bind=engine)()
+    _set_watermarks(session, last_order_id=40, last_item_id=80)
+    archive.archive_batch(session, datetime(2024, 1, 31), batch_size=100)
+
+    assert isinstance(crud.get_order(session, order_id=30), Order)
+    archived = crud.get_order(session, order_id=29)
+    assert isinstance(archived, ArchivedOrder)
+    assert (archived.user_id, archived.total_price) == (2, 10.0)
+    assert sorted(item.card_id for item in crud.get_order_items(session, order_id=29)) == [1, 2]
+    assert crud.get_order(session, order_id=41) is None
+
+    # The first page runs from the hot orders into the archived ones, the next one only reads the archive
+    orders = crud.get_user_orders(session, user_id=2, limit=8)
+    assert [order.id for order in orders] == [39, 37, 35, 33, 31, 29, 27, 25]
+    assert [type(order) for order in orders[4:]] == [Order, ArchivedOrder, ArchivedOrder, ArchivedOrder]
+    orders = crud.get_user_orders(session, user_id=2, limit=20, after=(orders[-1].created_at, orders[-1].id))
+    assert [order.id for order in orders] == [23, 21, 19, 17, 15, 13, 11, 9, 7, 5, 3, 1]
+    assert all(len(order.order_items) == 2 for order in orders)
+    session.close()
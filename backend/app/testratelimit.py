@@ -0,0 +1,75 @@
+import pytest
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from backend.app import ratelimit
+from backend.app.ratelimit import MemoryStore, RateLimit, parse_rate
+
+
+async def _account(request: Request):
+    return request.query_params.get("account")
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    """
+    :return: A test client of an app with one route limited to 4 requests per address and 2 per account a minute,
+        whose buckets start full.
+    """
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "store", MemoryStore())
+    app = FastAPI()
+
+    @app.get("/limited", dependencies=[Depends(RateLimit("test", per_ip="4/minute", per_account="2/minute",
+                                                         account=_account))])
+    def limited():
+        return {}
+
+    return TestClient(app)
+
+
+def test_bucket_refuses_when_empty_and_refills():
+    store = MemoryStore()
+    capacity, rate = parse_rate("2/second")
+    assert store.take_now("key", capacity, rate, 1, now=0.0) == 0
+    assert store.take_now("key", capacity, rate, 1, now=0.0) == 0
+    # Empty: the wait is the time until one token has been refilled
+    assert store.take_now("key", capacity, rate, 1, now=0.0) == pytest.approx(0.5)
+    assert store.take_now("key", capacity, rate, 1, now=0.25) == pytest.approx(0.25)
+    assert store.take_now("key", capacity, rate, 1, now=0.5) == 0
+    # A bucket idle for long refills up to its capacity only
+    assert store.take_now("key", capacity, rate, 1, now=100.0) == 0
+    assert store.take_now("key", capacity, rate, 1, now=100.0) == 0
+    assert store.take_now("key", capacity, rate, 1, now=100.0) > 0
+    # Other keys have buckets of their own
+    assert store.take_now("other", capacity, rate, 1, now=0.0) == 0
+
+
+def test_full_buckets_are_swept():
+    store = MemoryStore(max_keys=2)
+    store.take_now("a", 1, 1, 1, now=0.0)
+    store.take_now("b", 1, 1, 1, now=0.0)
+    store.take_now("c", 1, 1, 1, now=0.5)
+    assert len(store) == 3
+    # By then a and b have refilled and are dropped, c has not
+    store.take_now("d", 1, 1, 1, now=1.0)
+    assert len(store) == 2
+
+
+def test_route_is_limited_per_account_and_per_address(client):
+    assert [client.get("/limited?account=alice").status_code for _ in range(2)] == [200, 200]
+    response = client.get("/limited?account=alice")
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 30
+    # The refused request still took a token of the address: another account gets its last one
+    assert client.get("/limited?account=bob").status_code == 200
+    assert client.get("/limited?account=carol").status_code == 429
+
+
+def test_logout_does_not_spend_the_refresh_budget():
+    from backend.app.main import app
+
+    scopes = {route.path: [dependency.dependency.scope for dependency in route.dependencies
+                           if isinstance(dependency.dependency, RateLimit)]
+              for route in app.routes if getattr(route, "path", None) in ("/token/refresh", "/token/revoke")}
+    assert scopes == {"/token/refresh": ["refresh"], "/token/revoke": ["revoke"]}
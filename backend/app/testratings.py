@@ -0,0 +1,48 @@
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import crud
+from backend.app.database import Base
+from backend.app.models import Card, Review
+from backend.app.ratings import recompute_card_ratings
+from backend.app.schemas import ReviewBase, ReviewCreate
+
+
+@pytest.fixture()
+def db(tmp_path):
+    """
+    :return: A session on a SQLite database holding one card.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'ratings.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    session.add(Card(id=1, name="Pikachu", price=1.0, quantity=1))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _aggregates(db):
+    card = db.get(Card, 1)
+    db.refresh(card)
+    return card.rating_count, card.rating_sum, card.rating_avg, card.rating_histogram
+
+
+def test_out_of_range_ratings_are_left_out_of_the_aggregates(db):
+    with pytest.raises(ValidationError):
+        ReviewCreate(user_id=1, card_id=1, rating=7)
+    # A row written before ratings were validated can still be read
+    assert ReviewBase(user_id=1, card_id=1, rating=7).rating == 7
+
+    db.add(Review(id=1, user_id=1, card_id=1, rating=7))
+    db.commit()
+    crud.create_review(db, ReviewCreate(user_id=2, card_id=1, rating=4))
+    incremental = _aggregates(db)
+    recompute_card_ratings(db)
+    assert _aggregates(db) == incremental == (1, 4, 4.0, [0, 0, 0, 1, 0])
+
+    assert crud.delete_review(db, 1)
+    assert _aggregates(db) == (1, 4, 4.0, [0, 0, 0, 1, 0])
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import crud, recommendations
+from backend.app.database import Base
+from backend.app.models import CardCooccurrence, CardRelated, Order
+from backend.app.schemas import OrderItemCreate
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    """
+    :return: A session on an empty SQLite database, with baskets limited to 4 distinct cards.
+    """
+    monkeypatch.setattr(recommendations, "MAX_BASKET_SIZE", 4)
+    engine = create_engine(f"sqlite:///{tmp_path / 'recommendations.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _matrix(db):
+    cooccurrence = {(row.card_id, row.other_card_id): row.orders
+                    for row in db.query(CardCooccurrence).filter(CardCooccurrence.orders > 0)}
+    related = {(row.card_id, row.rank): (row.related_card_id, row.orders) for row in db.query(CardRelated)}
+    return cooccurrence, related
+
+
+def test_incremental_updates_match_rebuild(db):
+    rng = random.Random(7)
+    orders = [Order(id=order_id, user_id=1, total_price=0.0) for order_id in range(1, 7)]
+    db.add_all(orders)
+    db.commit()
+    items = []
+    # Baskets grow past the limit of 4 and shrink back under it
+    for _ in range(80):
+        if items and rng.random() < 0.3:
+            crud.delete_order_item(db, items.pop(rng.randrange(len(items))))
+        else:
+            item = crud.create_order_item(db, OrderItemCreate(order_id=rng.randint(1, 6), card_id=rng.randint(1, 8),
+                                                              quantity=1, price=1.0))
+            items.append(item.id)
+    crud.delete_order(db, 3)
+    incremental = _matrix(db)
+
+    recommendations.rebuild_recommendations(db, workers=1)
+    assert _matrix(db) == incremental
+    assert incremental[0]
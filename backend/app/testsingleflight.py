@@ -0,0 +1,157 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.app import singleflight
+from backend.app.metrics import REGISTRY, TopCounter
+from backend.app.singleflight import CoalescingCache
+
+
+class _Source:
+    """
+    A fetch that blocks until released, counting its calls; the value is the number of the call.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return call
+
+
+async def _settle():
+    # Lets the readers and the fetch tasks they start run up to their first wait
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def scenario():
+        cache, source = CoalescingCache("test", ttl=60, stale_ttl=0, max_entries=10), _Source()
+        readers = [asyncio.ensure_future(cache.get("key", source.fetch)) for _ in range(50)]
+        await _settle()
+        source.release.set()
+        assert await asyncio.gather(*readers) == [1] * 50
+        assert await cache.get("key", source.fetch) == 1
+        assert source.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_detaches_the_fetch_in_flight():
+    async def scenario():
+        cache, source = CoalescingCache("test", ttl=60, stale_ttl=0, max_entries=10), _Source()
+        before = asyncio.ensure_future(cache.get("key", source.fetch))
+        await _settle()
+        # The value being fetched may predate the write: requests arriving after it start a fetch of their own
+        cache.invalidate("key")
+        after = asyncio.ensure_future(cache.get("key", source.fetch))
+        await _settle()
+        assert source.calls == 2
+        source.release.set()
+        assert await before == 1
+        assert await after == 2
+        # Only the fetch started after the invalidation was stored
+        assert await cache.get("key", source.fetch) == 2
+        assert source.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_invalidating_everything_detaches_every_fetch():
+    async def scenario():
+        cache, source = CoalescingCache("test", ttl=60, stale_ttl=0, max_entries=10), _Source()
+        readers = [asyncio.ensure_future(cache.get(key, source.fetch)) for key in ("a", "b")]
+        await _settle()
+        cache.invalidate()
+        source.release.set()
+        assert await asyncio.gather(*readers) == [1, 2]
+        assert len(cache._entries) == 0
+        assert await cache.get("a", source.fetch) == 3
+
+    asyncio.run(scenario())
+
+
+def test_failed_fetch_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        cache = CoalescingCache("test", ttl=60, stale_ttl=0, max_entries=10)
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            await _settle()
+            raise LookupError("gone")
+
+        readers = [asyncio.ensure_future(cache.get("key", failing)) for _ in range(3)]
+        results = await asyncio.gather(*readers, return_exceptions=True)
+        assert all(isinstance(result, LookupError) for result in results)
+        assert len(calls) == 1
+        with pytest.raises(LookupError):
+            await cache.get("key", failing)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_stale_entry_is_served_while_one_fetch_refreshes_it(monkeypatch):
+    async def scenario():
+        now = [0.0]
+        monkeypatch.setattr(singleflight, "time", SimpleNamespace(monotonic=lambda: now[0]))
+        cache, source = CoalescingCache("test", ttl=1, stale_ttl=10, max_entries=10), _Source()
+        source.release.set()
+        assert await cache.get("key", source.fetch) == 1
+
+        source.release.clear()
+        now[0] = 5.0
+        assert [await cache.get("key", source.fetch) for _ in range(3)] == [1, 1, 1]
+        await _settle()
+        assert source.calls == 2
+        source.release.set()
+        await _settle()
+        assert await cache.get("key", source.fetch) == 2
+
+        # Past the stale window the request waits for a fresh value
+        now[0] = 50.0
+        assert await cache.get("key", source.fetch) == 3
+
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_entries_are_dropped():
+    async def scenario():
+        cache = CoalescingCache("test", ttl=60, stale_ttl=0, max_entries=2)
+
+        async def fetch_value(value):
+            return value
+
+        for key in ("a", "b", "a", "c"):
+            await cache.get(key, lambda: fetch_value(key))
+        assert list(cache._entries) == ["a", "c"]
+
+    asyncio.run(scenario())
+
+
+def test_collapsed_reads_are_counted_for_the_hottest_keys(monkeypatch):
+    collapsed = TopCounter("test_collapsed_reads", "test", ("cache", "key"), capacity=2)
+    monkeypatch.setattr(singleflight, "collapsed_reads", collapsed)
+    monkeypatch.delitem(REGISTRY._metrics, collapsed.name)
+
+    async def scenario():
+        cache, source = CoalescingCache("test", ttl=60, stale_ttl=0, max_entries=10), _Source()
+        readers = [asyncio.ensure_future(cache.get(key, source.fetch))
+                   for key, readers in (("a", 5), ("b", 3), ("c", 2)) for _ in range(readers)]
+        await _settle()
+        source.release.set()
+        await asyncio.gather(*readers)
+
+    asyncio.run(scenario())
+    # c replaced b, the smallest of the two kept keys, and took over its count
+    assert collapsed.get(cache="test", key="a") == 4
+    assert collapsed.get(cache="test", key="b") == 0
+    assert collapsed.get(cache="test", key="c") == 3
+    assert len(list(collapsed.samples())) == 2
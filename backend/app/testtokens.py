@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend.app import crud, main, ratelimit, revocation, utils
+from backend.app.database import Base, get_db
+from backend.app.models import RevokedToken, User
+from backend.app.revocation import RevocationStore, family_key
+from backend.app.schemas import UserReviewCreate
+from backend.app.singleflight import home_reads
+
+
+@pytest.fixture()
+def Session():
+    """
+    :return: A session factory of an in-memory SQLite database holding one user.
+    """
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    session.add(User(id=1, username="buyer", email="buyer@test.com", hashed_password=utils.hash_password("secret")))
+    session.commit()
+    session.close()
+    yield Session
+    engine.dispose()
+
+
+@pytest.fixture()
+def client(Session, monkeypatch):
+    """
+    :return: A test client of the app on the database, with a revocation store of its own and no rate limits.
+    """
+    store = RevocationStore(capacity=1000)
+    monkeypatch.setattr(main, "revocations", store)
+    monkeypatch.setattr(utils, "revocations", store)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", False)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def _login(client) -> dict:
+    response = client.post("/login/", data={"username": "buyer@test.com", "password": "secret"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def _me(client, access_token: str) -> int:
+    return client.get("/me", headers={"Authorization": f"Bearer {access_token}"}).status_code
+
+
+def _refresh(client, refresh_token: str):
+    return client.post("/token/refresh", json={"refresh_token": refresh_token})
+
+
+def test_refresh_rotates_tokens(client):
+    tokens = _login(client)
+    rotated = _refresh(client, tokens["refresh_token"])
+    assert rotated.status_code == 200
+    rotated = rotated.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert _me(client, rotated["access_token"]) == 200
+    assert _refresh(client, rotated["refresh_token"]).status_code == 200
+
+
+def test_reusing_a_rotated_refresh_token_revokes_its_family(client):
+    tokens = _login(client)
+    rotated = _refresh(client, tokens["refresh_token"]).json()
+    other_session = _login(client)
+
+    # The first refresh token was rotated already: presenting it again means it leaked
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+    assert _refresh(client, rotated["refresh_token"]).status_code == 401
+    assert _me(client, rotated["access_token"]) == 401
+    assert _me(client, tokens["access_token"]) == 401
+    # Other login sessions of the user are left alone
+    assert _me(client, other_session["access_token"]) == 200
+    assert _refresh(client, other_session["refresh_token"]).status_code == 200
+
+
+def test_refresh_tokens_are_not_access_tokens(client):
+    tokens = _login(client)
+    assert _me(client, tokens["refresh_token"]) == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+
+
+def test_logout_revokes_the_session(client):
+    tokens = _login(client)
+    assert client.post("/token/revoke", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+    assert _me(client, tokens["access_token"]) == 401
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+
+
+def test_revocation_reaches_every_worker(Session, monkeypatch):
+    monkeypatch.setattr(revocation, "REVOCATION_SYNC_SECONDS", 0)
+    workers = [RevocationStore(capacity=1000) for _ in range(3)]
+    db = Session()
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    # Every worker has loaded its filters before the revocation
+    assert not any(worker.is_revoked(db, family_key("session")) for worker in workers)
+
+    assert workers[0].revoke(db, family_key("session"), expires_at)
+    assert all(worker.is_revoked(db, family_key("session")) for worker in workers)
+    assert not workers[0].revoke(db, family_key("session"), expires_at)
+    db.close()
+
+
+def test_late_committed_revocation_reaches_every_worker(Session, monkeypatch):
+    monkeypatch.setattr(revocation, "REVOCATION_SYNC_SECONDS", 0)
+    worker = RevocationStore(capacity=1000)
+    db = Session()
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    worker.revoke(db, "first", expires_at)
+    assert worker.is_revoked(db, "first")
+
+    # Stamped before the row the worker already synced, but committed after it
+    db.add(RevokedToken(token_id="late", expires_at=expires_at, created_at=datetime.utcnow() - timedelta(seconds=10)))
+    db.commit()
+    assert worker.is_revoked(db, "late")
+    db.close()
+
+
+def test_home_page_shows_a_user_summary_that_follows_feedback(client, Session):
+    home_reads.invalidate()
+    headers = {"Authorization": f"Bearer {_login(client)['access_token']}"}
+    user = client.get("/store/home", headers=headers).json()["user"]
+    assert user == {"id": 1, "username": "buyer", "email": "buyer@test.com", "is_admin": False,
+                    "reputation": {"count": 0, "mean": None, "recent_mean": None}}
+
+    db = Session()
+    crud.create_user_review(db, UserReviewCreate(reviewed_user_id=1, reviewer_id=2, rating=4, content="Fast"))
+    db.close()
+    assert client.get("/store/home", headers=headers).json()["user"]["reputation"]["count"] == 1
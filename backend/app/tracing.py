@@ -0,0 +1,489 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# "" disables tracing entirely, "console" logs finished spans, "file" writes OTLP/JSON lines to TRACE_FILE
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "./traces.jsonl")
+# Head-based sampling: the decision is taken once per trace, at the root span
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "cardshop-api")
+MAX_STATEMENT_LENGTH = 500
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A single timed operation within a trace.
+
+    Attributes:
+        name (str): Human readable name of the operation, e.g. "db.statement".
+        trace_id (str): 32 hex digit identifier shared by every span of the trace.
+        span_id (str): 16 hex digit identifier of this span.
+        parent_id (Optional[str]): span_id of the parent span, None for a local root.
+        sampled (bool): Whether the span is recorded and exported.
+        attributes (dict): Key/value pairs describing the operation.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes",
+                 "start_ns", "end_ns", "status", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, attributes: dict = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _random_id(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "OK"
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        """
+        :param key: Attribute name.
+        :param value: Attribute value; must be JSON serializable.
+        :return: None
+        """
+        if self.sampled:
+            self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        """
+        :param exc: The exception raised while the span was active.
+        :return: None
+        """
+        if self.sampled:
+            self.status = "ERROR"
+            self.attributes["exception.type"] = type(exc).__name__
+            self.attributes["exception.message"] = str(exc)
+
+    def end(self):
+        """
+        Marks the span as finished and hands it to the exporter if it is sampled.
+
+        :return: None
+        """
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                _processor.on_end(self)
+
+    def traceparent(self) -> str:
+        """
+        :return: The W3C trace-context header value identifying this span.
+        """
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+        _current_span.reset(self._token)
+        return False
+
+
+class _NonRecordingSpan:
+    """
+    Stand-in returned for unsampled traces, so instrumented code costs a single context lookup.
+    """
+    sampled = False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+
+# --------------------- Exporters --------------------- #
+
+class SpanExporter:
+    """
+    Base class for span exporters. Subclasses receive finished, sampled spans in batches.
+    """
+
+    def export(self, spans: list):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class ConsoleSpanExporter(SpanExporter):
+    """
+    Writes one log line per finished span; handy while developing locally.
+    """
+
+    def export(self, spans: list):
+        for span in spans:
+            duration_ms = (span.end_ns - span.start_ns) / 1e6
+            logger.info("span %s trace=%s span=%s parent=%s %.2fms %s",
+                        span.name, span.trace_id, span.span_id, span.parent_id, duration_ms, span.attributes)
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends each batch as one OTLP/JSON ``ExportTraceServiceRequest`` line, the same format the
+    OpenTelemetry collector's file exporter writes, so the output can be replayed into any OTLP backend.
+
+    :param path: File the batches are appended to.
+    """
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: list):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "backend.app.tracing"},
+                    "spans": [_otlp_span(span) for span in spans],
+                }],
+            }]
+        }
+        line = json.dumps(payload, default=str)
+        with self._lock, open(self.path, "a") as trace_file:
+            trace_file.write(line + "\n")
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(span: Span) -> dict:
+    return {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "parentSpanId": span.parent_id or "",
+        "name": span.name,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+        # OTLP status codes: 1 = OK, 2 = ERROR
+        "status": {"code": 2 if span.status == "ERROR" else 1},
+    }
+
+
+class _BatchSpanProcessor:
+    """
+    Buffers finished spans and exports them from a daemon thread, keeping exporter I/O off the request path.
+    Spans are dropped, not queued without bound, when the exporter falls behind.
+    """
+
+    def __init__(self, max_queue_size: int = 2048, flush_interval: float = 2.0):
+        self.exporter: Optional[SpanExporter] = None
+        self._queue = deque(maxlen=max_queue_size)
+        self._flush_interval = flush_interval
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def set_exporter(self, exporter: Optional[SpanExporter]):
+        self.flush()
+        if self.exporter is not None:
+            self.exporter.shutdown()
+        self.exporter = exporter
+        if exporter is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def on_end(self, span: Span):
+        self._queue.append(span)
+
+    def flush(self):
+        batch = []
+        while self._queue:
+            batch.append(self._queue.popleft())
+        if batch and self.exporter is not None:
+            try:
+                self.exporter.export(batch)
+            except Exception:
+                logger.exception("Failed to export %d spans", len(batch))
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_processor = _BatchSpanProcessor()
+
+
+def set_exporter(exporter: Optional[SpanExporter], sample_rate: Optional[float] = None):
+    """
+    Installs the exporter that receives sampled spans. Passing None disables tracing.
+
+    :param exporter: A SpanExporter instance, or None.
+    :param sample_rate: Optional new head-sampling probability between 0 and 1.
+    :return: None
+    """
+    global TRACE_SAMPLE_RATE
+    if sample_rate is not None:
+        TRACE_SAMPLE_RATE = sample_rate
+    _processor.set_exporter(exporter)
+
+
+def is_enabled() -> bool:
+    """
+    :return: True if an exporter is installed.
+    """
+    return _processor.exporter is not None
+
+
+def flush():
+    """
+    Exports all buffered spans synchronously; used on shutdown and in tests.
+
+    :return: None
+    """
+    _processor.flush()
+
+
+def _exporter_from_env() -> Optional[SpanExporter]:
+    if TRACE_EXPORTER == "file":
+        return FileSpanExporter(TRACE_FILE)
+    if TRACE_EXPORTER == "console":
+        return ConsoleSpanExporter()
+    return None
+
+
+# --------------------- Span creation and propagation --------------------- #
+
+def _random_id(num_bytes: int) -> str:
+    return random.getrandbits(num_bytes * 8).to_bytes(num_bytes, "big").hex()
+
+
+def parse_traceparent(header: Optional[str]):
+    """
+    :param header: Value of an incoming ``traceparent`` header, if any.
+    :return: A (trace_id, parent_span_id, sampled) tuple, or None if the header is missing or malformed.
+    """
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, parent_id, flags = parts[:4]
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, attributes: dict = None) -> Span:
+    """
+    Starts the local root span of a request. An upstream sampling decision carried by ``traceparent``
+    is honoured; otherwise the head sampler decides.
+
+    :param name: Name of the root span.
+    :param traceparent: Incoming W3C trace-context header.
+    :param attributes: Initial span attributes.
+    :return: The root span; use it as a context manager.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = _random_id(16), None, random.random() < TRACE_SAMPLE_RATE
+    return Span(name, trace_id, parent_id, sampled and is_enabled(), attributes)
+
+
+def current_span():
+    """
+    :return: The active span, or None outside of a trace.
+    """
+    return _current_span.get()
+
+
+def start_span(name: str, attributes: dict = None):
+    """
+    Starts a child of the active span. Outside of a sampled trace this returns a shared no-op span.
+
+    :param name: Name of the operation.
+    :param attributes: Initial span attributes.
+    :return: A span to be used as a context manager.
+    """
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return NON_RECORDING_SPAN
+    return Span(name, parent.trace_id, parent.span_id, True, attributes)
+
+
+def traced(name: str):
+    """
+    Decorator wrapping every call of a sync or async function in a span. The wrapped function keeps
+    its signature, so it can still be used as a FastAPI dependency.
+
+    :param name: Name of the span.
+    :return: The decorator.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a root span per HTTP request, continues traces from an incoming
+    ``traceparent`` header and returns the request's own ``traceparent`` in the response.
+
+    :param app: The wrapped ASGI application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(b"traceparent")
+        span = start_trace(
+            f"{scope['method']} {scope['path']}",
+            traceparent=incoming.decode("latin-1") if incoming else None,
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.status = "ERROR"
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"traceparent", span.traceparent().encode())]
+            await send(message)
+
+        with span:
+            await self.app(scope, receive, send_with_trace)
+            route = scope.get("route")
+            if route is not None and span.sampled:
+                # Name the span after the route template so traces of /cards/1 and /cards/2 group together
+                span.name = f"{scope['method']} {route.path}"
+                span.set_attribute("http.route", route.path)
+
+
+# --------------------- SQLAlchemy instrumentation --------------------- #
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = start_span("db.statement", {"db.statement": statement[:MAX_STATEMENT_LENGTH]})
+    if span.sampled:
+        span._token = _current_span.set(span)
+        context._trace_span = span
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    span = getattr(context, "_trace_span", None)
+    if span is not None:
+        span.set_attribute("db.rowcount", cursor.rowcount)
+        span.end()
+        _current_span.reset(span._token)
+        context._trace_span = None
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    span = getattr(context, "_trace_span", None) if context is not None else None
+    if span is not None:
+        span.record_exception(exception_context.original_exception)
+        span.end()
+        _current_span.reset(span._token)
+        context._trace_span = None
+
+
+def _before_commit(session):
+    span = start_span("db.commit")
+    if span.sampled:
+        span._token = _current_span.set(span)
+        session.info["_trace_commit_span"] = span
+
+
+def _end_commit(session):
+    span = session.info.pop("_trace_commit_span", None)
+    if span is not None:
+        span.end()
+        _current_span.reset(span._token)
+
+
+_instrumented = False
+
+
+def instrument_sqlalchemy():
+    """
+    Registers engine and session listeners so every SQL statement and every commit (including the
+    flush it triggers) becomes a span of the active trace. Safe to call more than once.
+
+    :return: None
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_commit", _end_commit)
+    event.listen(Session, "after_rollback", _end_commit)
+    _instrumented = True
+
+
+set_exporter(_exporter_from_env())
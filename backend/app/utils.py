@@ -1,32 +1,47 @@
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
-from jose import jwt, JWTError
 from dotenv import load_dotenv
 import os
+import uuid
 from sqlalchemy.orm import Session
 from backend.app import crud
 from backend.app.database import get_db
 from backend.app.schemas import UserRead
+from backend.app.tracing import traced
+from backend.app.revocation import revocations, family_key
 
 load_dotenv()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_pwd_context = None
 
+def get_pwd_context():
+    """
+    passlib and bcrypt are imported on the first password hash or check, not when a worker boots.
+
+    :return: The CryptContext used for password hashes.
+    """
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+@traced("auth.hash_password")
 def hash_password(password: str) -> str:
     """
     :param password: The plaintext password to be hashed.
     :return: The hashed version of the input password.
     """
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
+@traced("auth.verify_password")
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     :param plain_password: The plaintext password entered by the user.
     :param hashed_password: The hashed password stored in the database.
     :return: True if the plaintext password matches the hashed password, False otherwise.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 SECRET_KEY = os.getenv("SECRET_KEY","superdupersecret")
 ALGORITHM = "HS256"
@@ -39,32 +54,50 @@ if not SECRET_KEY:
 
 def create_access_token(data: dict):
     """
-    :param data: Dictionary containing the data to encode into the JWT.
-    :return: Encoded JSON Web Token as a string.
+    :param data: Dictionary containing the data to encode into the JWT, with the token family as "fam".
+    :return: Encoded JSON Web Token as a string, typed "access" so it cannot be used as a refresh token.
     """
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access"})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def create_refresh_token(data: dict):
     """
-    :param data: Dictionary containing the payload data to be encoded in the JWT.
-    :return: A JWT (JSON Web Token) as a string, which includes the encoded data and expiration.
+    :param data: Dictionary containing the payload data to be encoded in the JWT, with the token family as "fam".
+    :return: A JWT (JSON Web Token) as a string, which includes the encoded data, expiration and a unique id (jti).
     """
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex, "type": "refresh"})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+@traced("auth.create_token_pair")
+def create_token_pair(email: str, family: str = None) -> dict:
+    """
+    :param email: The email of the user the tokens are issued to.
+    :param family: The token family (login session) the tokens continue; a new one is started when omitted.
+    :return: A dictionary containing the access token, refresh token, and token type.
+    """
+    family = family or uuid.uuid4().hex
+    return {
+        "access_token": create_access_token(data={"sub": email, "fam": family}),
+        "refresh_token": create_refresh_token(data={"sub": email, "fam": family}),
+        "token_type": "bearer",
+    }
+
+@traced("auth.verify_token")
 def verify_token(token: str, exception):
     """
     :param token: The JSON Web Token (JWT) string to be verified and decoded.
     :param exception: The exception to raise if token verification fails.
     :return: The payload extracted from the verified token.
     """
+    from jose import jwt, JWTError
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -72,6 +105,9 @@ def verify_token(token: str, exception):
         raise exception
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# For routes that also serve anonymous requests: the token is None when no Authorization header was sent
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+@traced("auth.get_current_user")
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """
     :param token: The JWT passed as a Bearer token in the Authorization header.
@@ -84,6 +120,9 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         headers={"WWW-Authenticate": "Bearer"},
     )
     payload = verify_token(token,unauthorized_exception)
+    # Refresh tokens live for days and are single-use: they never authenticate a request
+    if payload.get("type") != "access":
+        raise unauthorized_exception
 
     user_email = payload.get("sub")
     if user_email is None:
@@ -93,12 +132,18 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Access tokens of a login session whose refresh token was revoked, or reused, stop working too
+    family = payload.get("fam")
+    if family and revocations.is_revoked(db, family_key(family)):
+        raise unauthorized_exception
+
     user = crud.get_user_by_email(db, email=user_email)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
     return user
 
+@traced("auth.check_if_admin")
 def check_if_admin(current_user: UserRead):
     """
     :param current_user: The current user object to check
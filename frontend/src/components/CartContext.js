@@ -1,4 +1,6 @@
-import React, { createContext, useContext, useEffect, useState } from 'react';
+import React, { createContext, useCallback, useContext, useEffect, useState } from 'react';
+import axios from 'axios';
+import { useAuthContext } from './auth/AuthProvider';
 
 /**
  * Represents the context for managing a shopping cart within an application.
@@ -65,12 +67,52 @@ export const CartProvider = ({ children }) => {
         setCartItems((prevItems) => prevItems.filter(item => item.id !== itemId));
     };
 
+    /**
+     * Applies the current name, price, image and stock of the cards to the cart items,
+     * and drops the items whose card no longer exists.
+     */
+    const applyCards = useCallback((batch) => {
+        const current = new Map(batch.items.map(card => [card.id, card]));
+        setCartItems((prevItems) => prevItems
+            .filter(item => current.has(item.id))
+            .map(item => {
+                const card = current.get(item.id);
+                return { ...item, name: card.name, price: card.price, image_url: card.image_url, stock: card.quantity };
+            }));
+    }, []);
+
+    // The home page request already returned the current state of the stored cart
+    const { home } = useAuthContext();
+    useEffect(() => {
+        if (home && home.cart) {
+            applyCards(home.cart);
+        }
+    }, [home, applyCards]);
+
+    /**
+     * Refreshes every cart item with one batch request.
+     */
+    const cartIds = cartItems.map(item => item.id).join(',');
+    const revalidateCart = useCallback(async () => {
+        if (cartIds === '') {
+            return;
+        }
+        try {
+            const response = await axios.get('http://localhost:8000/store/cards/batch', {
+                params: { ids: cartIds },
+            });
+            applyCards(response.data);
+        } catch (error) {
+            console.error('Failed to revalidate the cart:', error);
+        }
+    }, [cartIds, applyCards]);
+
     const calculateTotal = () => {
         return cartItems.reduce((total, item) => total + (item.price * item.quantity), 0).toFixed(2);
     };
 
     return (
-        <CartContext.Provider value={{ cartItems, addToCart, removeFromCart, calculateTotal }}>
+        <CartContext.Provider value={{ cartItems, addToCart, removeFromCart, revalidateCart, calculateTotal }}>
             {children}
         </CartContext.Provider>
     );
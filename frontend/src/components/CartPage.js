@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useEffect } from 'react';
 import { useCartContext } from './CartContext';
 import styles from '../styles/CartPage.module.css';
 
@@ -18,7 +18,12 @@ import styles from '../styles/CartPage.module.css';
  * @returns {JSX.Element} The rendered cart page component.
  */
 const CartPage = () => {
-    const { cartItems, removeFromCart, calculateTotal } = useCartContext();  // Access cart context
+    const { cartItems, removeFromCart, revalidateCart, calculateTotal } = useCartContext();  // Access cart context
+
+    // Show current prices and stock instead of the ones stored when the items were added
+    useEffect(() => {
+        revalidateCart();
+    }, [revalidateCart]);
 
     return (
         <div className={styles.cartPage}>
@@ -36,6 +41,9 @@ const CartPage = () => {
                                     <h2>{item.name}</h2>
                                     <p>Price per item: ${item.price}</p>
                                     <p>Quantity: {item.quantity} item(s)</p>
+                                    {item.stock !== undefined && item.stock < item.quantity && (
+                                        <p>Only {item.stock} left in stock</p>
+                                    )}
                                     <p>Total for this item:
                                         ${(item.price * item.quantity).toFixed(2)}</p>  {/* Total for this item */}
                                     <button onClick={() => removeFromCart(item.id)}>
@@ -2,6 +2,7 @@ import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { Link } from "react-router-dom";
 import styles from '../styles/HomePage.module.css';
+import { useAuthContext } from './auth/AuthProvider';
 
 /**
  * Represents the HomePage component.
@@ -16,7 +17,8 @@ import styles from '../styles/HomePage.module.css';
  * - `error`: A string containing any error messages related to fetching products.
  *
  * API Call:
- * - Fetches products from the endpoint 'http://localhost:8000/store/cards'.
+ * - Uses the featured cards AuthProvider loaded from 'http://localhost:8000/store/home',
+ *   and only fetches them from that endpoint itself if that request failed.
  *
  * Sections:
  * - Hero: A welcome message with a call-to-action button.
@@ -26,20 +28,24 @@ import styles from '../styles/HomePage.module.css';
  * - Footer: Contains links to various pages, social media links, and a newsletter subscription input.
  *
  * Usage of useEffect Hook:
- * - Fetches product data from the API when the component mounts.
+ * - Fetches product data from the API when the component mounts, unless it was already loaded.
  *
  * Returns appropriate JSX based on loading and error state.
  */
 const HomePage = () => {
-    const [products, setProducts] = useState([]);
-    const [loading, setLoading] = useState(true);
+    const { home } = useAuthContext();
+    const [products, setProducts] = useState(home ? home.featured : []);
+    const [loading, setLoading] = useState(!home);
     const [error, setError] = useState(null);
 
     useEffect(() => {
+        if (home) {
+            return;
+        }
         const fetchProducts = async () => {
             try {
-                const response = await axios.get('http://localhost:8000/store/cards');  // API endpoint to get featured products
-                setProducts(response.data);
+                const response = await axios.get('http://localhost:8000/store/home');  // API endpoint to get featured products
+                setProducts(response.data.featured);
                 setLoading(false);
             } catch (err) {
                 setError("Failed to load products.");
@@ -48,7 +54,7 @@ const HomePage = () => {
         };
 
         fetchProducts();
-    }, []);
+    }, [home]);
 
     if (loading) {
         return <div>Loading featured products...</div>;
@@ -71,7 +77,7 @@ const HomePage = () => {
             <section className={styles.featuredProducts}>
                 <h2>Featured Products</h2>
                 <div className={styles.productsGrid}>
-                    {products.slice(0, 3).map((product) => (
+                    {products.map((product) => (
                         <div key={product.id} className={styles.product}>
                             <img src={`http://localhost:8000${product.image_url}`} alt={product.name} />
                             <h3>{product.name}</h3>
@@ -17,6 +17,7 @@ import styles from '../styles/Store.module.css';
  *
  * Effects:
  * - useEffect: Fetches products from the API when the component mounts.
+ * - useEffect: Applies live price, stock and delete events from the /store/stream event stream.
  *
  * Returns:
  * - A loading message if the data is still being fetched.
@@ -44,6 +45,25 @@ const Store = () => {
         fetchProducts();
     }, []);
 
+    useEffect(() => {
+        const source = new EventSource('http://localhost:8000/store/stream');
+        source.addEventListener('card.updated', (event) => {
+            const card = JSON.parse(event.data);
+            setProducts((prevProducts) => prevProducts.map((product) =>
+                product.id === card.id ? { ...product, price: card.price, quantity: card.quantity } : product
+            ));
+        });
+        source.addEventListener('card.deleted', (event) => {
+            const card = JSON.parse(event.data);
+            setProducts((prevProducts) => prevProducts.filter((product) => product.id !== card.id));
+        });
+        source.addEventListener('resync', async () => {
+            const response = await axios.get('http://localhost:8000/store/cards');
+            setProducts(response.data);
+        });
+        return () => source.close();
+    }, []);
+
     if (loading) {
         return <div>Loading products...</div>;
     }
@@ -39,8 +39,11 @@ export const useAuthContext = () => useContext(AuthContext);
 // AuthProvider to wrap your app and provide the user state
 /**
  * AuthProvider component is a context provider that handles user authentication.
- * It fetches the user data from the backend and manages the loading and error
- * states. If the user is not authenticated, it redirects to the login page.
+ * It loads the home page data from the backend in one request: the featured cards,
+ * the user if a token is stored, and the current prices of the cart items. The user
+ * is kept in the context, and the rest is shared as `home` so the home page and the
+ * cart can render without further round trips. A stored token the backend does not
+ * accept any more is removed.
  *
  * @param {Object} props - The properties passed to the AuthProvider component.
  * @param {ReactNode} props.children - The child components that need access to the authenticated user data.
@@ -49,30 +52,31 @@ export const useAuthContext = () => useContext(AuthContext);
  */
 export const AuthProvider = ({ children }) => {
     const [user, setUser] = useState(null);
+    const [home, setHome] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const navigate = useNavigate();
 
-    // Fetch the user data from the backend
-    const fetchUser = async () => {
+    // Fetch the user data, along with the rest of the home page, from the backend
+    const fetchHome = async () => {
         try {
             const token = localStorage.getItem('token');
+            const storedCartItems = JSON.parse(localStorage.getItem('cartItems') || '[]');
+            const cart = storedCartItems.map(item => item.id).join(',');
 
-            if (!token) {
-                throw new Error('No token found');
-            }
-
-            const response = await axios.get('http://localhost:8000/me', {
-                headers: {
-                    Authorization: `Bearer ${token}`,
-                },
+            const response = await axios.get('http://localhost:8000/store/home', {
+                params: cart ? { cart } : {},
+                headers: token ? { Authorization: `Bearer ${token}` } : {},
             });
 
-            setUser(response.data);
+            if (token && !response.data.user) {
+                localStorage.removeItem('token');
+            }
+            setUser(response.data.user);
+            setHome(response.data);
             setLoading(false);
         } catch (err) {
             console.error(err);
-            localStorage.removeItem('token');
             setLoading(false);
 
         }
@@ -80,7 +84,7 @@ export const AuthProvider = ({ children }) => {
 
 
     useEffect(() => {
-        fetchUser();
+        fetchHome();
     }, []);
 
 
@@ -89,7 +93,7 @@ export const AuthProvider = ({ children }) => {
     }
 
     return (
-        <AuthContext.Provider value={{ user, setUser }}>
+        <AuthContext.Provider value={{ user, setUser, home }}>
             {children}
         </AuthContext.Provider>
     );
@@ -34,6 +34,8 @@ export const useAuth = () => {
 
 
             localStorage.setItem("access_token", newAccessToken);
+            // Refresh tokens are single use: the next refresh must present the rotated one
+            localStorage.setItem("refresh_token", response.data.refresh_token);
             setToken(newAccessToken);
 
             return newAccessToken;
@@ -47,6 +49,11 @@ export const useAuth = () => {
 
 
     const handleLogout = () => {
+        const refreshToken = localStorage.getItem("refresh_token");
+        if (refreshToken) {
+            // Ends the session server side too; the tokens are dropped locally whatever the outcome
+            axios.post("http://localhost:8000/token/revoke", { refresh_token: refreshToken }).catch(() => {});
+        }
         setToken(null);
         localStorage.removeItem("access_token");
         localStorage.removeItem("refresh_token");